@@ -0,0 +1,186 @@
+import math
+from collections import defaultdict
+
+import numpy as np
+
+import scheduler
+
+
+def _rankdata(values):
+    # Average ranks (1-based) with ties sharing the mean rank.
+    order = np.argsort(values, kind="mergesort")
+    ranks = np.empty(len(values), dtype=np.float64)
+    ranks[order] = np.arange(1, len(values) + 1)
+    _, inverse, counts = np.unique(values, return_inverse=True, return_counts=True)
+    sums = np.bincount(inverse, weights=ranks)
+    return (sums / counts)[inverse], counts
+
+
+def mann_whitney(a, b):
+    # Two-sided Mann-Whitney U with tie correction and the normal
+    # approximation, which is accurate for the 20+ samples per cell used here.
+    a = np.asarray(a, dtype=np.float64)
+    b = np.asarray(b, dtype=np.float64)
+    n1, n2 = len(a), len(b)
+    if n1 == 0 or n2 == 0:
+        return float("nan"), float("nan")
+    ranks, ties = _rankdata(np.concatenate([a, b]))
+    u1 = ranks[:n1].sum() - n1 * (n1 + 1) / 2
+    n = n1 + n2
+    tie_term = (ties**3 - ties).sum() / (n * (n - 1))
+    sigma = math.sqrt(n1 * n2 / 12 * ((n + 1) - tie_term))
+    if sigma == 0:
+        return u1, 1.0
+    z = (abs(u1 - n1 * n2 / 2) - 0.5) / sigma
+    p = math.erfc(max(z, 0) / math.sqrt(2))
+    return u1, p
+
+
+def bootstrap_ci(baseline, variant, n_boot=2000, alpha=0.05, rng=None):
+    # Percentile bootstrap of median(variant) - median(baseline) and of
+    # median(variant) / median(baseline), resampling both groups.
+    rng = rng or np.random.default_rng()
+    baseline = np.asarray(baseline, dtype=np.float64)
+    variant = np.asarray(variant, dtype=np.float64)
+    b = np.median(rng.choice(baseline, (n_boot, len(baseline))), axis=1)
+    v = np.median(rng.choice(variant, (n_boot, len(variant))), axis=1)
+    q = [100 * alpha / 2, 100 * (1 - alpha / 2)]
+    diff_low, diff_high = np.percentile(v - b, q)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratio_low, ratio_high = np.percentile(v / b, q)
+    return diff_low, diff_high, ratio_low, ratio_high
+
+
+def compare(baseline, variant, n_boot=2000, alpha=0.05, rng=None):
+    diff_low, diff_high, ratio_low, ratio_high = bootstrap_ci(
+        baseline, variant, n_boot, alpha, rng
+    )
+    u, p = mann_whitney(baseline, variant)
+    baseline_median = float(np.median(baseline))
+    variant_median = float(np.median(variant))
+    return {
+        "n_baseline": len(baseline),
+        "n_variant": len(variant),
+        "median_baseline": baseline_median,
+        "median_variant": variant_median,
+        "diff_median": variant_median - baseline_median,
+        "diff_ci_low": float(diff_low),
+        "diff_ci_high": float(diff_high),
+        "ratio_ci_low": float(ratio_low),
+        "ratio_ci_high": float(ratio_high),
+        "mann_whitney_u": float(u),
+        "mann_whitney_p": float(p),
+    }
+
+
+def _took(samples):
+    return [sample["took"] for sample in samples if sample["error"] is None]
+
+
+def run(
+    cells,
+    index_name,
+    baseline_variant="asis",
+    batch=10,
+    min_iterations=20,
+    max_iterations=200,
+    precision=0.05,
+    min_precision_ms=1.0,
+    warmup=3,
+    concurrency=1,
+    cache_bust="none",
+    seed=None,
+    think_time=0,
+):
+    # Cells are grouped by (keyword, cluster) and each group's variants are
+    # compared against its baseline variant. Every round adds `batch`
+    # interleaved requests to each open cell. A variant closes once the
+    # bootstrap CI of its median difference is narrower than `precision` x
+    # the baseline median (or `min_precision_ms`), or at `max_iterations`.
+    # The baseline stays open while any variant in its group is.
+    rng = np.random.default_rng(seed)
+    groups = defaultdict(dict)
+    for cell in cells:
+        keyword, cluster, variant = cell["key"]
+        groups[keyword, cluster][variant] = cell
+    samples = {cell["key"]: [] for cell in cells}
+    open_keys = set(samples)
+    comparisons = {}
+    round_number = 0
+
+    while open_keys:
+        round_cells = [
+            {**cell, "iterations": batch}
+            for cell in cells
+            if cell["key"] in open_keys
+        ]
+        measured = scheduler.run(
+            round_cells,
+            index_name,
+            warmup=warmup if round_number == 0 else 0,
+            concurrency=concurrency,
+            cache_bust=cache_bust,
+            seed=None if seed is None else seed + round_number,
+            think_time=think_time,
+        )
+        for key, cell_samples in measured.items():
+            samples[key].extend(cell_samples)
+        round_number += 1
+
+        for (keyword, cluster), variants in groups.items():
+            baseline_key = (keyword, cluster, baseline_variant)
+            baseline = _took(samples.get(baseline_key, []))
+            for variant, cell in variants.items():
+                key = cell["key"]
+                if key not in open_keys or key == baseline_key:
+                    continue
+                n = len(samples[key])
+                took = _took(samples[key])
+                if n >= min_iterations and not (baseline and took):
+                    # Nothing to compare; behave like a fixed-iteration run.
+                    open_keys.discard(key)
+                elif n >= min_iterations:
+                    result = compare(baseline, took, rng=rng)
+                    width = result["diff_ci_high"] - result["diff_ci_low"]
+                    target = precision * result["median_baseline"]
+                    result["converged"] = bool(width <= max(target, min_precision_ms))
+                    comparisons[key] = result
+                    if result["converged"]:
+                        open_keys.discard(key)
+                if n >= max_iterations:
+                    open_keys.discard(key)
+            variants_open = any(
+                (keyword, cluster, variant) in open_keys
+                for variant in variants
+                if variant != baseline_variant
+            )
+            if baseline_key in open_keys and not variants_open:
+                if len(samples[baseline_key]) >= min_iterations:
+                    open_keys.discard(baseline_key)
+    return samples, comparisons
+
+
+def pending(cells, done, adaptive=False):
+    # Adaptive cells are only meaningful next to their baseline, so a
+    # (keyword, cluster) group is re-run as a whole unless all of it is done.
+    if not adaptive:
+        return [cell for cell in cells if cell["key"] not in done]
+    open_groups = {cell["key"][:2] for cell in cells if cell["key"] not in done}
+    return [cell for cell in cells if cell["key"][:2] in open_groups]
+
+
+def add_arguments(parser):
+    parser.add_argument(
+        "--adaptive",
+        action="store_true",
+        help="sample each cell until its difference to the baseline is resolved",
+    )
+    parser.add_argument("--min-iterations", type=int, default=20)
+    parser.add_argument("--max-iterations", type=int, default=200)
+    parser.add_argument("--batch", type=int, default=10)
+    parser.add_argument(
+        "--precision",
+        type=float,
+        default=0.05,
+        help="target CI width as a fraction of the baseline median",
+    )
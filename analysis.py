@@ -0,0 +1,338 @@
+import argparse
+import html
+
+import numpy as np
+import pandas as pd
+
+import dsls
+import loadgen
+import workload_cache
+import workloads
+from prediction import MIN_TOOK_MS
+from result_store import CELL_KEY, ResultStore
+
+QUANTILES = [0.5, 0.9, 0.99]
+SAMPLE_COLUMNS = [*CELL_KEY, "took", "wall_ms"]
+# Bootstrap resamples are drawn in chunks of at most this many
+# (resample, keyword) weights, so memory stays flat for any keyword count.
+BOOTSTRAP_CHUNK = 2_000_000
+
+
+def load_samples(store, metric="took"):
+    # Raw per-iteration samples as columns, with the cell key categorical so
+    # every groupby below runs on integer codes.
+    df = store.samples(columns=SAMPLE_COLUMNS)
+    df = df[[*CELL_KEY, metric]].dropna(subset=[metric])
+    for column in CELL_KEY:
+        df[column] = df[column].astype("category")
+    df[metric] = df[metric].astype(np.float64)
+    return df
+
+
+def distributions(samples, metric="took"):
+    grouped = samples.groupby(["cluster", "variant"], observed=True)[metric]
+    table = grouped.quantile(QUANTILES).unstack()
+    table.columns = [f"p{int(q * 100)}" for q in QUANTILES]
+    table.insert(0, "mean", grouped.mean())
+    table.insert(0, "samples", grouped.size())
+    keywords = samples.groupby(["cluster", "variant"], observed=True)["keyword"]
+    table.insert(0, "keywords", keywords.nunique())
+    return table.reset_index()
+
+
+def log_ratios(samples, metric="took", baseline="asis"):
+    # log(variant median / baseline median) per (cluster, keyword), one
+    # column per variant. Keywords missing either side are NaN.
+    medians = (
+        samples.groupby(["cluster", "keyword", "variant"], observed=True)[metric]
+        .median()
+        .unstack("variant")
+    )
+    if baseline not in medians:
+        raise ValueError(f"no samples for baseline variant {baseline}")
+    logs = np.log(np.maximum(medians.to_numpy(), MIN_TOOK_MS))
+    ratios = logs - logs[:, [list(medians.columns).index(baseline)]]
+    ratios = pd.DataFrame(ratios, index=medians.index, columns=medians.columns)
+    return ratios.drop(columns=baseline)
+
+
+def bootstrap_mean(values, n_boot=2000, alpha=0.05, seed=None):
+    # Percentile CI of the column means of `values` (keywords x variants,
+    # NaN for missing) by resampling keywords. Each resample is a row of
+    # multinomial counts, so every variant is resampled with the same
+    # keywords and a chunk of resamples is a single matrix product.
+    values = np.asarray(values, dtype=np.float64)
+    present = ~np.isnan(values)
+    filled = np.where(present, values, 0.0)
+    n = len(values)
+    rng = np.random.default_rng(seed)
+    chunk = max(1, BOOTSTRAP_CHUNK // max(n, 1))
+    means = []
+    for start in range(0, n_boot, chunk):
+        counts = rng.multinomial(n, np.full(n, 1 / n), size=min(chunk, n_boot - start))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            means.append((counts @ filled) / (counts @ present))
+    means = np.concatenate(means)
+    bounds = [100 * alpha / 2, 100 * (1 - alpha / 2)]
+    low, high = np.nanpercentile(means, bounds, axis=0)
+    return low, high
+
+
+def speedups(ratios, n_boot=2000, alpha=0.05, seed=None):
+    # Geometric-mean latency ratio (variant / baseline) over keywords with
+    # its bootstrap CI; below 1 means the variant is faster.
+    rows = []
+    for cluster, group in ratios.groupby(level="cluster", observed=True):
+        values = group.to_numpy()
+        low, high = bootstrap_mean(values, n_boot, alpha, seed)
+        with np.errstate(invalid="ignore"):
+            faster = (values < 0).sum(axis=0) / (~np.isnan(values)).sum(axis=0)
+        for i, variant in enumerate(group.columns):
+            rows.append(
+                {
+                    "cluster": cluster,
+                    "variant": variant,
+                    "keywords": int((~np.isnan(values[:, i])).sum()),
+                    "ratio": float(np.exp(np.nanmean(values[:, i]))),
+                    "ratio_low": float(np.exp(low[i])),
+                    "ratio_high": float(np.exp(high[i])),
+                    "faster_share": float(faster[i]),
+                }
+            )
+    return pd.DataFrame(rows)
+
+
+def prod_predictions(samples, metric="took", baseline="asis"):
+    # prod baseline x alpha variant / alpha baseline, the results.csv
+    # estimate, for every keyword and variant at once, next to the measured
+    # prod median where prod ran the variant.
+    medians = (
+        samples.groupby(["cluster", "variant", "keyword"], observed=True)[metric]
+        .median()
+        .unstack("keyword")
+    )
+    if not {"prod", "alpha"} <= set(medians.index.get_level_values("cluster")):
+        return pd.DataFrame()
+    alpha = medians.loc["alpha"]
+    prod = medians.loc["prod"].reindex(alpha.index)
+    if baseline not in alpha.index:
+        return pd.DataFrame()
+    alpha_baseline = alpha.loc[baseline].where(alpha.loc[baseline] > 0)
+    predicted = prod.loc[baseline] * alpha / alpha_baseline
+    error = (predicted - prod).abs() / prod
+    return pd.DataFrame(
+        {
+            "keywords": predicted.notna().sum(axis=1),
+            "predicted_p50": predicted.median(axis=1),
+            "alpha_p50": alpha.median(axis=1),
+            "prod_measured": prod.notna().sum(axis=1),
+            "prod_p50": prod.median(axis=1),
+            "median_ape": error.median(axis=1),
+        }
+    ).reset_index()
+
+
+def result_counts(es_host, index_name, keywords):
+    # Hits each keyword matches with the as-is query, from _count.
+    session = loadgen.get_session()
+    counts = {}
+    for keyword in keywords:
+        query = {"query": dsls.get_current_dsl(keyword)["query"]}
+        response = session.get(
+            f"{es_host}/{index_name}/_count",
+            headers=loadgen.HEADERS,
+            data=loadgen.to_body(query),
+        )
+        response.raise_for_status()
+        counts[keyword] = response.json()["count"]
+    return counts
+
+
+def keyword_features(keywords, category_weights=None, counts=None):
+    df = pd.DataFrame({"keyword": list(keywords)})
+    df["token_count"] = df["keyword"].str.split().str.len()
+    if category_weights is not None:
+        df["has_category_weights"] = df["keyword"].map(
+            lambda keyword: bool(category_weights.get(keyword))
+        )
+    if counts is not None:
+        df["result_count"] = df["keyword"].map(counts)
+    return df
+
+
+def feature_groups(features):
+    # Bucket every feature into a few labelled groups per keyword.
+    groups = pd.DataFrame({"keyword": features["keyword"]})
+    tokens = features["token_count"].clip(upper=3).astype(int).astype(str)
+    groups["tokens"] = tokens.replace({"3": "3+"})
+    if "has_category_weights" in features:
+        groups["category_weights"] = features["has_category_weights"].map(
+            {True: "yes", False: "no"}
+        )
+    if "result_count" in features and features["result_count"].notna().any():
+        groups["result_count"] = pd.qcut(
+            features["result_count"], 4, duplicates="drop"
+        ).astype(str)
+    return groups.set_index("keyword")
+
+
+def breakdowns(ratios, groups, n_boot=2000, alpha=0.05, seed=None):
+    keywords = ratios.index.get_level_values("keyword")
+    rows = []
+    for feature in groups.columns:
+        labels = groups[feature].reindex(keywords).to_numpy()
+        for label in pd.unique(labels[pd.notna(labels)]):
+            table = speedups(ratios[labels == label], n_boot, alpha, seed)
+            rows.append(table.assign(feature=feature, group=label))
+    if not rows:
+        return pd.DataFrame()
+    columns = ["feature", "group", "cluster", "variant"]
+    table = pd.concat(rows, ignore_index=True)
+    table = table[columns + [c for c in table.columns if c not in columns]]
+    return table.sort_values(columns).reset_index(drop=True)
+
+
+def _format(value):
+    if isinstance(value, float):
+        return "" if np.isnan(value) else f"{value:.3g}"
+    return str(value)
+
+
+def _markdown(df):
+    header = "| " + " | ".join(map(str, df.columns)) + " |"
+    rule = "|" + "|".join("---" for _ in df.columns) + "|"
+    rows = [
+        "| " + " | ".join(_format(v) for v in row) + " |"
+        for row in df.itertuples(index=False)
+    ]
+    return "\n".join([header, rule, *rows])
+
+
+def _html_table(df):
+    head = "".join(f"<th>{html.escape(str(c))}</th>" for c in df.columns)
+    body = "".join(
+        "<tr>" + "".join(f"<td>{html.escape(_format(v))}</td>" for v in row) + "</tr>"
+        for row in df.itertuples(index=False)
+    )
+    return f"<table><thead><tr>{head}</tr></thead><tbody>{body}</tbody></table>"
+
+
+STYLE = """
+body { font-family: sans-serif; margin: 2em; }
+table { border-collapse: collapse; margin-bottom: 2em; }
+th, td { border: 1px solid #ccc; padding: 2px 8px; text-align: right; }
+th { background: #f3f3f3; }
+"""
+
+
+def write_report(title, sections, path):
+    # `sections` is a list of (heading, note, DataFrame). Writes <path>.md
+    # and a single-file <path>.html with the same tables.
+    markdown = [f"# {title}"]
+    body = [f"<h1>{html.escape(title)}</h1>"]
+    for heading, note, table in sections:
+        markdown += [f"## {heading}", note, _markdown(table)]
+        body += [
+            f"<h2>{html.escape(heading)}</h2>",
+            f"<p>{html.escape(note)}</p>",
+            _html_table(table),
+        ]
+    with open(f"{path}.md", "w") as f:
+        f.write("\n\n".join(markdown) + "\n")
+    with open(f"{path}.html", "w") as f:
+        f.write(
+            "<!DOCTYPE html><html><head><meta charset='utf-8'>"
+            f"<title>{html.escape(title)}</title><style>{STYLE}</style></head>"
+            f"<body>{''.join(body)}</body></html>\n"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report over raw result samples")
+    parser.add_argument("--store", default="results_category_match")
+    parser.add_argument("--metric", choices=["took", "wall_ms"], default="took")
+    parser.add_argument("--baseline", default="asis")
+    parser.add_argument(
+        "--workload",
+        action="store_true",
+        help="load the category workload for the has-category-weights breakdown",
+    )
+    parser.add_argument(
+        "--result-counts-host",
+        default=None,
+        help="fetch each keyword's _count from this host (stored with the run)",
+    )
+    parser.add_argument("--index", default="ads-catalog-product-serving-v2")
+    parser.add_argument("--n-boot", type=int, default=2000)
+    parser.add_argument("--alpha", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--output", default="report", help="writes .md and .html")
+    workload_cache.add_arguments(parser)
+    args = parser.parse_args()
+
+    store = ResultStore(args.store)
+    samples = load_samples(store, args.metric)
+    keywords = samples["keyword"].cat.categories
+
+    category_weights = None
+    if args.workload:
+        cache = workload_cache.from_args(args)
+        workload = workload_cache.load_category_workload(
+            cache, workloads.CATEGORY_SQL, args.run_date
+        )
+        category_weights = dict(
+            zip(workload["queryText"], workload["hoian_category_name"])
+        )
+    stored = store.read("keyword_features")
+    counts = None
+    if not stored.empty and "result_count" in stored:
+        counts = stored.drop_duplicates("keyword", keep="last")
+        counts = counts.set_index("keyword")["result_count"].to_dict()
+    if args.result_counts_host:
+        counts = result_counts(args.result_counts_host, args.index, keywords)
+        store.append(
+            "keyword_features",
+            [{"keyword": k, "result_count": v} for k, v in counts.items()],
+        )
+    features = keyword_features(keywords, category_weights, counts)
+
+    ratios = log_ratios(samples, args.metric, args.baseline)
+    ci = f"{1 - args.alpha:.0%} bootstrap CI over keywords"
+    sections = [
+        (
+            "Distributions",
+            f"`{args.metric}` (ms) over every measured sample.",
+            distributions(samples, args.metric),
+        ),
+        (
+            f"Latency ratio to {args.baseline}",
+            f"Geometric mean over keywords of the per-keyword median ratio, "
+            f"with its {ci}; below 1 is faster.",
+            speedups(ratios, args.n_boot, args.alpha, args.seed),
+        ),
+        (
+            "By keyword feature",
+            f"The same ratio per keyword group ({ci}).",
+            breakdowns(
+                ratios, feature_groups(features), args.n_boot, args.alpha, args.seed
+            ),
+        ),
+    ]
+    predictions = prod_predictions(samples, args.metric, args.baseline)
+    if not predictions.empty:
+        sections.append(
+            (
+                "Prod prediction",
+                f"Per-keyword prod {args.baseline} x alpha ratio, medians over "
+                "keywords; median_ape is against prod where it was measured.",
+                predictions,
+            )
+        )
+    write_report(f"{args.store}: {len(samples)} samples", sections, args.output)
+    for heading, _, table in sections:
+        print(heading)
+        print(table.to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+import experiment
+import loadgen
+import workload_cache
+import workloads
+
+
+def stages(start_qps, max_qps, step=1.5):
+    qps = []
+    current = start_qps
+    while current <= max_qps:
+        qps.append(round(current, 2))
+        current *= step
+    return qps
+
+
+def stage_stats(samples, offered_qps):
+    df = pd.DataFrame(samples)
+    scheduled = df["started_at"] - df["schedule_lag_ms"] / 1000
+    completed = scheduled + df["latency_ms"] / 1000
+    elapsed = completed.max() - scheduled.min()
+    # Partial responses (failed shards or a timeout) come back faster than
+    # full ones; counted as successes they would push the knee up.
+    partial = (df["shards_failed"].fillna(0) > 0) | df["timed_out"].eq(True)
+    failed = df["error"].notna() | partial
+    ok = df[~failed]
+    return {
+        "offered_qps": offered_qps,
+        "requests": len(df),
+        "throughput_qps": len(ok) / elapsed if elapsed > 0 else float("nan"),
+        "error_rate": float(failed.mean()),
+        "partial_rate": float(partial.mean()),
+        # A full search thread pool queue shows up as a 429, a 503, or a 200
+        # with rejected shards.
+        "rejection_rate": float((df["status"].isin([429, 503]) | partial).mean()),
+        "latency_ms_p50": ok["latency_ms"].quantile(0.5),
+        "latency_ms_p99": ok["latency_ms"].quantile(0.99),
+        "took_p50": ok["took"].quantile(0.5),
+        "took_p99": ok["took"].quantile(0.99),
+        "schedule_lag_ms_p99": df["schedule_lag_ms"].quantile(0.99),
+        "max_in_flight": int(df["in_flight"].max()),
+    }
+
+
+def is_saturated(
+    stage, baseline, latency_factor=2.0, efficiency=0.9, max_error_rate=0.01
+):
+    # A stage is past the knee once p99 latency has diverged from the
+    # lowest stage, the cluster no longer keeps up with the offered load,
+    # or it starts failing requests.
+    return bool(
+        stage["latency_ms_p99"] > latency_factor * baseline["latency_ms_p99"]
+        or stage["throughput_qps"] < efficiency * stage["offered_qps"]
+        or stage["error_rate"] > max_error_rate
+    )
+
+
+def ramp(
+    es_host,
+    index_name,
+    queries,
+    qps_stages,
+    stage_duration=30,
+    cooldown=10,
+    stages_past_knee=1,
+    max_workers=256,
+    params=None,
+    **knee,
+):
+    # Steps the open-loop offered load through `qps_stages` and stops
+    # `stages_past_knee` stages after saturation instead of pushing the
+    # cluster further. Returns the stage rows and all raw samples.
+    curve = []
+    samples = []
+    past_knee = None
+    for qps in qps_stages:
+        stage_samples = loadgen.run_open_loop(
+            es_host,
+            index_name,
+            queries,
+            qps,
+            duration=stage_duration,
+            max_workers=max_workers,
+            params=params,
+        )
+        stage = stage_stats(stage_samples, qps)
+        stage["saturated"] = is_saturated(stage, curve[0] if curve else stage, **knee)
+        curve.append(stage)
+        samples.extend({**sample, "offered_qps": qps} for sample in stage_samples)
+        if stage["saturated"]:
+            past_knee = 0 if past_knee is None else past_knee + 1
+            if past_knee >= stages_past_knee:
+                break
+        time.sleep(cooldown)
+    return curve, samples
+
+
+def capacity(curve):
+    # The sustainable capacity is the last offered load before the first
+    # saturated stage. Without a saturated stage the ramp never reached the
+    # knee and the capacity is only a lower bound.
+    curve = pd.DataFrame(curve)
+    saturated = np.flatnonzero(curve["saturated"].to_numpy())
+    knee = saturated[0] if len(saturated) else None
+    sustained = curve.iloc[: knee if knee is not None else len(curve)]
+    return {
+        "knee_found": knee is not None,
+        "knee_qps": curve["offered_qps"].iloc[knee] if knee is not None else None,
+        "capacity_qps": sustained["offered_qps"].max() if len(sustained) else 0,
+        "peak_throughput_qps": curve["throughput_qps"].max(),
+        "idle_latency_ms_p50": curve["latency_ms_p50"].iloc[0],
+        "idle_took_p50": curve["took_p50"].iloc[0],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Ramp open-loop load per DSL variant and find its knee"
+    )
+    parser.add_argument("--host", default="http://search-searching.alpha.kr.krmt.io")
+    parser.add_argument("--index", default="ads-catalog-product-serving-v2")
+    experiment.add_variant_arguments(parser, ["asis", "idsort", "native_idsort"])
+    parser.add_argument("--keywords", type=int, default=100, help="top keywords by qc")
+    parser.add_argument("--start-qps", type=float, default=5)
+    parser.add_argument("--max-qps", type=float, default=200)
+    parser.add_argument("--step", type=float, default=1.5, help="qps multiplier")
+    parser.add_argument("--stage-duration", type=float, default=30)
+    parser.add_argument("--cooldown", type=float, default=10)
+    parser.add_argument("--stages-past-knee", type=int, default=1)
+    parser.add_argument("--max-workers", type=int, default=256)
+    parser.add_argument("--latency-factor", type=float, default=2.0)
+    parser.add_argument("--efficiency", type=float, default=0.9)
+    parser.add_argument("--max-error-rate", type=float, default=0.01)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--output", default="capacity.csv")
+    parser.add_argument("--summary-output", default="capacity_summary.csv")
+    parser.add_argument("--samples-output", default=None)
+    workload_cache.add_arguments(parser)
+    args = parser.parse_args()
+
+    cache = workload_cache.from_args(args)
+    df = workload_cache.load_category_workload(
+        cache, workloads.CATEGORY_SQL, args.run_date
+    )
+    df = df.head(args.keywords)
+    variants = experiment.named_variants(args.variants, args.spec, args.seed)
+    renderers = experiment.variant_renderers(variants, cache, args.run_date)
+    qps_stages = stages(args.start_qps, args.max_qps, args.step)
+    curves = []
+    summary = []
+    samples = []
+    for variant, render in renderers.items():
+        queries = {
+            keyword: render(keyword, category_weights)
+            for keyword, category_weights in zip(
+                df["queryText"], df["hoian_category_name"]
+            )
+        }
+        curve, variant_samples = ramp(
+            args.host,
+            args.index,
+            queries,
+            qps_stages,
+            args.stage_duration,
+            args.cooldown,
+            args.stages_past_knee,
+            args.max_workers,
+            latency_factor=args.latency_factor,
+            efficiency=args.efficiency,
+            max_error_rate=args.max_error_rate,
+        )
+        curves.extend({"variant": variant, **stage} for stage in curve)
+        summary.append({"variant": variant, **capacity(curve)})
+        samples.extend({"variant": variant, **sample} for sample in variant_samples)
+        print(pd.DataFrame(curve).to_string(index=False))
+
+    pd.DataFrame(curves).to_csv(args.output, index=False)
+    pd.DataFrame(summary).to_csv(args.summary_output, index=False)
+    if args.samples_output:
+        pd.DataFrame(samples).to_csv(args.samples_output, index=False)
+    print(pd.DataFrame(summary).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
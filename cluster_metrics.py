@@ -0,0 +1,191 @@
+import threading
+import time
+
+import pandas as pd
+import requests
+
+import loadgen
+
+# Summed over nodes and differenced over a window.
+NODE_COUNTERS = {
+    "search_completed": ("thread_pool", "search", "completed"),
+    "search_rejected": ("thread_pool", "search", "rejected"),
+    "query_total": ("indices", "search", "query_total"),
+    "query_time_ms": ("indices", "search", "query_time_in_millis"),
+    "fetch_total": ("indices", "search", "fetch_total"),
+    "fetch_time_ms": ("indices", "search", "fetch_time_in_millis"),
+    "query_cache_hits": ("indices", "query_cache", "hit_count"),
+    "query_cache_misses": ("indices", "query_cache", "miss_count"),
+    "query_cache_evictions": ("indices", "query_cache", "evictions"),
+    "request_cache_hits": ("indices", "request_cache", "hit_count"),
+    "request_cache_misses": ("indices", "request_cache", "miss_count"),
+    "fielddata_evictions": ("indices", "fielddata", "evictions"),
+    "gc_young_count": ("jvm", "gc", "collectors", "young", "collection_count"),
+    "gc_young_ms": ("jvm", "gc", "collectors", "young", "collection_time_in_millis"),
+    "gc_old_count": ("jvm", "gc", "collectors", "old", "collection_count"),
+    "gc_old_ms": ("jvm", "gc", "collectors", "old", "collection_time_in_millis"),
+}
+# Reduced over nodes with the given function; the window keeps the maximum.
+NODE_GAUGES = {
+    "search_queue": (("thread_pool", "search", "queue"), sum),
+    "search_active": (("thread_pool", "search", "active"), sum),
+    "fielddata_bytes": (("indices", "fielddata", "memory_size_in_bytes"), sum),
+    "heap_used_percent": (("jvm", "mem", "heap_used_percent"), max),
+}
+# From <index>/_stats, so other indices on the same nodes do not count.
+INDEX_COUNTERS = {
+    "index_query_total": ("search", "query_total"),
+    "index_query_time_ms": ("search", "query_time_in_millis"),
+    "index_request_cache_misses": ("request_cache", "miss_count"),
+    "index_fielddata_evictions": ("fielddata", "evictions"),
+}
+INDEX_GAUGES = {
+    "index_fielddata_bytes": ("fielddata", "memory_size_in_bytes"),
+}
+
+
+def _get(node, path):
+    for key in path:
+        if not isinstance(node, dict) or key not in node:
+            return None
+        node = node[key]
+    return node
+
+
+def snapshot(es_host, index_name, timeout=5):
+    session = loadgen.get_session()
+    timestamp = time.time()
+    nodes = session.get(
+        f"{es_host}/_nodes/stats/thread_pool,indices,jvm", timeout=timeout
+    )
+    nodes.raise_for_status()
+    index = session.get(f"{es_host}/{index_name}/_stats", timeout=timeout)
+    index.raise_for_status()
+    nodes = list(nodes.json()["nodes"].values())
+    total = index.json()["_all"]["total"]
+
+    row = {"timestamp": timestamp, "nodes": len(nodes)}
+    for name, path in NODE_COUNTERS.items():
+        values = [_get(node, path) for node in nodes]
+        row[name] = sum(value for value in values if value is not None)
+    for name, (path, reduce) in NODE_GAUGES.items():
+        values = [_get(node, path) for node in nodes]
+        values = [value for value in values if value is not None]
+        row[name] = reduce(values) if values else None
+    for name, path in {**INDEX_COUNTERS, **INDEX_GAUGES}.items():
+        row[name] = _get(total, path)
+    return row
+
+
+class Collector:
+    # Polls one cluster in a background thread for as long as it runs. A
+    # failed poll is recorded as an error and skipped, so a flaky stats
+    # endpoint never aborts a benchmark.
+
+    def __init__(self, es_host, index_name, interval=1.0):
+        self.es_host = es_host
+        self.index_name = index_name
+        self.interval = interval
+        self.snapshots = []
+        self.errors = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def poll(self):
+        try:
+            self.snapshots.append(snapshot(self.es_host, self.index_name))
+        except (requests.RequestException, KeyError, ValueError):
+            self.errors += 1
+
+    def _run(self):
+        while True:
+            self.poll()
+            if self._stop.wait(self.interval):
+                return
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.poll()
+
+    def window(self, start, end):
+        # Counters are differenced between the last snapshot at or before
+        # `start` and the first at or after `end` (call poll() right before
+        # and after a measurement to have them); gauges are the maximum seen
+        # in between.
+        # Without snapshots around the window only window_s is set.
+        snapshots = sorted(self.snapshots, key=lambda s: s["timestamp"])
+        before = [s for s in snapshots if s["timestamp"] <= start]
+        after = [s for s in snapshots if s["timestamp"] >= end]
+        row = {"window_s": end - start}
+        if not before or not after:
+            return row
+        first, last = before[-1], after[0]
+        inside = [s for s in snapshots if first["timestamp"] <= s["timestamp"]]
+        inside = [s for s in inside if s["timestamp"] <= last["timestamp"]]
+        for name in [*NODE_COUNTERS, *INDEX_COUNTERS]:
+            if first[name] is not None and last[name] is not None:
+                row[name] = last[name] - first[name]
+        for name in [*NODE_GAUGES, *INDEX_GAUGES]:
+            values = [s[name] for s in inside if s[name] is not None]
+            row[f"{name}_max"] = max(values) if values else None
+        lookups = row.get("query_cache_hits", 0) + row.get("query_cache_misses", 0)
+        if lookups:
+            row["query_cache_hit_ratio"] = row["query_cache_hits"] / lookups
+        return row
+
+    def timeline(self):
+        return pd.DataFrame(self.snapshots)
+
+
+def sample_window(samples):
+    # The span of a cell's requests. Cells in a block are interleaved, so
+    # their windows overlap: the deltas describe the cluster while the cell
+    # ran, not the cell's own requests alone.
+    starts = [sample["started_at"] for sample in samples]
+    ends = [
+        sample["started_at"] + (sample["wall_ms"] or 0) / 1000 for sample in samples
+    ]
+    return min(starts), max(ends)
+
+
+def cell_columns(collector, samples, prefix="node_"):
+    if not samples:
+        return {}
+    row = collector.window(*sample_window(samples))
+    return {f"{prefix}{name}": value for name, value in row.items()}
+
+
+def add_arguments(parser):
+    parser.add_argument(
+        "--cluster-metrics",
+        action="store_true",
+        help="poll _nodes/stats and _stats and store deltas with every cell",
+    )
+    parser.add_argument("--metrics-interval", type=float, default=1.0)
+
+
+def from_args(args, hosts, index_name):
+    # `hosts` maps cluster name to URL. Returns running collectors, or an
+    # empty dict when --cluster-metrics is off.
+    if not args.cluster_metrics:
+        return {}
+    return {
+        cluster: Collector(es_host, index_name, args.metrics_interval).start()
+        for cluster, es_host in hosts.items()
+    }
+
+
+def stop(collectors, path="cluster_metrics.csv"):
+    timelines = []
+    for cluster, collector in collectors.items():
+        collector.stop()
+        timelines.append(collector.timeline().assign(cluster=cluster))
+    if timelines:
+        pd.concat(timelines, ignore_index=True).to_csv(path, index=False)
@@ -0,0 +1,184 @@
+import argparse
+import inspect
+import statistics
+import time
+
+import pandas as pd
+from tqdm import tqdm
+
+import dsls
+import experiment
+import loadgen
+import workload_cache
+import workloads
+
+
+def collapse_builders(variant):
+    # The variant's dsls.py builder and its paginated collapse counterpart.
+    name = variant["builder"]
+    collapse_name = name.removesuffix("_dsl") + "_collapse_dsl"
+    if not hasattr(dsls, collapse_name):
+        raise ValueError(f"{name} has no collapse counterpart {collapse_name}")
+    return getattr(dsls, name), getattr(dsls, collapse_name)
+
+
+def _search(es_host, index_name, dsl):
+    session = loadgen.get_session()
+    body = loadgen.to_body(dsl)
+    start = time.perf_counter()
+    response = session.get(
+        f"{es_host}/{index_name}/_search", headers=loadgen.HEADERS, data=body
+    )
+    response.raise_for_status()
+    result = response.json()
+    cost = {
+        "took": result["took"],
+        "wall_ms": (time.perf_counter() - start) * 1000,
+        "request_bytes": len(body),
+        "response_bytes": len(response.content),
+    }
+    return result, cost
+
+
+def _add(total, cost):
+    for key, value in cost.items():
+        total[key] = total.get(key, 0) + value
+
+
+def aggregation_groups(es_host, index_name, dsl):
+    result, cost = _search(es_host, index_name, dsl)
+    agg = result["aggregations"]["by_catalog_id"]
+    groups = {}
+    for bucket in agg["buckets"]:
+        hits = bucket["top_catalog_hits"]["hits"]["hits"]
+        groups[bucket["key"]] = [hit["_id"] for hit in hits]
+    # With leftover documents the aggregation only kept the largest catalogs,
+    # so collapse legitimately returns more of them.
+    complete = agg["sum_other_doc_count"] == 0
+    return groups, complete, {**cost, "pages": 1}
+
+
+def collapse_groups(es_host, index_name, builder, args, page_size=1000):
+    groups = {}
+    total = {}
+    search_after = None
+    while True:
+        dsl = builder(*args, size=page_size, search_after=search_after)
+        result, cost = _search(es_host, index_name, dsl)
+        _add(total, {**cost, "pages": 1})
+        hits = result["hits"]["hits"]
+        for hit in hits:
+            inner = hit["inner_hits"]["top_catalog_hits"]["hits"]["hits"]
+            groups[hit["fields"]["catalog_id"][0]] = [doc["_id"] for doc in inner]
+        if len(hits) < page_size:
+            return groups, total
+        search_after = hits[-1]["sort"]
+
+
+def compare_groups(aggregated, collapsed, complete):
+    missing = aggregated.keys() - collapsed.keys()
+    extra = collapsed.keys() - aggregated.keys() if complete else set()
+    # Products are compared as sets: equal scores may be ordered differently.
+    mismatched = [
+        catalog_id
+        for catalog_id in aggregated.keys() & collapsed.keys()
+        if set(aggregated[catalog_id]) != set(collapsed[catalog_id])
+    ]
+    return {
+        "catalogs_aggregation": len(aggregated),
+        "catalogs_collapse": len(collapsed),
+        "missing_catalogs": len(missing),
+        "extra_catalogs": len(extra),
+        "mismatched_catalogs": len(mismatched),
+        "aggregation_complete": complete,
+        "equivalent": not missing and not extra and not mismatched,
+    }
+
+
+def check_keyword(
+    es_host,
+    index_name,
+    name,
+    variant,
+    keyword,
+    category_weights,
+    iterations=5,
+    page_size=1000,
+):
+    aggregation_builder, collapse_builder = collapse_builders(variant)
+    args = (keyword,)
+    if "category_weights" in inspect.signature(aggregation_builder).parameters:
+        args = (keyword, category_weights)
+    aggregation_costs = []
+    collapse_costs = []
+    for _ in range(iterations):
+        aggregated, complete, cost = aggregation_groups(
+            es_host, index_name, aggregation_builder(*args)
+        )
+        aggregation_costs.append(cost)
+        collapsed, cost = collapse_groups(
+            es_host, index_name, collapse_builder, args, page_size
+        )
+        collapse_costs.append(cost)
+
+    row = {"keyword": keyword, "variant": name}
+    row.update(compare_groups(aggregated, collapsed, complete))
+    for name, costs in [
+        ("aggregation", aggregation_costs),
+        ("collapse", collapse_costs),
+    ]:
+        for key in costs[0]:
+            row[f"{name}_{key}"] = statistics.median(cost[key] for cost in costs)
+    return row
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Check collapse builders against the terms+top_hits aggregation"
+    )
+    parser.add_argument("--host", default="http://search-searching.alpha.kr.krmt.io")
+    parser.add_argument("--index", default="ads-catalog-product-serving-v2")
+    experiment.add_variant_arguments(parser, ["asis", "idsort"])
+    parser.add_argument("--iterations", type=int, default=5)
+    parser.add_argument("--page-size", type=int, default=1000)
+    parser.add_argument("--output", default="collapse_check.csv")
+    workload_cache.add_arguments(parser)
+    args = parser.parse_args()
+
+    cache = workload_cache.from_args(args)
+    df = workload_cache.load_category_workload(
+        cache, workloads.CATEGORY_SQL, args.run_date
+    )
+    variants = experiment.named_variants(args.variants, args.spec)
+    rows = []
+    for keyword, category_weights in tqdm(
+        zip(df["queryText"], df["hoian_category_name"]), total=len(df)
+    ):
+        for name, variant in variants.items():
+            rows.append(
+                check_keyword(
+                    args.host,
+                    args.index,
+                    name,
+                    variant,
+                    keyword,
+                    category_weights,
+                    args.iterations,
+                    args.page_size,
+                )
+            )
+    result = pd.DataFrame(rows)
+    result.to_csv(args.output, index=False)
+    summary = result.groupby("variant").agg(
+        equivalent=("equivalent", "mean"),
+        aggregation_took=("aggregation_took", "median"),
+        collapse_took=("collapse_took", "median"),
+        aggregation_response_bytes=("aggregation_response_bytes", "median"),
+        collapse_response_bytes=("collapse_response_bytes", "median"),
+        collapse_pages=("collapse_pages", "mean"),
+    )
+    print(summary.to_string())
+
+
+if __name__ == "__main__":
+    main()
@@ -1,161 +1,54 @@
-import requests
-import json
-import pandas_gbq
-import dsls
-import pandas as pd
-from tqdm import tqdm
-import time
-import random
-
-
-SQL = """
-WITH
-  TARGET_TABLE AS (
-  SELECT
-    kw_cat.keyword,
-    kw_cat.run_date,
-    cw.category_id,
-    cw.category_name,
-    cat.uid AS hoian_category_name,
-    cw.predict,
-    cw.is_boost,
-    cw.probability,
-    cw.score
-  FROM
-    `karrotmarket.team_search_data.fleamarket_category_weights` AS kw_cat,
-    UNNEST(kw_cat.category_weights) AS cw
-  LEFT JOIN
-    `karrotmarket.db_hoian_kr.categories` AS cat
-  ON
-    cw.category_id = cat.id
-  WHERE
-    kw_cat.run_date = DATE_SUB(CURRENT_DATE(), INTERVAL 2 DAY) ),
-  CATEGORY_WEIGHT AS (
-  SELECT
-    keyword,
-    TIMESTAMP(run_date) AS run_date,
-    TO_JSON_STRING( ARRAY_AGG(STRUCT( category_id,
-          category_name,
-          hoian_category_name,
-          predict,
-          is_boost,
-          probability,
-          score )) ) AS category_weights
-  FROM
-    TARGET_TABLE
-  GROUP BY
-    keyword,
-    run_date ),
-  QC AS (
-  SELECT
-    queryText,
-    qc,
-    qc / total_qc AS qc_percentage,
-    SUM(qc / total_qc) OVER (ORDER BY qc DESC) AS cumulative_qc_percentage
-  FROM (
-    SELECT
-      queryText,
-      COUNT(*) AS qc,
-      SUM(COUNT(*)) OVER () AS total_qc
-    FROM
-      `karrotmarket.kotisaari_data.stream_mediation-request_v1`
-    WHERE
-      TIMESTAMP_TRUNC(requestedAt, DAY) BETWEEN TIMESTAMP("2024-09-01")
-      AND TIMESTAMP("2024-09-07")
-      AND queryText IS NOT NULL
-    GROUP BY
-      queryText )
-  ORDER BY
-    qc DESC
-  LIMIT
-    100 )
-SELECT
-  QC.queryText,
-  cw.category_weights
-FROM
-  QC
-LEFT JOIN
-  CATEGORY_WEIGHT cw
-ON
-  TRIM(QC.queryText) = cw.keyword
-"""
-
-
-def get_query_time(es_host, index_name, query, iterations=50):
-    headers = {"Content-Type": "application/json"}
-    times = []
-
-    for _ in range(iterations):
-        retry = 3
-        while retry:
-            try:
-                response = requests.get(
-                    f"{es_host}/{index_name}/_search",
-                    headers=headers,
-                    data=json.dumps(query),
-                )
-            except:
-                print("Error! retry...", retry)
-                retry -= 1
-            else:
-                retry = 0
-        if response.status_code != 200:
-            print(f"Error: {response.status_code}")
-            return None
-        times.append(response.json()["took"])
+import argparse
+import os
 
-    cut = int(len(times) * 0.1)
-    times = sorted(times[cut : len(times) - cut + 1])
+import numpy as np
+import pandas as pd
 
-    average_time = sum(times) / len(times) if times else 0
-    return average_time, times
+import experiment
+import prediction
+from result_store import wide_table
 
+SPEC = "category_match.yaml"
+# The spec's variants, asis first: the predictions scale by the alpha asis.
+VARIANTS = list(
+    experiment.load_spec(os.path.join(experiment.SPEC_DIR, SPEC))["variants"]
+)
 
-if __name__ == "__main__":
-    es_alpha = "http://search-searching.alpha.kr.krmt.io"
-    es_prod = "http://search-searching.kr.krmt.io"
-    index_name = "ads-catalog-product-serving-v2"
 
-    df = pandas_gbq.read_gbq(
-        SQL, project_id="karrotmarket", dialect="standard", use_bqstorage_api=True
-    )
-    df["hoian_category_name"] = [
-        (
-            {w["hoian_category_name"]: 1 for w in json.loads(cw) if w["is_boost"]}
-            if cw
-            else {}
-        )
-        for cw in df["category_weights"]
+def build_results(cells, keywords):
+    names = [
+        f"{cluster}_{variant}" for cluster in ["prod", "alpha"] for variant in VARIANTS
     ]
-    results = []
-
-    for keyword, category_weight in tqdm(
-        zip(df["queryText"], df["hoian_category_name"]), total=len(df)
-    ):
-        asis_query = dsls.get_current_dsl(keyword)
-        idsort_query = dsls.get_category_match_idsort_dsl(keyword, category_weight)
-        randomsort_query = dsls.get_category_match_randomsort_dsl(
-            keyword, category_weight
+    wide = wide_table(cells, names, keywords)
+    avg = {name: wide[f"{name}_took_trimmed_mean"].to_numpy() for name in names}
+    results = pd.DataFrame({"query": keywords})
+    for variant in VARIANTS:
+        results[f"time_prod_{variant}"] = avg[f"prod_{variant}"]
+    # A 0 ms alpha baseline gives no ratio; leave those predictions NaN.
+    alpha_asis = np.where(avg["alpha_asis"] > 0, avg["alpha_asis"], np.nan)
+    for variant in VARIANTS[1:]:
+        results[f"time_prod_{variant}_pred"] = avg["prod_asis"] * (
+            avg[f"alpha_{variant}"] / alpha_asis
         )
+    for variant in VARIANTS:
+        results[f"time_alpha_{variant}"] = avg[f"alpha_{variant}"]
+    return pd.concat([results, wide.reset_index(drop=True)], axis=1)
 
-        prod_asis_avg_time, _ = get_query_time(es_prod, index_name, asis_query)
-        prod_idsort_avg_time, _ = get_query_time(es_prod, index_name, idsort_query)
-        prod_randomsort_avg_time, _ = get_query_time(es_prod, index_name, randomsort_query)
-        alpha_asis_avg_time, _ = get_query_time(es_alpha, index_name, asis_query)
-        alpha_idsort_avg_time, _ = get_query_time(es_alpha, index_name, idsort_query)
-        alpha_randomsort_avg_time, _ = get_query_time(es_alpha, index_name, randomsort_query)
 
-        results.append(
-            {
-                "query": keyword,
-                "time_prod_asis": prod_asis_avg_time,
-                "time_prod_idsort": prod_idsort_avg_time,
-                "time_prod_randomsort": prod_randomsort_avg_time,
-                "time_prod_idsort_pred": prod_asis_avg_time * (alpha_idsort_avg_time / alpha_asis_avg_time),
-                "time_prod_randomsort_pred": prod_asis_avg_time * (alpha_randomsort_avg_time / alpha_asis_avg_time),
-                "time_alpha_asis": alpha_asis_avg_time,
-                "time_alpha_idsort": alpha_idsort_avg_time,
-                "time_alpha_randomsort": alpha_randomsort_avg_time,
-            }
+if __name__ == "__main__":
+    # experiments/category_match.yaml with the flags this script always had.
+    # --store defaults to results_category_match, apart from the terms runs.
+    parser = argparse.ArgumentParser()
+    experiment.add_script_arguments(parser)
+    args = parser.parse_args()
+
+    spec = experiment.script_spec(SPEC, args)
+    store = experiment.open_store(parser, args, spec["name"])
+    store = experiment.run(spec, args, store, build_results)
+    try:
+        predictions, _ = prediction.predict_prod(store.cells())
+        predictions.to_csv(
+            os.path.join(args.output_dir, "predictions.csv"), index=False
         )
-    pd.DataFrame(results).to_csv("results.csv", index=False)
+    except ValueError as e:
+        print(f"No calibrated prod predictions: {e}")
@@ -0,0 +1,155 @@
+import functools
+import inspect
+import json
+import random
+import re
+import timeit
+
+import dsls
+
+_PLACEHOLDER = re.compile(r'"@@(\w+)@@"')
+
+
+def _freeze(value):
+    # Arguments are flat: a keyword string, a {category: weight} dict or a
+    # list of catalog ids, so a shallow tuple is enough to make them hashable.
+    # The value types are part of the key: True == 1 == 1.0 hash alike but
+    # serialize differently.
+    if isinstance(value, dict):
+        return (dict, tuple(value.items()), tuple(map(type, value.values())))
+    if isinstance(value, list):
+        return (list, tuple(value), tuple(map(type, value)))
+    return (type(value), value, None)
+
+
+def _thaw(frozen):
+    kind, value, _ = frozen
+    if kind in (dict, list):
+        return kind(value)
+    return value
+
+
+@functools.lru_cache(maxsize=4096)
+def _fragment(frozen):
+    return json.dumps(_thaw(frozen)).encode()
+
+
+class DslTemplate:
+    # The builder is called once with placeholder strings for every argument
+    # and serialized once. Rendering only serializes the arguments and splices
+    # them between the pre-encoded skeleton segments, so the output is the
+    # same bytes as json.dumps(builder(*args)).encode(). Builders that derive
+    # structure from an argument (e.g. one function per category weight, or
+    # an optional search_after) are only memoized.
+    # Splicing only beats build+dumps for small bodies; with large id lists
+    # a cold render is slower (see the benchmark below), since the key has
+    # to be built from every id. The win there is memoization of repeated
+    # arguments, not the splicing.
+
+    def __init__(self, builder, maxsize=4096):
+        self.builder = builder
+        self.signature = inspect.signature(builder)
+        self.params = list(self.signature.parameters)
+        try:
+            skeleton = json.dumps(builder(*[f"@@{name}@@" for name in self.params]))
+        except (AttributeError, TypeError):
+            self.segments = None
+        else:
+            parts = _PLACEHOLDER.split(skeleton)
+            self.segments = [part.encode() for part in parts[::2]]
+            self.slots = parts[1::2]
+            self._check_skeleton()
+        self._render_frozen = functools.lru_cache(maxsize=maxsize)(self._render)
+
+    def _check_skeleton(self):
+        # A builder whose structure depends on an argument's value (e.g.
+        # `if search_after is not None`) saw a placeholder string instead, so
+        # the skeleton is rendered once with the defaults and compared with
+        # the builder's own output; on a mismatch it is only memoized.
+        probe = [
+            f"@@{name}@@" if parameter.default is parameter.empty else parameter.default
+            for name, parameter in self.signature.parameters.items()
+        ]
+        expected = json.dumps(self.builder(*probe)).encode()
+        if self._render(tuple(map(_freeze, probe))) != expected:
+            self.segments = None
+
+    def _render(self, frozen):
+        if self.segments is None:
+            return json.dumps(self.builder(*map(_thaw, frozen))).encode()
+        fragments = {
+            name: _fragment(value) for name, value in zip(self.params, frozen)
+        }
+        body = [self.segments[0]]
+        for slot, segment in zip(self.slots, self.segments[1:]):
+            body.append(fragments[slot])
+            body.append(segment)
+        return b"".join(body)
+
+    def __call__(self, *args, **kwargs):
+        # Bound against the builder's signature so defaulted parameters
+        # always have a value to splice in.
+        bound = self.signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        return self._render_frozen(
+            tuple(_freeze(value) for value in bound.arguments.values())
+        )
+
+    def cache_clear(self):
+        self._render_frozen.cache_clear()
+        _fragment.cache_clear()
+
+
+get_current_body = DslTemplate(dsls.get_current_dsl)
+get_terms_body = DslTemplate(dsls.get_terms_dsl)
+get_terms_lookup_body = DslTemplate(dsls.get_terms_lookup_dsl)
+get_category_match_bm25sort_body = DslTemplate(dsls.get_category_match_bm25sort_dsl)
+get_category_match_randomsort_body = DslTemplate(
+    dsls.get_category_match_randomsort_dsl
+)
+get_category_match_idsort_body = DslTemplate(dsls.get_category_match_idsort_dsl)
+get_category_boost_bm25sort_body = DslTemplate(dsls.get_category_boost_bm25sort_dsl)
+get_category_boost_randomsort_body = DslTemplate(
+    dsls.get_category_boost_randomsort_dsl
+)
+get_category_boost_idsort_body = DslTemplate(dsls.get_category_boost_idsort_dsl)
+
+
+def _bench(label, builder, template, args, number):
+    def baseline():
+        json.dumps(builder(*args)).encode()
+
+    def cold():
+        template.cache_clear()
+        template(*args)
+
+    def warm():
+        template(*args)
+
+    assert template(*args) == json.dumps(builder(*args)).encode()
+    runs = [("build+dumps", baseline), ("template cold", cold), ("template warm", warm)]
+    for name, fn in runs:
+        seconds = min(timeit.repeat(fn, number=number, repeat=5)) / number
+        print(f"{label:<28} {name:<14} {seconds * 1e6:10.1f} us")
+
+
+if __name__ == "__main__":
+    keyword = "나이키 운동화"
+    weights = {"여성의류": 1, "남성패션/잡화": 1, "스포츠/레저": 1}
+    _bench("current", dsls.get_current_dsl, get_current_body, (keyword,), 2000)
+    _bench(
+        "category_match_randomsort",
+        dsls.get_category_match_randomsort_dsl,
+        get_category_match_randomsort_body,
+        (keyword, weights),
+        2000,
+    )
+    for size in [10, 1000, 5000, 20000]:
+        catalog_ids = random.sample(range(10**9), size)
+        _bench(
+            f"terms{size}",
+            dsls.get_terms_dsl,
+            get_terms_body,
+            (keyword, catalog_ids),
+            200,
+        )
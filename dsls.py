@@ -310,4 +310,398 @@ def get_category_match_idsort_dsl(query, category_weights):
             }
         },
         "size": 1,
-    }
\ No newline at end of file
+    }
+
+
+def get_category_boost_functions(category_weights):
+    # Native equivalent of the CATEGORY_MATCH_SCRIPT script_score function:
+    # one filtered weight function per boosted category. The unfiltered
+    # weight-0 function keeps documents without a matching category at 0,
+    # where function_score would otherwise default the factor to 1.
+    # Unlike the script, which reads only the first value, a document with
+    # several fast_text_category_name values collects every matching weight.
+    # Categories the LEFT JOIN could not resolve come through as None (or an
+    # empty uid); no document carries them, so they get no function.
+    return [{"weight": 0}] + [
+        {
+            "filter": {"term": {"fast_text_category_name": category}},
+            "weight": 100 * weight,
+        }
+        for category, weight in category_weights.items()
+        if category
+    ]
+
+
+def get_category_boost_bm25sort_dsl(query, category_weights):
+    return {
+
+        "query": {
+            "function_score": {
+                "boost_mode": "sum",
+                "query": {
+                    "bool": {
+                        "must": [
+                            {"match": {"serving_title": {"query": query, "operator": "and"}}}
+                        ],
+                        "filter": [
+                            {"exists": {"field": "catalog_product_set_ids"}},
+                            {"term": {"availability": {"value": "IN_STOCK"}}}
+                        ]
+                    }
+                },
+                "functions": get_category_boost_functions(category_weights),
+                "score_mode": "sum"
+            }
+        },
+        "_source": ["original_id"],
+        "aggs": {
+            "by_catalog_id": {
+                "terms": {"field": "catalog_id", "size": 1000},
+                "aggs": {
+                    "top_catalog_hits": {
+                        "top_hits": {
+                            "sort": [{"_score": {"order": "desc"}}],
+                            "_source": [
+                                "original_id",
+                                "product_id",
+                                "catalog_id",
+                                "title",
+                                "brand_name",
+                                "image_url",
+                                "landing_url",
+                                "price",
+                                "sale_price",
+                                "catalog_product_set_ids",
+                                "sale_price_effective_date_from",
+                                "sale_price_effective_date_to",
+                                "fast_text_category_name",
+                            ],
+                            "size": 10,
+                        }
+                    }
+                },
+            }
+        },
+        "size": 1,
+    }
+
+
+def get_category_boost_randomsort_dsl(query, category_weights):
+    return {
+
+        "query": {
+            "function_score": {
+                "boost_mode": "sum",
+                "query": {
+                    "bool": {
+                        "filter": [
+                            {"exists": {"field": "catalog_product_set_ids"}},
+                            {"term": {"availability": {"value": "IN_STOCK"}}},
+                            {"match": {"serving_title": {"query": query, "operator": "and"}}}
+                        ]
+                    }
+                },
+                "functions": get_category_boost_functions(category_weights) + [
+                    {
+                        "random_score": {}
+                    }
+                ],
+                "score_mode": "sum"
+            }
+        },
+        "_source": ["original_id"],
+        "aggs": {
+            "by_catalog_id": {
+                "terms": {"field": "catalog_id", "size": 1000},
+                "aggs": {
+                    "top_catalog_hits": {
+                        "top_hits": {
+                            "sort": [
+                                {"_score": {"order": "desc"}},
+                                {"original_id": {"order": "desc"}}
+                            ],
+                            "_source": [
+                                "original_id",
+                                "product_id",
+                                "catalog_id",
+                                "title",
+                                "brand_name",
+                                "image_url",
+                                "landing_url",
+                                "price",
+                                "sale_price",
+                                "catalog_product_set_ids",
+                                "sale_price_effective_date_from",
+                                "sale_price_effective_date_to",
+                                "fast_text_category_name",
+                            ],
+                            "size": 10,
+                        }
+                    }
+                },
+            }
+        },
+        "size": 1,
+    }
+
+
+def get_category_boost_idsort_dsl(query, category_weights):
+    return {
+
+        "query": {
+            "function_score": {
+                "boost_mode": "replace",
+                "query": {
+                    "bool": {
+                        "filter": [
+                            {"exists": {"field": "catalog_product_set_ids"}},
+                            {"term": {"availability": {"value": "IN_STOCK"}}},
+                            {"match": {"serving_title": {"query": query, "operator": "and"}}}
+                        ]
+                    }
+                },
+                "functions": get_category_boost_functions(category_weights),
+                "score_mode": "sum"
+            }
+        },
+        "_source": ["original_id"],
+        "aggs": {
+            "by_catalog_id": {
+                "terms": {"field": "catalog_id", "size": 1000},
+                "aggs": {
+                    "top_catalog_hits": {
+                        "top_hits": {
+                            "sort": [
+                                {"_score": {"order": "desc"}},
+                                {"original_id": {"order": "desc"}}
+                            ],
+                            "_source": [
+                                "original_id",
+                                "product_id",
+                                "catalog_id",
+                                "title",
+                                "brand_name",
+                                "image_url",
+                                "landing_url",
+                                "price",
+                                "sale_price",
+                                "catalog_product_set_ids",
+                                "sale_price_effective_date_from",
+                                "sale_price_effective_date_to",
+                                "fast_text_category_name",
+                            ],
+                            "size": 10,
+                        }
+                    }
+                },
+            }
+        },
+        "size": 1,
+    }
+
+
+def get_current_collapse_dsl(query, size=1000, search_after=None):
+    # Same grouping as get_current_dsl's by_catalog_id/top_catalog_hits, as
+    # one collapsed hit per catalog with its top 10 products in inner_hits.
+    # Catalogs are paged in catalog_id order; pass the last hit's `sort`
+    # value as `search_after` to fetch the next page.
+    dsl = {
+        "query": {
+            "bool": {
+                "must": [
+                    {"match": {"serving_title": {"query": query, "operator": "and"}}}
+                ],
+                "filter": [
+                    {"exists": {"field": "catalog_product_set_ids"}},
+                    {"term": {"availability": {"value": "IN_STOCK"}}},
+                ],
+            }
+        },
+        "_source": False,
+        "collapse": {
+            "field": "catalog_id",
+            "inner_hits": {
+                "name": "top_catalog_hits",
+                "sort": [{"_score": {"order": "desc"}}],
+                "_source": [
+                    "original_id",
+                    "product_id",
+                    "catalog_id",
+                    "title",
+                    "brand_name",
+                    "image_url",
+                    "landing_url",
+                    "price",
+                    "sale_price",
+                    "catalog_product_set_ids",
+                    "sale_price_effective_date_from",
+                    "sale_price_effective_date_to",
+                    "fast_text_category_name",
+                ],
+                "size": 10,
+            },
+        },
+        "sort": [{"catalog_id": {"order": "asc"}}],
+        "track_total_hits": False,
+        "size": size,
+    }
+    if search_after is not None:
+        dsl["search_after"] = search_after
+    return dsl
+
+
+def get_category_match_idsort_collapse_dsl(
+    query, category_weights, size=1000, search_after=None
+):
+    dsl = {
+
+        "query": {
+            "function_score": {
+                "boost_mode": "replace",
+                "query": {
+                    "bool": {
+                        "filter": [
+                            {"exists": {"field": "catalog_product_set_ids"}},
+                            {"term": {"availability": {"value": "IN_STOCK"}}},
+                            {"match": {"serving_title": {"query": query, "operator": "and"}}}
+                        ]
+                    }
+                },
+                "functions": [
+                    {
+                        "weight": 100,
+                        "script_score": {
+                            "script": {
+                                "source": CATEGORY_MATCH_SCRIPT,
+                                "params": {"category_weights": category_weights}
+                            }
+                        }
+                    }
+                ],
+                "score_mode": "sum"
+            }
+        },
+        "_source": False,
+        "collapse": {
+            "field": "catalog_id",
+            "inner_hits": {
+                "name": "top_catalog_hits",
+                "sort": [
+                    {"_score": {"order": "desc"}},
+                    {"original_id": {"order": "desc"}}
+                ],
+                "_source": [
+                    "original_id",
+                    "product_id",
+                    "catalog_id",
+                    "title",
+                    "brand_name",
+                    "image_url",
+                    "landing_url",
+                    "price",
+                    "sale_price",
+                    "catalog_product_set_ids",
+                    "sale_price_effective_date_from",
+                    "sale_price_effective_date_to",
+                    "fast_text_category_name",
+                ],
+                "size": 10,
+                "script_fields": {
+                    "fast_text_category_match": {
+                        "script": {
+                            "source": CATEGORY_MATCH_SCRIPT,
+                            "params": {"category_weights": category_weights}
+                        }
+                    }
+                }
+            },
+        },
+        "sort": [{"catalog_id": {"order": "asc"}}],
+        "track_total_hits": False,
+        "size": size,
+    }
+    if search_after is not None:
+        dsl["search_after"] = search_after
+    return dsl
+
+
+def get_terms_lookup_dsl(query, lookup_index, lookup_id, lookup_path="catalog_ids"):
+    # Same as get_terms_dsl, but the catalog ids are read by Elasticsearch
+    # from a stored document instead of being inlined into every request.
+    return {
+        "query": {
+            "bool": {
+                "must": [
+                    {"match": {"serving_title": {"query": query, "operator": "and"}}}
+                ],
+                "filter": [
+                    {"exists": {"field": "catalog_product_set_ids"}},
+                    {"term": {"availability": {"value": "IN_STOCK"}}},
+                    {
+                        "terms": {
+                            "catalog_id": {
+                                "index": lookup_index,
+                                "id": lookup_id,
+                                "path": lookup_path,
+                            }
+                        }
+                    }
+                ],
+            }
+        },
+        "_source": [
+            "original_id",
+            "product_id",
+            "catalog_id",
+            "title",
+            "brand_name",
+            "image_url",
+            "landing_url",
+            "price",
+            "sale_price",
+            "catalog_product_set_ids",
+            "sale_price_effective_date_from",
+            "sale_price_effective_date_to",
+            "fast_text_category_name",
+        ],
+        "size": 1000,
+    }
+
+
+# Enough to render an ad; everything else is payload to measure against.
+LEAN_SOURCE = ["product_id", "catalog_id"]
+
+
+def _wider(source, fields):
+    if source is False:
+        return False
+    if isinstance(source, list):
+        return len(source) > len(fields)
+    return True
+
+
+def with_source(dsl, fields):
+    # Copy of `dsl` with the `_source` of the search and of every top_hits /
+    # inner_hits in it narrowed to `fields`. Disabled `_source` stays off and
+    # a list no wider than `fields` (e.g. the main hit's ["original_id"]) is
+    # kept, so the result is never wider than the original.
+    if isinstance(dsl, list):
+        return [with_source(value, fields) for value in dsl]
+    if not isinstance(dsl, dict):
+        return dsl
+    return {
+        key: list(fields)
+        if key == "_source" and _wider(value, fields)
+        else with_source(value, fields)
+        for key, value in dsl.items()
+    }
+
+
+def lean(builder, fields=LEAN_SOURCE):
+    def lean_builder(*args, **kwargs):
+        return with_source(builder(*args, **kwargs), fields)
+
+    lean_builder.__name__ = f"lean_{builder.__name__}"
+    # So inspect.signature (and DslTemplate) see the builder's parameters.
+    lean_builder.__wrapped__ = builder
+    return lean_builder
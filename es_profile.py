@@ -0,0 +1,148 @@
+import json
+
+import pandas as pd
+
+import loadgen
+
+
+def with_profile(query):
+    if isinstance(query, bytes):
+        # Template bodies end with the top-level closing brace.
+        return query[:-1] + b', "profile": true}'
+    return {**query, "profile": True}
+
+
+def _walk(section, nodes, shard_id, path=()):
+    for node in nodes:
+        name = node.get("type") or node.get("name")
+        if section == "aggregation":
+            name = f"{name}[{node.get('description')}]"
+        node_path = path + (name,)
+        children = node.get("children", [])
+        total = node.get("time_in_nanos", 0)
+        child_total = sum(child.get("time_in_nanos", 0) for child in children)
+        yield {
+            "shard": shard_id,
+            "section": section,
+            "path": "/".join(node_path),
+            "type": name,
+            "description": node.get("description") or node.get("reason", ""),
+            "depth": len(path),
+            "time_ms": total / 1e6,
+            "self_time_ms": max(total - child_total, 0) / 1e6,
+        }
+        yield from _walk(section, children, shard_id, node_path)
+
+
+def flatten_profile(response):
+    # One row per profiled node: query tree nodes, collectors, aggregations
+    # and fetch sub-phases (where script_fields run), for every shard.
+    rows = []
+    for shard in response.get("profile", {}).get("shards", []):
+        shard_id = shard["id"]
+        for search in shard.get("searches", []):
+            rows.extend(_walk("query", search.get("query", []), shard_id))
+            rows.extend(_walk("collector", search.get("collector", []), shard_id))
+        rows.extend(_walk("aggregation", shard.get("aggregations", []), shard_id))
+        if "fetch" in shard:
+            rows.extend(_walk("fetch", [shard["fetch"]], shard_id))
+    return rows
+
+
+def profile_query(es_host, index_name, query, iterations=5, label=None, retries=3):
+    # Requests are retried like loadgen's; an iteration that still fails is
+    # recorded as a single row with its status and error instead of
+    # aborting the run, and profile_table skips it.
+    body = loadgen.to_body(with_profile(query))
+    rows = []
+    for iteration in range(iterations):
+        sample, result = loadgen._request(
+            f"{es_host}/{index_name}/_search", body, label, retries
+        )
+        if result is None:
+            rows.append(
+                {
+                    "label": label,
+                    "iteration": iteration,
+                    "status": sample["status"],
+                    "error": sample["error"],
+                }
+            )
+            continue
+        for row in flatten_profile(result):
+            row.update(label=label, iteration=iteration, took=result["took"])
+            rows.append(row)
+    return rows
+
+
+def profile_table(rows, by=("variant",)):
+    # Sibling nodes can share a path (e.g. the TermQuery clauses of one
+    # BooleanQuery), so node time is first summed per shard. Shards run in
+    # parallel, so it is then averaged over shards within a request, and
+    # finally across keywords and iterations. Query descriptions carry the
+    # keyword and are left out of the grouping.
+    df = pd.DataFrame(rows)
+    if "error" in df:
+        df = df[df["error"].isna()]
+    keys = list(by) + ["section", "path"]
+    columns = keys + ["requests", "time_ms_mean", "time_ms_p95", "self_time_ms_mean"]
+    columns += ["took_mean", "share_of_took"]
+    # Every iteration failed: nothing was profiled.
+    if df.empty or "section" not in df:
+        return pd.DataFrame(columns=columns)
+    request = keys + ["label", "iteration"]
+    times = ["time_ms", "self_time_ms"]
+    per_shard = df.groupby(request + ["shard"], dropna=False)[times].sum()
+    per_request = per_shard.groupby(request, dropna=False).mean().reset_index()
+    table = (
+        per_request.groupby(keys, dropna=False)
+        .agg(
+            requests=("time_ms", "size"),
+            time_ms_mean=("time_ms", "mean"),
+            time_ms_p95=("time_ms", lambda s: s.quantile(0.95)),
+            self_time_ms_mean=("self_time_ms", "mean"),
+        )
+        .reset_index()
+    )
+    took = df.drop_duplicates(list(by) + ["label", "iteration"])
+    took = took.groupby(list(by), dropna=False)["took"].mean().rename("took_mean")
+    table = table.join(took, on=list(by))
+    table["share_of_took"] = table["self_time_ms_mean"] / table["took_mean"]
+    return table.sort_values(list(by) + ["self_time_ms_mean"], ascending=False)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    import experiment
+    import workload_cache
+
+    parser = argparse.ArgumentParser(description="Profile dsls.py variants")
+    parser.add_argument("--host", default="http://search-searching.alpha.kr.krmt.io")
+    parser.add_argument("--index", default="ads-catalog-product-serving-v2")
+    experiment.add_variant_arguments(parser, ["asis", "idsort", "randomsort"])
+    parser.add_argument("--keywords", nargs="+", required=True)
+    parser.add_argument("--category-weights", default="{}", help="JSON object")
+    parser.add_argument("--iterations", type=int, default=5)
+    parser.add_argument("--output", default="profile.csv")
+    parser.add_argument("--seed", type=int, default=None, help="terms<N> sample")
+    workload_cache.add_arguments(parser)
+    args = parser.parse_args()
+
+    category_weights = json.loads(args.category_weights)
+    variants = experiment.named_variants(args.variants, args.spec, args.seed)
+    renderers = experiment.variant_renderers(
+        variants, workload_cache.from_args(args), args.run_date
+    )
+    rows = []
+    for keyword in args.keywords:
+        for variant, render in renderers.items():
+            body = render(keyword, category_weights)
+            for row in profile_query(
+                args.host, args.index, body, args.iterations, label=keyword
+            ):
+                row["variant"] = variant
+                rows.append(row)
+    table = profile_table(rows)
+    table.to_csv(args.output, index=False)
+    print(table.to_string(index=False))
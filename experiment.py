@@ -0,0 +1,513 @@
+import argparse
+import inspect
+import json
+import os
+import random
+import re
+import threading
+import tomllib
+
+import pandas as pd
+import yaml
+from tqdm import tqdm
+
+import adaptive
+import cluster_metrics
+import dsl_templates
+import dsls
+import es_profile
+import query_cost
+import scheduler
+import tracing
+import workload_cache
+import workloads
+from latency_stats import LatencySamples
+from result_store import ResultStore, wide_table
+
+CLUSTERS = {
+    "prod": "http://search-searching.kr.krmt.io",
+    "alpha": "http://search-searching.alpha.kr.krmt.io",
+}
+INDEX_NAME = "ads-catalog-product-serving-v2"
+DEFAULTS = {
+    "index": INDEX_NAME,
+    "iterations": 50,
+    "concurrency": 1,
+    "think_time": 0,
+    "warmup": 3,
+    "cache_bust": "none",
+    "block_size": 10,
+}
+SPEC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "experiments")
+
+
+def load_spec(path):
+    # YAML or TOML by extension. Top-level keys: workload, clusters,
+    # variants, and the DEFAULTS above. A cluster is a host URL or a table
+    # with host, iterations, concurrency and think_time; a variant names a
+    # dsls.py builder with optional params, catalog_ids, lean_source,
+    # iterations and a list of the clusters it runs on. An `adaptive` table
+    # (adaptive.run options) samples every cell against its asis baseline.
+    with open(path, "rb") as f:
+        if path.endswith(".toml"):
+            spec = tomllib.load(f)
+        else:
+            spec = yaml.safe_load(f)
+    spec = {**DEFAULTS, **spec}
+    clusters = {}
+    for name, cluster in spec["clusters"].items():
+        # A bare `prod:` in YAML loads as None.
+        if cluster is None:
+            cluster = {}
+        if isinstance(cluster, str):
+            cluster = {"host": cluster}
+        cluster.setdefault("host", CLUSTERS.get(name))
+        if cluster["host"] is None:
+            raise ValueError(f"cluster {name} has no host")
+        clusters[name] = cluster
+    spec["clusters"] = clusters
+    for name, variant in spec["variants"].items():
+        if not hasattr(dsls, variant.get("builder", "")):
+            raise ValueError(f"variant {name}: no builder {variant.get('builder')}")
+        unknown = set(variant.get("clusters", [])) - set(clusters)
+        if unknown:
+            raise ValueError(f"variant {name}: unknown clusters {sorted(unknown)}")
+    return spec
+
+
+def load_workload(workload, cache, run_date=None):
+    # Returns queryText and hoian_category_name ({category: weight}, empty
+    # for sources without weights). `source` is category (the category
+    # weight SQL), top_queries (plain qc ranking) or keywords (a list).
+    source = workload["source"]
+    if source == "keywords":
+        df = pd.DataFrame({"queryText": workload["keywords"]})
+        df["hoian_category_name"] = [{} for _ in range(len(df))]
+    elif source == "category":
+        df = workload_cache.load_category_workload(
+            cache, workloads.CATEGORY_SQL, run_date
+        )
+    elif source == "top_queries":
+        df = cache.read_gbq(
+            workloads.TOP_QUERIES_SQL,
+            run_date,
+            dialect="standard",
+            use_bqstorage_api=True,
+        )
+        df["hoian_category_name"] = [{} for _ in range(len(df))]
+    else:
+        raise ValueError(f"unknown workload source {source}")
+    return df.head(workload.get("limit")).reset_index(drop=True)
+
+
+def load_catalog_ids(spec, cache, run_date=None, store=None):
+    # {source: serving | catalog, size: N, seed: S}; without `size` every id
+    # of the source is used. With a store the sample is saved the first time
+    # and reloaded after that, so a --resume run filters on the same ids
+    # even if the source table changed in between. A size larger than the
+    # source uses every id once.
+    serving = spec.get("source") == "serving"
+    sql = workloads.SERVING_CATALOG_SQL if serving else workloads.CATALOG_SQL
+    catalog_ids = cache.read_gbq(sql, run_date)["catalog_id"]
+    if "size" not in spec:
+        return catalog_ids.tolist()
+    seed = spec.get("seed")
+    pinned = f"{'serving_' if serving else ''}catalog_ids{spec['size']}"
+    table = pinned if seed is None else f"{pinned}_seed{seed}"
+    if store is not None:
+        saved = store.read(table)
+        if not saved.empty:
+            return saved["catalog_id"].tolist()
+        # A sample of the same size drawn with another seed means the spec
+        # changed since the stored cells were measured.
+        others = [
+            name
+            for name in store.tables()
+            if name == pinned or name.startswith(f"{pinned}_seed")
+        ]
+        if others:
+            raise ValueError(
+                f"the store pins catalog ids as {others[0]} but the spec asks for "
+                f"seed {seed}; use a new store or the original seed"
+            )
+    size = min(spec["size"], len(catalog_ids))
+    ids = catalog_ids.sample(n=size, random_state=seed).tolist()
+    if store is not None:
+        store.append(table, [{"catalog_id": catalog_id} for catalog_id in ids])
+    return ids
+
+
+def variant_renderer(variant, catalog_ids=None):
+    # Returns render(keyword, category_weights) -> body bytes. Builder
+    # arguments are filled by name: category_weights from the workload,
+    # catalog_ids from the variant's catalog_ids, the rest from `params`.
+    builder = getattr(dsls, variant["builder"])
+    params = list(inspect.signature(builder).parameters)
+    if variant.get("lean_source"):
+        builder = dsls.lean(builder)
+    template = dsl_templates.DslTemplate(builder)
+    fixed = dict(variant.get("params", {}))
+    if catalog_ids is not None:
+        fixed["catalog_ids"] = catalog_ids
+
+    def render(keyword, category_weights):
+        values = {"category_weights": category_weights, **fixed}
+        args = [keyword]
+        for name in params[1:]:
+            if name not in values:
+                break
+            args.append(values[name])
+        return template(*args)
+
+    return render
+
+
+def variant_renderers(variants, cache, run_date=None, store=None):
+    renderers = {}
+    for name, variant in variants.items():
+        catalog_ids = None
+        if "catalog_ids" in variant:
+            catalog_ids = load_catalog_ids(
+                variant["catalog_ids"], cache, run_date, store
+            )
+        renderers[name] = variant_renderer(variant, catalog_ids)
+    return renderers
+
+
+def named_variants(names, spec_path, seed=None):
+    # The --variants of the tools outside the runner: variants of the spec
+    # at `spec_path`, or terms<N>, a filter on N catalog ids sampled with
+    # `seed`.
+    spec = load_spec(spec_path)
+    variants = {}
+    for name in names:
+        if name in spec["variants"]:
+            variants[name] = spec["variants"][name]
+        elif re.fullmatch(r"terms\d+", name):
+            catalog_ids = {"source": "catalog", "size": int(name[5:]), "seed": seed}
+            variants[name] = {"builder": "get_terms_dsl", "catalog_ids": catalog_ids}
+        else:
+            raise ValueError(
+                f"unknown variant {name}: {spec_path} has "
+                f"{', '.join(spec['variants'])}, or use terms<N>"
+            )
+    return variants
+
+
+def plan(spec, workload, renderers):
+    # The full keyword x cluster x variant product, as scheduler cells.
+    cells = []
+    for keyword, weights in zip(workload["queryText"], workload["hoian_category_name"]):
+        for variant_name, variant in spec["variants"].items():
+            body = renderers[variant_name](keyword, weights)
+            for cluster_name in variant.get("clusters", spec["clusters"]):
+                cluster = spec["clusters"][cluster_name]
+                iterations = variant.get(
+                    "iterations", cluster.get("iterations", spec["iterations"])
+                )
+                cells.append(
+                    {
+                        "key": (keyword, cluster_name, variant_name),
+                        "es_host": cluster["host"],
+                        "body": body,
+                        "iterations": iterations,
+                    }
+                )
+    return cells
+
+
+def dedupe(cells):
+    # Cells sending the same bytes to one cluster are measured once,
+    # with the most iterations any of them asked for. Returns the cells to
+    # run and {key: key of the cell that measures it}.
+    measured = {}
+    aliases = {}
+    for cell in cells:
+        identity = (cell["key"][1], cell["body"])
+        first = measured.get(identity)
+        if first is None:
+            measured[identity] = dict(cell)
+            first = measured[identity]
+        else:
+            first["iterations"] = max(first["iterations"], cell["iterations"])
+        aliases[cell["key"]] = first["key"]
+    return list(measured.values()), aliases
+
+
+def _think_time(value):
+    return random.random if value == "random" else value
+
+
+def run_block(spec, cells):
+    # Clusters run side by side, each with its own bounded number of
+    # workers, so the load on one cluster never depends on how many others
+    # are in the spec. Within a cluster every request is interleaved.
+    # Returns ({key: samples}, {key: adaptive comparison}).
+    by_cluster = {}
+    for cell in cells:
+        by_cluster.setdefault(cell["key"][1], []).append(cell)
+    measured = {}
+    comparisons = {}
+    failures = []
+    lock = threading.Lock()
+
+    def run_cluster(name):
+        cluster = spec["clusters"][name]
+        options = {
+            "warmup": spec["warmup"],
+            "concurrency": cluster.get("concurrency", spec["concurrency"]),
+            "cache_bust": spec["cache_bust"],
+            "seed": spec.get("seed"),
+            "think_time": _think_time(cluster.get("think_time", spec["think_time"])),
+        }
+        try:
+            if spec.get("adaptive"):
+                result, compared = adaptive.run(
+                    by_cluster[name], spec["index"], **spec["adaptive"], **options
+                )
+            else:
+                result = scheduler.run(by_cluster[name], spec["index"], **options)
+                compared = {}
+        except Exception as e:
+            failures.append(e)
+            return
+        with lock:
+            measured.update(result)
+            comparisons.update(compared)
+
+    threads = [threading.Thread(target=run_cluster, args=(n,)) for n in by_cluster]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if failures:
+        raise failures[0]
+    return measured, comparisons
+
+
+def plan_summary(cells, unique):
+    rows = []
+    for cluster in sorted({cell["key"][1] for cell in cells}):
+        planned = [cell for cell in cells if cell["key"][1] == cluster]
+        measured = [cell for cell in unique if cell["key"][1] == cluster]
+        rows.append(
+            {
+                "cluster": cluster,
+                "cells": len(planned),
+                "measured_cells": len(measured),
+                "requests": sum(cell["iterations"] for cell in measured),
+                "requests_saved": sum(cell["iterations"] for cell in planned)
+                - sum(cell["iterations"] for cell in measured),
+            }
+        )
+    return pd.DataFrame(rows)
+
+
+def prepare(spec, args, store=None):
+    cache = workload_cache.from_args(args)
+    workload = load_workload(spec["workload"], cache, args.run_date)
+    renderers = variant_renderers(spec["variants"], cache, args.run_date, store)
+
+    cells = plan(spec, workload, renderers)
+    unique, aliases = dedupe(cells)
+    print(plan_summary(cells, unique).to_string(index=False))
+    return workload, unique, aliases
+
+
+def profile(spec, store, cells, measured_by):
+    # Stored as they arrive so a crash or --resume keeps them.
+    for cell in cells:
+        rows = es_profile.profile_query(cell["es_host"], spec["index"], cell["body"])
+        store.append(
+            "profile",
+            [
+                {**row, "label": keyword, "cluster": cluster, "variant": variant}
+                for keyword, cluster, variant in measured_by[cell["key"]]
+                for row in rows
+            ],
+        )
+
+
+def write_reports(spec, store, keywords, output_dir, results=None):
+    cells = store.cells()
+    if results is None:
+        names = [
+            f"{cluster}_{variant}"
+            for variant, v in spec["variants"].items()
+            for cluster in v.get("clusters", spec["clusters"])
+        ]
+        table = wide_table(cells, names, keywords).reset_index()
+    else:
+        table = results(cells, keywords)
+    table.to_csv(os.path.join(output_dir, "results.csv"), index=False)
+    query_cost.latency_table(cells).to_csv(
+        os.path.join(output_dir, "cost_features.csv"), index=False
+    )
+    scheduler.drift_report(store.samples()).to_csv(
+        os.path.join(output_dir, "drift.csv"), index=False
+    )
+    comparisons = store.read("comparisons")
+    if not comparisons.empty:
+        comparisons.drop_duplicates(
+            ["keyword", "cluster", "variant"], keep="last"
+        ).to_csv(os.path.join(output_dir, "comparisons.csv"), index=False)
+    profile_rows = store.read("profile")
+    if not profile_rows.empty:
+        es_profile.profile_table(profile_rows, by=("cluster", "variant")).to_csv(
+            os.path.join(output_dir, "profile.csv"), index=False
+        )
+    with open(os.path.join(output_dir, "experiment.json"), "w") as f:
+        json.dump(spec, f, indent=2, ensure_ascii=False)
+
+
+def open_store(parser, args, name):
+    store = ResultStore(args.store or f"results_{name}")
+    if not args.resume and not store.is_empty():
+        parser.error(f"{store.path} already has results; pass --resume")
+    return store
+
+
+def run(spec, args, store, results=None):
+    # Measures every cell not yet in `store`, block by block, and writes the
+    # reports to --output-dir. `results(cells, keywords)` replaces the
+    # default results.csv (the wide table of every cluster x variant).
+    if args.adaptive:
+        spec = {
+            **spec,
+            "adaptive": {
+                "batch": args.batch,
+                "min_iterations": args.min_iterations,
+                "max_iterations": args.max_iterations,
+                "precision": args.precision,
+            },
+        }
+    workload, unique, aliases = prepare(spec, args, store)
+    # Created up front so the reports cannot fail after the measurements.
+    os.makedirs(args.output_dir, exist_ok=True)
+    done = store.done()
+    collectors = cluster_metrics.from_args(
+        args,
+        {cluster: c["host"] for cluster, c in spec["clusters"].items()},
+        spec["index"],
+    )
+    tracer = tracing.from_args(args)
+    measured_by = {}
+    for key, measured_key in aliases.items():
+        measured_by.setdefault(measured_key, []).append(key)
+    keywords = workload["queryText"].tolist()
+    for block in tqdm(scheduler.blocks(keywords, spec["block_size"])):
+        block = set(block)
+        block_cells = [cell for cell in unique if cell["key"][0] in block]
+        finished = {
+            cell["key"]
+            for cell in block_cells
+            if all(key in done for key in measured_by[cell["key"]])
+        }
+        block_cells = adaptive.pending(
+            block_cells, finished, bool(spec.get("adaptive"))
+        )
+        if not block_cells:
+            continue
+        if args.profile:
+            profile(spec, store, block_cells, measured_by)
+        for collector in collectors.values():
+            collector.poll()
+        measured, comparisons = run_block(spec, block_cells)
+        for collector in collectors.values():
+            collector.poll()
+        store.append(
+            "comparisons",
+            [
+                {"keyword": k, "cluster": c, "variant": v, **result}
+                for measured_key, result in comparisons.items()
+                for k, c, v in measured_by[measured_key]
+            ],
+        )
+        for cell in block_cells:
+            samples = measured[cell["key"]]
+            extra = query_cost.cost_columns(cell["body"])
+            if collectors:
+                extra.update(
+                    cluster_metrics.cell_columns(collectors[cell["key"][1]], samples)
+                )
+            stats = LatencySamples.from_samples(samples)
+            for key in measured_by[cell["key"]]:
+                measured_as = None if key == cell["key"] else cell["key"][2]
+                store.write(*key, stats, measured_as=measured_as, **extra)
+
+    cluster_metrics.stop(
+        collectors, os.path.join(args.output_dir, "cluster_metrics.csv")
+    )
+    tracing.finish(tracer, args.trace)
+    write_reports(spec, store, keywords, args.output_dir, results)
+    return store
+
+
+def add_arguments(parser):
+    parser.add_argument("--store", default=None, help="default: results_<name>")
+    parser.add_argument(
+        "--resume", action="store_true", help="skip cells already in --store"
+    )
+    parser.add_argument(
+        "--profile", action="store_true", help="also write profile.csv breakdowns"
+    )
+    parser.add_argument("--output-dir", default=".")
+    workload_cache.add_arguments(parser)
+    adaptive.add_arguments(parser)
+    cluster_metrics.add_arguments(parser)
+    tracing.add_arguments(parser)
+
+
+def add_variant_arguments(parser, default):
+    parser.add_argument(
+        "--spec",
+        default=os.path.join(SPEC_DIR, "category_match.yaml"),
+        help="experiment spec whose variants --variants names",
+    )
+    parser.add_argument(
+        "--variants",
+        nargs="+",
+        default=default,
+        help="variants of --spec, or terms<N> for an N-id catalog_id filter",
+    )
+
+
+def add_script_arguments(parser):
+    # The CLI of the compare scripts, which run a spec from SPEC_DIR with
+    # the hosts and scheduling taken from flags.
+    parser.add_argument("--es-alpha", default=CLUSTERS["alpha"])
+    parser.add_argument("--es-prod", default=CLUSTERS["prod"])
+    scheduler.add_arguments(parser)
+    add_arguments(parser)
+
+
+def script_spec(file_name, args):
+    spec = load_spec(os.path.join(SPEC_DIR, file_name))
+    spec["clusters"]["prod"]["host"] = args.es_prod
+    spec["clusters"]["alpha"]["host"] = args.es_alpha
+    spec["block_size"] = args.block_size
+    spec["warmup"] = args.warmup
+    spec["concurrency"] = args.concurrency
+    spec["cache_bust"] = args.cache_bust
+    if args.seed is not None:
+        spec["seed"] = args.seed
+    return spec
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run an experiment spec")
+    parser.add_argument("spec", help="YAML or TOML experiment spec")
+    parser.add_argument("--dry-run", action="store_true", help="print the plan only")
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    spec = load_spec(args.spec)
+    spec.setdefault("name", os.path.splitext(os.path.basename(args.spec))[0])
+    if args.dry_run:
+        prepare(spec, args)
+        return
+    run(spec, args, open_store(parser, args, spec["name"]))
+
+
+if __name__ == "__main__":
+    main()
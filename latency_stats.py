@@ -0,0 +1,77 @@
+from array import array
+
+import numpy as np
+
+PERCENTILES = [50, 90, 95, 99]
+STATS = [
+    "count",
+    "min",
+    "p50",
+    "p90",
+    "p95",
+    "p99",
+    "max",
+    "mean",
+    "trimmed_mean",
+    "stddev",
+]
+
+
+def describe(values, trim=0.1):
+    values = np.sort(np.asarray(values, dtype=np.float64))
+    n = len(values)
+    if n == 0:
+        return {name: (0 if name == "count" else float("nan")) for name in STATS}
+    # Trim by value: drop the `cut` smallest and `cut` largest samples.
+    cut = int(n * trim)
+    trimmed = values[cut : n - cut]
+    summary = {"min": values[0], "max": values[-1]}
+    for p, value in zip(PERCENTILES, np.percentile(values, PERCENTILES)):
+        summary[f"p{p}"] = value
+    summary["mean"] = values.mean()
+    summary["trimmed_mean"] = trimmed.mean()
+    summary["stddev"] = values.std(ddof=1) if n > 1 else 0.0
+    return {"count": n, **{name: float(summary[name]) for name in STATS[1:]}}
+
+
+class LatencySamples:
+    # Server-side `took` and client wall-clock time for one cell, kept as
+    # packed doubles so long runs do not hold a Python object per sample.
+
+    def __init__(self):
+        self.took = array("d")
+        self.wall_ms = array("d")
+        self.started_at = array("d")
+        self.errors = 0
+
+    def __len__(self):
+        return len(self.took)
+
+    def add(self, took, wall_ms, started_at=float("nan")):
+        self.took.append(took)
+        self.wall_ms.append(wall_ms)
+        self.started_at.append(started_at)
+
+    @classmethod
+    def from_samples(cls, samples):
+        stats = cls()
+        for sample in samples:
+            if sample["error"] is None:
+                stats.add(sample["took"], sample["wall_ms"], sample["started_at"])
+            else:
+                stats.errors += 1
+        return stats
+
+    def summary(self, trim=0.1):
+        return {
+            "took": describe(self.took, trim),
+            "wall_ms": describe(self.wall_ms, trim),
+        }
+
+    def row(self, prefix=None, trim=0.1):
+        row = {}
+        for metric, summary in self.summary(trim).items():
+            for name, value in summary.items():
+                key = f"{metric}_{name}"
+                row[f"{prefix}_{key}" if prefix else key] = value
+        return row
@@ -0,0 +1,560 @@
+import argparse
+import inspect
+import itertools
+import json
+import random
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+import urllib3
+
+import dsls
+import tracing
+
+HEADERS = {"Content-Type": "application/json"}
+NDJSON_HEADERS = {"Content-Type": "application/x-ndjson"}
+# --filter-path presets; anything else is passed through as a raw filter_path.
+FILTER_PATHS = {
+    "took": "took",
+    "ids": ",".join(
+        [
+            "hits.hits._id",
+            "aggregations.by_catalog_id.buckets.key",
+            "aggregations.by_catalog_id.buckets.top_catalog_hits.hits.hits._id",
+        ]
+    ),
+}
+
+_local = threading.local()
+
+
+def get_session():
+    session = getattr(_local, "session", None)
+    if session is None:
+        session = requests.Session()
+        # Lets tracing hooks see new connections; a no-op without hooks.
+        adapter = tracing.TracedAdapter()
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        _local.session = session
+    return session
+
+
+def to_body(query):
+    if isinstance(query, bytes):
+        return query
+    return json.dumps(query).encode()
+
+
+def filter_path_params(filter_path, params=None):
+    # `took` is always kept so trimmed responses can still be timed, and
+    # `timed_out` and `_shards.failed` so partial responses are still seen.
+    if not filter_path:
+        return params
+    paths = filter_path.split(",") if isinstance(filter_path, str) else filter_path
+    kept = ["took", "timed_out", "_shards.failed"]
+    paths = kept + [path for path in paths if path not in kept]
+    return {**(params or {}), "filter_path": ",".join(paths)}
+
+
+def _decompress(data, encoding):
+    if encoding == "gzip":
+        return zlib.decompress(data, 16 + zlib.MAX_WBITS)
+    if encoding == "deflate":
+        return zlib.decompress(data)
+    return data
+
+
+def _request(url, body, label=None, retries=3, params=None, headers=HEADERS):
+    # Besides `took` and `wall_ms` every sample breaks the client side down:
+    # `ttfb_ms` until the response headers arrived, `transfer_ms` to read the
+    # body off the wire, and `decode_ms` to decompress and parse all of it,
+    # as a real client would. `wall_ms` is ttfb + transfer of the last
+    # attempt plus any failed attempts before it; decoding is not included.
+    # Every attempt is also reported to the tracing hooks.
+    session = get_session()
+    sample = {
+        "label": label,
+        "started_at": time.time(),
+        "took": None,
+        "wall_ms": None,
+        "status": None,
+        "attempts": 0,
+        "error": None,
+        "shards_failed": None,
+        "timed_out": None,
+        "request_bytes": len(body),
+        "response_bytes": None,
+        "response_raw_bytes": None,
+        "ttfb_ms": None,
+        "transfer_ms": None,
+        "decode_ms": None,
+    }
+    result = None
+    start = time.perf_counter()
+    while sample["attempts"] < retries:
+        sample["attempts"] += 1
+        request = {
+            "label": label,
+            "url": url,
+            "attempt": sample["attempts"],
+            "tid": threading.get_ident(),
+        }
+        attempt_start = time.perf_counter()
+        tracing.emit("before_send", request, attempt_start)
+        try:
+            response = session.get(
+                url, headers=headers, data=body, params=params, stream=True
+            )
+            headers_at = time.perf_counter()
+            tracing.emit("first_byte", request, headers_at)
+            data = response.raw.read(decode_content=False)
+        except (requests.RequestException, urllib3.exceptions.HTTPError) as e:
+            # The body is read from the raw stream, so a connection that
+            # breaks mid-body raises urllib3's errors rather than requests'.
+            sample["error"] = repr(e)
+            event = "retry" if sample["attempts"] < retries else "error"
+            tracing.emit(event, request, time.perf_counter(), sample["error"])
+            continue
+        end = time.perf_counter()
+        sample["wall_ms"] = (end - start) * 1000
+        sample["ttfb_ms"] = (headers_at - attempt_start) * 1000
+        sample["transfer_ms"] = (end - headers_at) * 1000
+        sample["status"] = response.status_code
+        sample["response_bytes"] = len(data)
+        raw = _decompress(data, response.headers.get("Content-Encoding"))
+        sample["response_raw_bytes"] = len(raw)
+        if response.status_code == 200:
+            try:
+                result = json.loads(raw)
+            except ValueError:
+                # Recorded like any other failed response rather than raised,
+                # which would take down the worker and the whole run.
+                sample["error"] = "invalid JSON"
+            else:
+                sample["decode_ms"] = (time.perf_counter() - end) * 1000
+                sample["took"] = result["took"]
+                sample["error"] = None
+                # A saturated cluster often answers 200 with some shards
+                # rejected or timed out; the response is then partial.
+                sample["shards_failed"] = result.get("_shards", {}).get("failed")
+                sample["timed_out"] = result.get("timed_out")
+        else:
+            sample["error"] = raw[:200].decode(errors="replace")
+        tracing.emit("complete", request, end, sample)
+        if sample["error"] is not None:
+            tracing.emit("error", request, end, sample["error"])
+        break
+    return sample, result
+
+
+def send_query(es_host, index_name, body, label=None, retries=3, params=None):
+    sample, _ = _request(
+        f"{es_host}/{index_name}/_search", body, label, retries, params
+    )
+    return sample
+
+
+def to_msearch_body(index_name, bodies):
+    # NDJSON: one header line naming the index, then the DSL on one line.
+    header = json.dumps({"index": index_name}).encode()
+    lines = []
+    for body in bodies:
+        lines.append(header)
+        lines.append(to_body(body))
+    return b"\n".join(lines) + b"\n"
+
+
+def msearch_params(params):
+    # filter_path applies to the whole _msearch response: search paths are
+    # moved under `responses`, and every sub-query's took, status and error
+    # are always kept so `queries` can be filled in.
+    if not params or "filter_path" not in params:
+        return params
+    paths = ["took", "responses.took", "responses.status", "responses.error"]
+    for path in params["filter_path"].split(","):
+        if path != "took" and not path.startswith("responses."):
+            path = f"responses.{path}"
+        if path not in paths:
+            paths.append(path)
+    return {**params, "filter_path": ",".join(paths)}
+
+
+def send_msearch(es_host, index_name, items, label=None, retries=3, params=None):
+    # `items` is a list of (label, body). The batch sample's `took` is the
+    # batch-level took; every sub-query's own took and status are listed in
+    # `queries` in request order.
+    body = to_msearch_body(index_name, [query for _, query in items])
+    sample, result = _request(
+        f"{es_host}/{index_name}/_msearch",
+        body,
+        label,
+        retries,
+        msearch_params(params),
+        headers=NDJSON_HEADERS,
+    )
+    sample["batch_size"] = len(items)
+    responses = result["responses"] if result else [{}] * len(items)
+    sample["queries"] = [
+        {
+            "label": query_label,
+            "took": response.get("took"),
+            "status": response.get("status", sample["status"]),
+            # A batch that failed as a whole fails every query in it.
+            "error": (
+                repr(response["error"]) if "error" in response else sample["error"]
+            ),
+        }
+        for (query_label, _), response in zip(items, responses)
+    ]
+    return sample
+
+
+def _jobs(queries, iterations):
+    bodies = [(label, to_body(query)) for label, query in queries.items()]
+    for _ in range(iterations):
+        yield from bodies
+
+
+def _think(think_time):
+    if callable(think_time):
+        think_time = think_time()
+    if think_time:
+        start = time.perf_counter()
+        time.sleep(think_time)
+        request = {"label": None, "tid": threading.get_ident()}
+        tracing.emit("think", request, start, time.perf_counter())
+
+
+def run_jobs(jobs, index_name, concurrency=1, think_time=0, send=send_query):
+    # Closed loop over an explicit job list: `concurrency` workers each keep
+    # exactly one request in flight. A job is a dict with es_host, body and
+    # optionally label and params; every other key is copied to its sample.
+    # `send` is send_query, or send_msearch for jobs whose body is a batch.
+    jobs = iter(jobs)
+    lock = threading.Lock()
+    samples = []
+    failures = []
+
+    def worker():
+        try:
+            work()
+        except Exception as e:
+            # Stop the other workers too: a run missing a worker's share of
+            # the jobs must not be mistaken for a complete one.
+            with lock:
+                failures.append(e)
+
+    def work():
+        while True:
+            if failures:
+                return
+            with lock:
+                job = next(jobs, None)
+            if job is None:
+                return
+            params = job.get("params")
+            if callable(params):
+                params = params()
+            sample = send(
+                job["es_host"],
+                index_name,
+                job["body"],
+                label=job.get("label"),
+                params=params,
+            )
+            for key, value in job.items():
+                if key not in ("es_host", "body", "label", "params"):
+                    sample[key] = value
+            sample["in_flight"] = concurrency
+            with lock:
+                samples.append(sample)
+            _think(think_time)
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if failures:
+        raise failures[0]
+    return samples
+
+
+def run_closed_loop(
+    es_host,
+    index_name,
+    queries,
+    iterations=50,
+    concurrency=1,
+    think_time=0,
+    params=None,
+):
+    jobs = (
+        {"es_host": es_host, "label": label, "body": body, "params": params}
+        for label, body in _jobs(queries, iterations)
+    )
+    return run_jobs(jobs, index_name, concurrency, think_time)
+
+
+def run_msearch(
+    es_host,
+    index_name,
+    queries,
+    batch_size=10,
+    iterations=50,
+    concurrency=1,
+    think_time=0,
+    params=None,
+    seed=None,
+):
+    # Every query is sent `iterations` times like run_closed_loop, but the
+    # requests are shuffled so each batch mixes keywords and variants, then
+    # packed `batch_size` at a time into one _msearch.
+    items = list(_jobs(queries, iterations))
+    random.Random(seed).shuffle(items)
+    jobs = (
+        {
+            "es_host": es_host,
+            "label": f"batch{i}",
+            "body": items[i : i + batch_size],
+            "params": params,
+        }
+        for i in range(0, len(items), batch_size)
+    )
+    return run_jobs(jobs, index_name, concurrency, think_time, send=send_msearch)
+
+
+def msearch_queries(batches):
+    # One row per sub-query with its batch's timings next to it.
+    rows = []
+    for batch in batches:
+        for query in batch["queries"]:
+            rows.append(
+                {
+                    **query,
+                    "batch": batch["label"],
+                    "batch_size": batch["batch_size"],
+                    "batch_took": batch["took"],
+                    "batch_wall_ms": batch["wall_ms"],
+                    "started_at": batch["started_at"],
+                }
+            )
+    return rows
+
+
+def summarize_msearch(batches):
+    import pandas as pd
+
+    df = pd.DataFrame(msearch_queries(batches))
+    ok = df[df["error"].isna()]
+    by_batch = pd.DataFrame(batches)
+    ended = by_batch["started_at"] + by_batch["wall_ms"].fillna(0) / 1000
+    elapsed = (ended.max() - by_batch["started_at"].min()) or float("nan")
+    return {
+        "batch_size": int(by_batch["batch_size"].max()),
+        "batches": len(by_batch),
+        "queries": len(df),
+        "errors": int(df["error"].notna().sum()),
+        "throughput_qps": len(ok) / elapsed,
+        "took_p50": ok["took"].quantile(0.5),
+        "took_p99": ok["took"].quantile(0.99),
+        "batch_took_p50": by_batch["took"].quantile(0.5),
+        "batch_wall_ms_p50": by_batch["wall_ms"].quantile(0.5),
+        "batch_wall_ms_p99": by_batch["wall_ms"].quantile(0.99),
+        "request_bytes_mean": by_batch["request_bytes"].mean(),
+        "response_bytes_mean": by_batch["response_bytes"].mean(),
+        "decode_ms_p50": by_batch["decode_ms"].quantile(0.5),
+    }
+
+
+def run_schedule(es_host, index_name, schedule, max_workers=256, params=None):
+    # Open loop over `schedule`, an iterable of (offset seconds, label, body)
+    # in offset order. Requests are fired at their offset regardless of how
+    # many are still outstanding. `latency_ms` is measured from the scheduled
+    # send time so a stalled cluster is not hidden by coordinated omission.
+    in_flight = 0
+    lock = threading.Lock()
+
+    def fire(label, body, scheduled):
+        nonlocal in_flight
+        with lock:
+            in_flight += 1
+            current = in_flight
+        sample = send_query(es_host, index_name, body, label=label, params=params)
+        with lock:
+            in_flight -= 1
+        sample["in_flight"] = current
+        sample["schedule_lag_ms"] = (sample["started_at"] - scheduled) * 1000
+        sample["latency_ms"] = (time.time() - scheduled) * 1000
+        return sample
+
+    futures = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        start = time.time()
+        for offset, label, body in schedule:
+            scheduled = start + offset
+            delay = scheduled - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            futures.append(executor.submit(fire, label, to_body(body), scheduled))
+    return [future.result() for future in futures]
+
+
+def run_open_loop(
+    es_host,
+    index_name,
+    queries,
+    qps,
+    duration=None,
+    total=None,
+    max_workers=256,
+    params=None,
+):
+    # Cycles through `queries` at a fixed rate of `qps`.
+    if duration is None and total is None:
+        raise ValueError("open loop needs either duration or total")
+    if total is None:
+        total = int(qps * duration)
+    jobs = itertools.islice(_jobs(queries, total), total)
+    schedule = ((i / qps, label, body) for i, (label, body) in enumerate(jobs))
+    return run_schedule(es_host, index_name, schedule, max_workers, params)
+
+
+def summarize(samples):
+    import pandas as pd
+
+    df = pd.DataFrame(samples)
+    ok = df[df["error"].isna()]
+    elapsed = (df["started_at"].max() - df["started_at"].min()) or float("nan")
+    return {
+        "requests": len(df),
+        "errors": int(df["error"].notna().sum()),
+        "throughput_qps": len(ok) / elapsed,
+        "took_mean": ok["took"].mean(),
+        "took_p50": ok["took"].quantile(0.5),
+        "took_p99": ok["took"].quantile(0.99),
+        "wall_ms_mean": ok["wall_ms"].mean(),
+        "wall_ms_p50": ok["wall_ms"].quantile(0.5),
+        "wall_ms_p99": ok["wall_ms"].quantile(0.99),
+        "request_bytes_mean": ok["request_bytes"].mean(),
+        "response_bytes_mean": ok["response_bytes"].mean(),
+        "response_raw_bytes_mean": ok["response_raw_bytes"].mean(),
+        "ttfb_ms_p50": ok["ttfb_ms"].quantile(0.5),
+        "transfer_ms_p50": ok["transfer_ms"].quantile(0.5),
+        "decode_ms_p50": ok["decode_ms"].quantile(0.5),
+        # Client-side share of the end-to-end median that is not search time.
+        "payload_ms_p50": (ok["wall_ms"] + ok["decode_ms"] - ok["took"]).quantile(0.5),
+    }
+
+
+def build_queries(builder_names, keywords, category_weights=None, lean_source=False):
+    # Labels are the keyword, or builder/keyword when several builders are
+    # mixed. Category weights only go to builders that take them.
+    queries = {}
+    for name in builder_names:
+        builder = getattr(dsls, name)
+        args = ()
+        if "category_weights" in inspect.signature(builder).parameters:
+            args = (category_weights or {},)
+        if lean_source:
+            builder = dsls.lean(builder)
+        for keyword in keywords:
+            label = keyword if len(builder_names) == 1 else f"{name}/{keyword}"
+            queries[label] = builder(keyword, *args)
+    return queries
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Drive a dsls.py builder under load")
+    parser.add_argument("--host", default="http://search-searching.alpha.kr.krmt.io")
+    parser.add_argument("--index", default="ads-catalog-product-serving-v2")
+    parser.add_argument("--builder", nargs="+", default=["get_current_dsl"])
+    parser.add_argument("--keywords", nargs="+", required=True)
+    parser.add_argument("--category-weights", default=None, help="JSON object")
+    parser.add_argument(
+        "--mode", choices=["closed", "open", "msearch"], default="closed"
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        nargs="+",
+        default=[10],
+        help="sub-queries per _msearch; each size is run in turn",
+    )
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--qps", type=float, default=10)
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument(
+        "--filter-path",
+        default=None,
+        help=f"filter_path, or one of the presets {', '.join(FILTER_PATHS)}",
+    )
+    parser.add_argument(
+        "--lean-source",
+        action="store_true",
+        help="replace every _source list with dsls.LEAN_SOURCE",
+    )
+    parser.add_argument("--output", default="loadgen_samples.csv")
+    tracing.add_arguments(parser)
+    args = parser.parse_args()
+    tracer = tracing.from_args(args)
+
+    import pandas as pd
+
+    category_weights = None
+    if args.category_weights is not None:
+        category_weights = json.loads(args.category_weights)
+    queries = build_queries(
+        args.builder, args.keywords, category_weights, args.lean_source
+    )
+    params = filter_path_params(FILTER_PATHS.get(args.filter_path, args.filter_path))
+
+    if args.mode == "msearch":
+        rows = []
+        summaries = []
+        for batch_size in args.batch_size:
+            batches = run_msearch(
+                args.host,
+                args.index,
+                queries,
+                batch_size,
+                args.iterations,
+                args.concurrency,
+                params=params,
+            )
+            rows.extend(msearch_queries(batches))
+            summaries.append(summarize_msearch(batches))
+        pd.DataFrame(rows).to_csv(args.output, index=False)
+        print(pd.DataFrame(summaries).to_string(index=False))
+        tracing.finish(tracer, args.trace)
+        return
+    if args.mode == "closed":
+        samples = run_closed_loop(
+            args.host,
+            args.index,
+            queries,
+            args.iterations,
+            args.concurrency,
+            params=params,
+        )
+    else:
+        samples = run_open_loop(
+            args.host,
+            args.index,
+            queries,
+            args.qps,
+            duration=args.duration,
+            params=params,
+        )
+    pd.DataFrame(samples).to_csv(args.output, index=False)
+    print(json.dumps(summarize(samples), indent=2))
+    tracing.finish(tracer, args.trace)
+
+
+if __name__ == "__main__":
+    main()
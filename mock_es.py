@@ -0,0 +1,677 @@
+import argparse
+import asyncio
+import functools
+import gzip
+import hashlib
+import json
+import random
+import threading
+from urllib.parse import parse_qs, urlsplit
+
+# Each component is a lognormal (median in ms, sigma) that is added to `took`
+# once per occurrence of the matching DSL feature. `scale` components are
+# multiplied by the feature size divided by `per` instead.
+DEFAULT_LATENCY = {
+    "base": {"median": 6.0, "sigma": 0.35},
+    "script_score": {"median": 9.0, "sigma": 0.5},
+    "script_fields": {"median": 2.0, "sigma": 0.5},
+    "filter_functions": {"median": 0.3, "sigma": 0.4},
+    "terms_filter": {"median": 1.5, "sigma": 0.4, "per": 1000, "scale": True},
+    "terms_lookup": {"median": 0.8, "sigma": 0.4},
+    "aggregation": {"median": 4.0, "sigma": 0.4, "per": 10000, "scale": True},
+    "collapse": {"median": 2.5, "sigma": 0.4, "per": 10000, "scale": True},
+    "hits": {"median": 2.0, "sigma": 0.4, "per": 1000, "scale": True},
+}
+MAX_CATALOGS = 300
+CATEGORIES = [
+    "여성의류",
+    "남성패션/잡화",
+    "스포츠/레저",
+    "디지털기기",
+    "생활/주방",
+]
+
+
+def _walk(node):
+    if isinstance(node, dict):
+        yield node
+        for value in node.values():
+            yield from _walk(value)
+    elif isinstance(node, list):
+        for value in node:
+            yield from _walk(value)
+
+
+def dsl_features(dsl, documents=None):
+    # `documents` maps (index, id) to stored sources and resolves terms
+    # lookups; an unknown lookup document matches no ids, as in Elasticsearch.
+    documents = documents or {}
+    features = {
+        "script_score": 0,
+        "script_fields": 0,
+        "filter_functions": 0,
+        "terms_filter": 0,
+        "terms_lookup": 0,
+        "aggregation": 0,
+        "collapse": 0,
+        "hits": dsl.get("size", 10),
+        "keyword": "",
+    }
+    for node in _walk(dsl):
+        if "script_score" in node:
+            features["script_score"] += 1
+        for function in node.get("functions", []):
+            if "filter" in function:
+                features["filter_functions"] += 1
+        if "script_fields" in node:
+            features["script_fields"] += len(node["script_fields"])
+        terms = node.get("terms")
+        if isinstance(terms, dict) and "field" not in terms:
+            for value in terms.values():
+                if isinstance(value, list):
+                    features["terms_filter"] += len(value)
+                elif isinstance(value, dict) and "id" in value:
+                    features["terms_lookup"] += 1
+                    source = documents.get((value["index"], value["id"]), {})
+                    features["terms_filter"] += len(source.get(value["path"], []))
+        match = node.get("match")
+        if isinstance(match, dict) and "serving_title" in match:
+            features["keyword"] = match["serving_title"]["query"]
+    agg = dsl.get("aggs", {}).get("by_catalog_id")
+    if agg:
+        top_hits = agg.get("aggs", {}).get("top_catalog_hits", {}).get("top_hits", {})
+        features["aggregation"] = agg["terms"]["size"] * top_hits.get("size", 3)
+    if "collapse" in dsl:
+        inner_hits = dsl["collapse"].get("inner_hits", {})
+        features["collapse"] = features["hits"] * inner_hits.get("size", 3)
+    return features
+
+
+class LatencyModel:
+    def __init__(self, config=None, seed=None):
+        self.config = {**DEFAULT_LATENCY, **(config or {})}
+        self.rng = random.Random(seed)
+
+    def took(self, features):
+        total = 0.0
+        for name, component in self.config.items():
+            weight = 1 if name == "base" else features.get(name, 0)
+            if component.get("scale"):
+                weight = weight / component["per"]
+            if not weight:
+                continue
+            jitter = self.rng.lognormvariate(0, component["sigma"])
+            total += weight * component["median"] * jitter
+        return max(1, int(round(total)))
+
+
+def _source_doc(catalog_id, rank, fields, category):
+    doc = {
+        "original_id": f"{catalog_id}-{rank}",
+        "product_id": catalog_id * 100 + rank,
+        "catalog_id": catalog_id,
+        "title": f"product {rank} of catalog {catalog_id}",
+        "brand_name": "brand",
+        "image_url": f"https://img.example/{catalog_id}/{rank}.jpg",
+        "landing_url": f"https://shop.example/{catalog_id}/{rank}",
+        "price": 10000 + rank * 100,
+        "sale_price": 9000 + rank * 100,
+        "catalog_product_set_ids": [catalog_id],
+        "sale_price_effective_date_from": "2024-09-01T00:00:00Z",
+        "sale_price_effective_date_to": "2024-09-30T00:00:00Z",
+        "fast_text_category_name": category,
+    }
+    if fields is None:
+        return doc
+    return {field: doc[field] for field in fields if field in doc}
+
+
+def _hit(index_name, catalog_id, rank, score, fields, category):
+    hit = {"_index": index_name, "_id": f"{catalog_id}-{rank}", "_score": score}
+    if fields is not False:
+        hit["_source"] = _source_doc(catalog_id, rank, fields, category)
+    return hit
+
+
+def _top_hits(index_name, catalog_id, doc_count, spec, rng):
+    hits = []
+    for rank in range(min(doc_count, spec.get("size", 3))):
+        hit = _hit(
+            index_name,
+            catalog_id,
+            rank,
+            round(1.0 / (rank + 1), 4),
+            spec.get("_source"),
+            rng.choice(CATEGORIES),
+        )
+        if "script_fields" in spec:
+            hit["fields"] = {name: [0.0] for name in spec["script_fields"]}
+        hits.append(hit)
+    return {
+        "hits": {
+            "total": {"value": doc_count, "relation": "eq"},
+            "max_score": hits[0]["_score"] if hits else None,
+            "hits": hits,
+        }
+    }
+
+
+def _collapsed_hits(dsl, index_name, catalogs, rng):
+    # Collapsed on catalog_id and sorted by it, honouring search_after.
+    inner_hits = dsl["collapse"].get("inner_hits", {})
+    after = (dsl.get("search_after") or [0])[0]
+    page = [catalog for catalog in sorted(catalogs) if catalog[0] > after]
+    hits = []
+    for catalog_id, doc_count in page[: dsl.get("size", 10)]:
+        hit = _hit(index_name, catalog_id, 0, None, dsl.get("_source"), None)
+        hit["fields"] = {"catalog_id": [catalog_id]}
+        hit["sort"] = [catalog_id]
+        hit["inner_hits"] = {
+            inner_hits.get("name", "catalog_id"): _top_hits(
+                index_name, catalog_id, doc_count, inner_hits, rng
+            )
+        }
+        hits.append(hit)
+    return hits
+
+
+def search_response(dsl, index_name, took, features):
+    # The result set is derived from the keyword so repeated requests for the
+    # same DSL return the same catalogs, like a real index would.
+    seed = int(hashlib.md5(features["keyword"].encode()).hexdigest()[:8], 16)
+    rng = random.Random(seed)
+    n_catalogs = rng.randint(0, MAX_CATALOGS)
+    catalogs = sorted(
+        (
+            (catalog_id, rng.randint(1, 30))
+            for catalog_id in rng.sample(range(1, 10**6), n_catalogs)
+        ),
+        key=lambda catalog: (-catalog[1], catalog[0]),
+    )
+    total_hits = sum(doc_count for _, doc_count in catalogs)
+
+    response = {
+        "took": took,
+        "timed_out": False,
+        "_shards": {"total": 3, "successful": 3, "skipped": 0, "failed": 0},
+        "hits": {
+            "total": {"value": min(total_hits, 10000), "relation": "eq"},
+            "max_score": 1.0 if total_hits else None,
+            "hits": [],
+        },
+    }
+    fields = dsl.get("_source")
+    if "collapse" in dsl:
+        response["hits"]["hits"] = _collapsed_hits(dsl, index_name, catalogs, rng)
+    else:
+        for catalog_id, doc_count in catalogs[: dsl.get("size", 10)]:
+            response["hits"]["hits"].append(
+                _hit(index_name, catalog_id, 0, 1.0, fields, rng.choice(CATEGORIES))
+            )
+
+    agg = dsl.get("aggs", {}).get("by_catalog_id")
+    if agg:
+        top_hits = agg["aggs"]["top_catalog_hits"]["top_hits"]
+        buckets = []
+        for catalog_id, doc_count in catalogs[: agg["terms"]["size"]]:
+            buckets.append(
+                {
+                    "key": catalog_id,
+                    "doc_count": doc_count,
+                    "top_catalog_hits": _top_hits(
+                        index_name, catalog_id, doc_count, top_hits, rng
+                    ),
+                }
+            )
+        response["aggregations"] = {
+            "by_catalog_id": {
+                "doc_count_error_upper_bound": 0,
+                "sum_other_doc_count": 0,
+                "buckets": buckets,
+            }
+        }
+    return response
+
+
+def _node(kind, description, nanos, children=()):
+    return {
+        "type": kind,
+        "description": description,
+        "time_in_nanos": int(nanos),
+        "breakdown": {"score": int(nanos * 0.6), "next_doc": int(nanos * 0.3)},
+        "children": list(children),
+    }
+
+
+def profile_section(features, took, shards=3):
+    # Splits `took` over the same components the latency model charges for so
+    # es_profile can be exercised offline.
+    nanos = took * 1e6
+    weights = {
+        "match": 1.0,
+        "script": 2.0 * features["script_score"],
+        "terms": features["terms_filter"] / 1000,
+        "aggregation": features["aggregation"] / 10000,
+        "fetch": 0.5 + 0.5 * features["script_fields"],
+    }
+    total = sum(weights.values())
+    share = {name: nanos * weight / total for name, weight in weights.items()}
+    filters = [
+        _node("FieldExistsQuery", "catalog_product_set_ids", 1e4),
+        _node("TermQuery", "availability:IN_STOCK", 1e4),
+    ]
+    if features["terms_filter"]:
+        filters.append(_node("TermInSetQuery", "catalog_id:(...)", share["terms"]))
+    query = _node(
+        "BooleanQuery",
+        f"+serving_title:{features['keyword']}",
+        share["match"] + share["terms"],
+        [_node("TermQuery", f"serving_title:{features['keyword']}", share["match"])]
+        + filters,
+    )
+    if features["script_score"]:
+        query = _node(
+            "FunctionScoreQuery",
+            "function score",
+            query["time_in_nanos"] + share["script"],
+            [query],
+        )
+    aggregations = []
+    if features["aggregation"]:
+        aggregations.append(
+            _node(
+                "GlobalOrdinalsStringTermsAggregator",
+                "by_catalog_id",
+                share["aggregation"],
+                [
+                    _node(
+                        "TopHitsAggregator",
+                        "top_catalog_hits",
+                        share["aggregation"] * 0.7,
+                    )
+                ],
+            )
+        )
+    fetch_children = [_node("FetchSourcePhase", "", share["fetch"] * 0.5)]
+    if features["script_fields"]:
+        fetch_children.append(_node("ScriptFieldsPhase", "", share["fetch"] * 0.5))
+    return {
+        "shards": [
+            {
+                "id": f"[mock-node][ads][{shard}]",
+                "searches": [
+                    {
+                        "query": [query],
+                        "rewrite_time": 1000,
+                        "collector": [
+                            {
+                                "name": "SimpleTopScoreDocCollector",
+                                "reason": "search_top_hits",
+                                "time_in_nanos": int(share["match"] * 0.2),
+                            }
+                        ],
+                    }
+                ],
+                "aggregations": aggregations,
+                "fetch": _node("fetch", "", share["fetch"], fetch_children),
+            }
+            for shard in range(shards)
+        ]
+    }
+
+
+def _filter(node, patterns):
+    if isinstance(node, list):
+        items = [_filter(item, patterns) for item in node]
+        return [item for item in items if item not in (None, {}, [])]
+    if not isinstance(node, dict):
+        return None
+    result = {}
+    for key, value in node.items():
+        matched = [pattern for pattern in patterns if pattern[0] in ("*", key)]
+        if any(len(pattern) == 1 for pattern in matched):
+            result[key] = value
+        elif matched:
+            value = _filter(value, [pattern[1:] for pattern in matched])
+            if value not in (None, {}, []):
+                result[key] = value
+    return result
+
+
+def filter_path(response, paths):
+    # Dotted paths with `*` segments; lists are traversed transparently like
+    # Elasticsearch does. `took` is always kept because the cached rendering
+    # splices it back in front of the rest of the body.
+    if not paths:
+        return response
+    patterns = [path.split(".") for path in paths.split(",")] + [["took"]]
+    return _filter(response, patterns)
+
+
+class MockElasticsearch:
+    def __init__(
+        self,
+        latency=None,
+        seed=None,
+        sleep=True,
+        cache_size=1024,
+        compress=False,
+        search_threads=None,
+        queue_size=1000,
+        partial_rejections=False,
+    ):
+        self.model = LatencyModel(latency, seed)
+        self.sleep = sleep
+        # Like the search thread pool: at most `search_threads` searches run
+        # at once, up to `queue_size` wait, and _search beyond that is
+        # rejected with 429. None means unlimited concurrency.
+        self.slots = asyncio.Semaphore(search_threads) if search_threads else None
+        self.queue_size = queue_size
+        self.queued = 0
+        # Rejections as a 200 with a failed shard, which is how a loaded
+        # cluster usually reports them, instead of a 429.
+        self.partial_rejections = partial_rejections
+        # Like http.compression: gzip responses for clients that accept it.
+        self.compress = compress
+        self.requests = 0
+        self.documents = {}
+        # Counters behind _nodes/stats and <index>/_stats. The response cache
+        # below stands in for the shard request cache.
+        self.search_threads = search_threads
+        self.active = 0
+        self.completed = 0
+        self.rejected = 0
+        self.query_time_ms = 0
+        self.cleared_cache = {"hits": 0, "misses": 0}
+        # Building a 1000-bucket response in Python costs more than the
+        # search it imitates, so the body after `"took": ` is cached per DSL.
+        self._render = functools.lru_cache(maxsize=cache_size)(self._render_body)
+
+    def _render_body(self, index_name, body, paths=None):
+        dsl = json.loads(body or b"{}")
+        features = dsl_features(dsl, self.documents)
+        response = filter_path(search_response(dsl, index_name, 0, features), paths)
+        data = json.dumps(response).encode()
+        return features, data[len(b'{"took": 0') :]
+
+    async def search(self, index_name, body, paths=None):
+        if b'"profile": true' in body:
+            return await self.profile(index_name, body)
+        features, rest = self._render(index_name, body, paths)
+        took = self.model.took(features)
+        if self.slots is None:
+            await self._execute(took)
+        else:
+            self.queued += 1
+            try:
+                await self.slots.acquire()
+            finally:
+                self.queued -= 1
+            try:
+                await self._execute(took)
+            finally:
+                self.slots.release()
+        return took, b'{"took": %d' % took + rest
+
+    async def _execute(self, took):
+        self.active += 1
+        try:
+            if self.sleep:
+                await asyncio.sleep(took / 1000)
+        finally:
+            self.active -= 1
+            self.completed += 1
+            self.query_time_ms += took
+
+    def _indices_stats(self):
+        info = self._render.cache_info()
+        return {
+            "search": {
+                "query_total": self.completed,
+                "query_time_in_millis": self.query_time_ms,
+                "fetch_total": self.completed,
+                "fetch_time_in_millis": 0,
+            },
+            "query_cache": {"hit_count": 0, "miss_count": 0, "evictions": 0},
+            "request_cache": {
+                "hit_count": self.cleared_cache["hits"] + info.hits,
+                "miss_count": self.cleared_cache["misses"] + info.misses,
+                "evictions": 0,
+            },
+            "fielddata": {"memory_size_in_bytes": 0, "evictions": 0},
+        }
+
+    def node_stats(self):
+        collector = {"collection_count": 0, "collection_time_in_millis": 0}
+        node = {
+            "name": "mock-node",
+            "thread_pool": {
+                "search": {
+                    "threads": self.search_threads or 0,
+                    "queue": self.queued,
+                    "active": self.active,
+                    "rejected": self.rejected,
+                    "completed": self.completed,
+                }
+            },
+            "indices": self._indices_stats(),
+            "jvm": {
+                "mem": {"heap_used_percent": 0},
+                "gc": {"collectors": {"young": collector, "old": collector}},
+            },
+        }
+        return {"nodes": {"mock-node": node}}
+
+    def index_stats(self, index_name):
+        stats = self._indices_stats()
+        return {
+            "_all": {"primaries": stats, "total": stats},
+            "indices": {index_name: {"primaries": stats, "total": stats}},
+        }
+
+    async def profile(self, index_name, body):
+        dsl = json.loads(body)
+        features = dsl_features(dsl, self.documents)
+        took = self.model.took(features)
+        if self.sleep:
+            await asyncio.sleep(took / 1000)
+        response = search_response(dsl, index_name, took, features)
+        response["profile"] = profile_section(features, took)
+        return took, json.dumps(response).encode()
+
+    def partial_response(self, index_name, body, paths=None):
+        # One of the three shards was rejected; the others answered, quickly.
+        dsl = json.loads(body or b"{}")
+        features = dsl_features(dsl, self.documents)
+        response = search_response(dsl, index_name, 1, features)
+        response["_shards"].update(successful=2, failed=1)
+        response["_shards"]["failures"] = [
+            {
+                "shard": 0,
+                "index": index_name,
+                "reason": {"type": "es_rejected_execution_exception"},
+            }
+        ]
+        return filter_path(response, paths)
+
+    async def msearch(self, default_index, body, paths=None):
+        lines = [line for line in body.split(b"\n") if line.strip()]
+        pairs = list(zip(lines[::2], lines[1::2]))
+        responses = await asyncio.gather(
+            *(
+                self.search(json.loads(header).get("index", default_index), dsl)
+                for header, dsl in pairs
+            )
+        )
+        took = max((took for took, _ in responses), default=0)
+        items = b", ".join(data[:-1] + b', "status": 200}' for _, data in responses)
+        data = b'{"took": %d, "responses": [' % took + items + b"]}"
+        if paths:
+            # Like Elasticsearch, filter_path applies to the whole _msearch
+            # response rather than to each search in it.
+            data = json.dumps(filter_path(json.loads(data), paths)).encode()
+        return data
+
+    async def route(self, method, path, body):
+        url = urlsplit(path)
+        parts = [part for part in url.path.split("/") if part]
+        paths = parse_qs(url.query).get("filter_path", [None])[-1]
+        if not parts:
+            return 200, {"name": "mock-es", "version": {"number": "8.0.0-mock"}}
+        endpoint = parts[-1]
+        index_name = parts[0] if len(parts) > 1 else None
+        if endpoint == "_search":
+            if self.slots is not None and self.queued >= self.queue_size:
+                self.rejected += 1
+                if self.partial_rejections:
+                    return 200, self.partial_response(index_name, body, paths)
+                error = {"type": "es_rejected_execution_exception"}
+                return 429, {"error": error, "status": 429}
+            _, data = await self.search(index_name, body, paths)
+            return 200, data
+        if endpoint == "_msearch":
+            return 200, await self.msearch(index_name, body, paths)
+        if endpoint == "_count":
+            dsl = json.loads(body)
+            features = dsl_features(dsl, self.documents)
+            response = search_response(dsl, index_name, 0, features)
+            return 200, {"count": response["hits"]["total"]["value"]}
+        if len(parts) == 3 and parts[1] == "_doc" and method in ("PUT", "POST"):
+            self.documents[parts[0], parts[2]] = json.loads(body)
+            # Cached responses may have resolved a lookup against the old doc.
+            info = self._render.cache_info()
+            self.cleared_cache["hits"] += info.hits
+            self.cleared_cache["misses"] += info.misses
+            self._render.cache_clear()
+            return 200, {"_index": parts[0], "_id": parts[2], "result": "updated"}
+        if parts[:2] == ["_nodes", "stats"]:
+            return 200, self.node_stats()
+        if len(parts) >= 2 and parts[1] == "_stats":
+            return 200, self.index_stats(parts[0])
+        if endpoint == "_refresh":
+            return 200, {"_shards": {"failed": 0}}
+        return 404, {"error": f"no handler for {method} {path}", "status": 404}
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode().split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, value = line.decode().split(":", 1)
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                self.requests += 1
+                try:
+                    status, payload = await self.route(method, path, body)
+                except (ValueError, KeyError) as e:
+                    status, payload = 400, {"error": repr(e), "status": 400}
+                data = payload
+                if not isinstance(payload, bytes):
+                    data = json.dumps(payload).encode()
+                encoding = ""
+                if self.compress and "gzip" in headers.get("accept-encoding", ""):
+                    data = gzip.compress(data, compresslevel=1)
+                    encoding = "Content-Encoding: gzip\r\n"
+                writer.write(
+                    f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\n"
+                    "Content-Type: application/json\r\n"
+                    f"{encoding}Content-Length: {len(data)}\r\n\r\n".encode()
+                    + data
+                )
+                await writer.drain()
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host="127.0.0.1", port=9200):
+        return await asyncio.start_server(self.handle, host, port)
+
+
+def start_in_thread(host="127.0.0.1", port=0, **kwargs):
+    # Runs the server on its own event loop so synchronous code such as
+    # loadgen can talk to it. Returns the base URL and a stop function.
+    mock = MockElasticsearch(**kwargs)
+    loop = asyncio.new_event_loop()
+    started = threading.Event()
+    state = {}
+
+    def run():
+        asyncio.set_event_loop(loop)
+        state["server"] = loop.run_until_complete(mock.serve(host, port))
+        started.set()
+        loop.run_forever()
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    started.wait()
+    bound_port = state["server"].sockets[0].getsockname()[1]
+
+    async def shutdown():
+        state["server"].close()
+        current = asyncio.current_task()
+        tasks = [task for task in asyncio.all_tasks() if task is not current]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stop():
+        asyncio.run_coroutine_threadsafe(shutdown(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+
+    return f"http://{host}:{bound_port}", stop
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local Elasticsearch stand-in")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9200)
+    parser.add_argument("--latency-config", help="JSON overriding DEFAULT_LATENCY")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--no-sleep", action="store_true")
+    parser.add_argument("--compress", action="store_true", help="gzip responses")
+    parser.add_argument("--search-threads", type=int, default=None)
+    parser.add_argument("--queue-size", type=int, default=1000)
+    parser.add_argument(
+        "--partial-rejections",
+        action="store_true",
+        help="reject as a 200 with a failed shard instead of a 429",
+    )
+    args = parser.parse_args()
+
+    latency = None
+    if args.latency_config:
+        with open(args.latency_config) as f:
+            latency = json.load(f)
+    mock = MockElasticsearch(
+        latency,
+        args.seed,
+        sleep=not args.no_sleep,
+        compress=args.compress,
+        search_threads=args.search_threads,
+        queue_size=args.queue_size,
+        partial_rejections=args.partial_rejections,
+    )
+
+    async def run():
+        server = await mock.serve(args.host, args.port)
+        print(f"mock elasticsearch listening on http://{args.host}:{args.port}")
+        async with server:
+            await server.serve_forever()
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from result_store import ResultStore
+
+# `took` is whole milliseconds and can be 0; logs are taken of at least this.
+MIN_TOOK_MS = 0.5
+FEATURES = [
+    "log_alpha",
+    "log_alpha_asis",
+    "cost_script_score_functions",
+    "cost_random_score_functions",
+    "cost_filter_functions",
+    "log_terms_values",
+    "log_body_bytes",
+]
+
+
+def _log(values):
+    return np.log(np.maximum(values.astype(float), MIN_TOOK_MS))
+
+
+def training_frame(cells, metric="took_trimmed_mean", baseline="asis"):
+    # One row per (keyword, variant) measured on alpha, with the prod
+    # measurement when there is one. Static cost features come from the
+    # alpha cell; they are the same DSL on both clusters.
+    if cells.empty or "status" not in cells:
+        raise ValueError("no measured cells")
+    cells = cells[cells["status"] == "ok"]
+    alpha = cells[cells["cluster"] == "alpha"].set_index(["keyword", "variant"])
+    prod = cells[cells["cluster"] == "prod"].set_index(["keyword", "variant"])
+    if baseline not in alpha.index.get_level_values("variant"):
+        raise ValueError(f"no alpha {baseline} cells to predict from")
+    frame = alpha[[c for c in alpha.columns if c.startswith("cost_")]].copy()
+    frame["alpha"] = alpha[metric]
+    frame["prod"] = prod[metric].reindex(frame.index)
+    frame = frame.reset_index()
+    frame["alpha_asis"] = frame["keyword"].map(
+        alpha[metric].xs(baseline, level="variant")
+    )
+    frame["prod_asis"] = np.nan
+    if baseline in prod.index.get_level_values("variant"):
+        frame["prod_asis"] = frame["keyword"].map(
+            prod[metric].xs(baseline, level="variant")
+        )
+
+    for column in ["alpha", "alpha_asis", "prod_asis"]:
+        frame[f"log_{column}"] = _log(frame[column])
+    for name in FEATURES:
+        if name.startswith("cost_") and name not in frame:
+            frame[name] = 0
+    frame["log_terms_values"] = np.log1p(frame.get("cost_terms_values", 0))
+    frame["log_body_bytes"] = np.log(frame.get("cost_body_bytes", 1))
+    return frame
+
+
+def ratio_prediction(frame):
+    # The per-keyword estimate results.csv has always used:
+    # prod_asis * alpha_variant / alpha_asis, NaN instead of a division by 0.
+    alpha_asis = frame["alpha_asis"].where(frame["alpha_asis"] > 0)
+    return frame["prod_asis"] * frame["alpha"] / alpha_asis
+
+
+class Calibration:
+    # Ridge fit of log prod latency on standardized `features`; the static
+    # features are nearly one-hot per variant, so plain least squares
+    # extrapolates wildly. Prediction intervals are jackknife conformal
+    # intervals from the leave-one-out residuals, so they need no normality
+    # assumption and no scipy.
+
+    def __init__(self, features=FEATURES, alpha=0.1, ridge=1.0):
+        self.features = list(features)
+        self.alpha = alpha
+        self.ridge = ridge
+        self.coef = None
+        self.width = None
+
+    def _design(self, frame):
+        x = np.column_stack(
+            [frame[name].to_numpy(dtype=float) for name in self.features]
+        )
+        if self.coef is None:
+            self.center = x.mean(axis=0)
+            self.scale = np.where(x.std(axis=0) > 0, x.std(axis=0), 1.0)
+        x = (x - self.center) / self.scale
+        return np.column_stack([np.ones(len(frame)), x])
+
+    def fit(self, frame):
+        frame = frame.dropna(subset=["prod", *self.features])
+        if len(frame) <= len(self.features) + 1:
+            raise ValueError(
+                f"{len(frame)} rows with prod measurements are too few to fit "
+                f"{len(self.features)} features"
+            )
+        self.coef = None
+        x = self._design(frame)
+        y = _log(frame["prod"].to_numpy())
+        penalty = self.ridge * np.eye(x.shape[1])
+        penalty[0, 0] = 0
+        inverse = np.linalg.solve(x.T @ x + penalty, x.T)
+        self.coef = inverse @ y
+        leverage = np.einsum("ij,ji->i", x, inverse)
+        residuals = (y - x @ self.coef) / np.maximum(1 - leverage, 1e-6)
+        n = len(residuals)
+        level = min(1.0, np.ceil((n + 1) * (1 - self.alpha)) / n)
+        self.width = float(np.quantile(np.abs(residuals), level))
+        return self
+
+    def predict(self, frame):
+        log_prediction = self._design(frame) @ self.coef
+        return pd.DataFrame(
+            {
+                "prediction": np.exp(log_prediction),
+                "low": np.exp(log_prediction - self.width),
+                "high": np.exp(log_prediction + self.width),
+            },
+            index=frame.index,
+        )
+
+    def coefficients(self):
+        # Per standard deviation of each feature.
+        return dict(zip(["intercept", *self.features], self.coef))
+
+
+def validate(frame, features=FEATURES, alpha=0.1, folds=5, seed=None):
+    # Grouped k-fold over keywords with a prod measurement: every keyword is
+    # predicted by a model that never saw it, next to the ratio estimate.
+    measured = frame.dropna(subset=["prod", *features])
+    keywords = measured["keyword"].unique()
+    rng = np.random.default_rng(seed)
+    fold_of = dict(zip(rng.permutation(keywords), np.arange(len(keywords)) % folds))
+    fold = measured["keyword"].map(fold_of)
+    parts = []
+    for k in range(folds):
+        test = measured[fold == k]
+        if test.empty:
+            continue
+        model = Calibration(features, alpha).fit(measured[fold != k])
+        parts.append(pd.concat([test, model.predict(test)], axis=1))
+    result = pd.concat(parts)
+    result["ratio_prediction"] = ratio_prediction(result)
+    result["model_ape"] = (result["prediction"] - result["prod"]).abs() / result["prod"]
+    result["ratio_ape"] = (
+        (result["ratio_prediction"] - result["prod"]).abs() / result["prod"]
+    )
+    result["covered"] = result["prod"].between(result["low"], result["high"])
+    summary = result.groupby("variant").agg(
+        n=("prod", "size"),
+        model_mape=("model_ape", "mean"),
+        model_median_ape=("model_ape", "median"),
+        ratio_mape=("ratio_ape", "mean"),
+        ratio_median_ape=("ratio_ape", "median"),
+        interval_coverage=("covered", "mean"),
+    )
+    return result, summary.reset_index()
+
+
+def predict_prod(cells, metric="took_trimmed_mean", features=FEATURES, alpha=0.1):
+    # Fit on every keyword with a prod measurement and predict all rows,
+    # including the ones prod never ran.
+    frame = training_frame(cells, metric)
+    model = Calibration(features, alpha).fit(frame)
+    predictable = frame.dropna(subset=features)
+    result = pd.concat([predictable, model.predict(predictable)], axis=1)
+    result["ratio_prediction"] = ratio_prediction(result)
+    return result, model
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Predict prod latency from alpha")
+    parser.add_argument("--store", default="results_category_match")
+    parser.add_argument("--metric", default="took_trimmed_mean")
+    parser.add_argument("--alpha", type=float, default=0.1, help="1 - coverage")
+    parser.add_argument("--folds", type=int, default=5)
+    parser.add_argument(
+        "--prod-anchor",
+        action="store_true",
+        help="also use each keyword's prod asis measurement as a feature",
+    )
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--output", default="predictions.csv")
+    parser.add_argument("--validation-output", default="prediction_validation.csv")
+    args = parser.parse_args()
+
+    features = FEATURES + (["log_prod_asis"] if args.prod_anchor else [])
+    cells = ResultStore(args.store).cells()
+    predictions, model = predict_prod(cells, args.metric, features, args.alpha)
+    columns = ["keyword", "variant", "alpha", "prod", "prediction", "low", "high"]
+    predictions[columns + ["ratio_prediction"]].to_csv(args.output, index=False)
+
+    frame = training_frame(cells, args.metric)
+    _, summary = validate(frame, features, args.alpha, args.folds, args.seed)
+    summary.to_csv(args.validation_output, index=False)
+    for name, value in model.coefficients().items():
+        print(f"{name:>32} {value: .4f}")
+    print(f"interval: x/÷ {np.exp(model.width):.3f} at {1 - args.alpha:.0%}")
+    print(summary.to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
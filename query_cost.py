@@ -0,0 +1,240 @@
+import argparse
+import inspect
+import json
+import sys
+from collections import Counter
+
+import pandas as pd
+
+import dsls
+import loadgen
+
+# Lint thresholds. A DSL with any warning should be measured on alpha before
+# it is considered for prod.
+THRESHOLDS = {
+    "terms_values": 1024,
+    "hits_materialized": 1000,
+    "source_fields": 8,
+    "script_field_invocations": 1000,
+    "body_bytes": 64 * 1024,
+}
+
+
+def _walk(node):
+    if isinstance(node, dict):
+        yield node
+        for value in node.values():
+            yield from _walk(value)
+    elif isinstance(node, list):
+        for value in node:
+            yield from _walk(value)
+
+
+def _sections(dsl):
+    # (hits, _source, script_fields) for every place that materializes
+    # documents: the top-level hits, collapse inner_hits and top_hits
+    # aggregations nested under bucket aggregations.
+    size = dsl.get("size", 10)
+    sections = [(size, dsl.get("_source"), dsl.get("script_fields", {}))]
+    inner_hits = dsl.get("collapse", {}).get("inner_hits")
+    if inner_hits:
+        sections.append(
+            (
+                size * inner_hits.get("size", 3),
+                inner_hits.get("_source"),
+                inner_hits.get("script_fields", {}),
+            )
+        )
+    buckets = []
+
+    def walk_aggs(aggs, parent_buckets):
+        for agg in aggs.values():
+            count = parent_buckets
+            if "terms" in agg:
+                count = parent_buckets * agg["terms"].get("size", 10)
+                buckets.append(count)
+            if "top_hits" in agg:
+                top_hits = agg["top_hits"]
+                sections.append(
+                    (
+                        parent_buckets * top_hits.get("size", 3),
+                        top_hits.get("_source"),
+                        top_hits.get("script_fields", {}),
+                    )
+                )
+            walk_aggs(agg.get("aggs", agg.get("aggregations", {})), count)
+
+    walk_aggs(dsl.get("aggs", dsl.get("aggregations", {})), 1)
+    return sections, buckets
+
+
+def analyze(dsl):
+    # Static cost features of a search body (dict, or bytes as sent).
+    if isinstance(dsl, (bytes, str)):
+        body = dsl.encode() if isinstance(dsl, str) else dsl
+        dsl = json.loads(body)
+    else:
+        body = loadgen.to_body(dsl)
+
+    scripts = Counter()
+    features = {
+        "body_bytes": len(body),
+        "script_score_functions": 0,
+        "random_score_functions": 0,
+        "filter_functions": 0,
+        "terms_values": 0,
+        "terms_lookups": 0,
+    }
+    for node in _walk(dsl):
+        if "script_score" in node:
+            features["script_score_functions"] += 1
+        if "random_score" in node:
+            features["random_score_functions"] += 1
+        for function in node.get("functions", []):
+            if "filter" in function:
+                features["filter_functions"] += 1
+        script = node.get("script")
+        if isinstance(script, dict) and "source" in script:
+            scripts[script["source"]] += 1
+        elif isinstance(script, str):
+            scripts[script] += 1
+        terms = node.get("terms")
+        if isinstance(terms, dict) and "field" not in terms:
+            for value in terms.values():
+                if isinstance(value, list):
+                    features["terms_values"] += len(value)
+                elif isinstance(value, dict) and "id" in value:
+                    features["terms_lookups"] += 1
+
+    sections, buckets = _sections(dsl)
+    # Scoring scripts run once per matching document, before any size limit.
+    features["script_invocations_per_doc"] = features["script_score_functions"]
+    features["scripts"] = sum(scripts.values())
+    features["duplicate_scripts"] = sum(n - 1 for n in scripts.values())
+    features["agg_buckets"] = sum(buckets)
+    features["hits_materialized"] = sum(hits for hits, _, _ in sections)
+    features["script_field_invocations"] = sum(
+        hits * len(script_fields) for hits, _, script_fields in sections
+    )
+    # `_source` width: a list is its length, False is 0 and anything else
+    # (missing or true) returns every field, counted as None.
+    widths = [
+        len(source) if isinstance(source, list) else (0 if source is False else None)
+        for _, source, _ in sections
+    ]
+    features["source_unrestricted"] = any(
+        width is None and hits for (hits, _, _), width in zip(sections, widths)
+    )
+    features["source_fields"] = max((w for w in widths if w is not None), default=0)
+    features["source_values_materialized"] = sum(
+        hits * width
+        for (hits, _, _), width in zip(sections, widths)
+        if width is not None
+    )
+    features["track_total_hits"] = dsl.get("track_total_hits", True) is True
+    return features
+
+
+def lint(features):
+    warnings = []
+
+    def warn(rule, message):
+        warnings.append({"rule": rule, "message": message})
+
+    if features["duplicate_scripts"]:
+        warn(
+            "duplicate_script",
+            f"{features['duplicate_scripts']} script(s) repeated in one query; "
+            "compute once (e.g. sort on _score) instead",
+        )
+    for name in ["terms_values", "hits_materialized", "script_field_invocations"]:
+        if features[name] > THRESHOLDS[name]:
+            warn(name, f"{name} = {features[name]} > {THRESHOLDS[name]}")
+    if (
+        features["source_fields"] > THRESHOLDS["source_fields"]
+        and features["hits_materialized"] > THRESHOLDS["hits_materialized"]
+    ):
+        warn(
+            "wide_source",
+            f"{features['source_fields']} _source fields on "
+            f"{features['hits_materialized']} hits",
+        )
+    if features["source_unrestricted"]:
+        warn("source_unrestricted", "hits return the whole _source")
+    if features["body_bytes"] > THRESHOLDS["body_bytes"]:
+        warn("body_bytes", f"{features['body_bytes']} byte request body")
+    return warnings
+
+
+def cost_columns(dsl, prefix="cost_"):
+    # Flat features for ResultStore.write(**extra), so static cost lands in
+    # the same cell rows as the measured latency.
+    features = analyze(dsl)
+    features["lint_warnings"] = ",".join(w["rule"] for w in lint(features))
+    return {f"{prefix}{name}": value for name, value in features.items()}
+
+
+def latency_table(cells):
+    # Cost features, and cluster_metrics deltas when they were collected,
+    # next to the measured latency stats of every cell.
+    key = ["keyword", "cluster", "variant"]
+    if cells.empty or "status" not in cells:
+        return pd.DataFrame(columns=key)
+    cells = cells[cells["status"] == "ok"]
+    cost = [c for c in cells.columns if c.startswith(("cost_", "node_"))]
+    stats = [c for c in cells.columns if c.startswith(("took_", "wall_ms_"))]
+    return cells[key + cost + stats].reset_index(drop=True)
+
+
+def main():
+    builders = [
+        name
+        for name in dir(dsls)
+        if name.startswith("get_") and name.endswith("_dsl")
+    ]
+    parser = argparse.ArgumentParser(description="Static cost and lint of dsls.py")
+    parser.add_argument("--builder", nargs="+", default=builders)
+    parser.add_argument("--keyword", default="나이키")
+    parser.add_argument("--category-weights", default='{"여성의류": 1}')
+    parser.add_argument("--catalog-ids", type=int, default=2000)
+    parser.add_argument("--lean-source", action="store_true")
+    parser.add_argument("--fail-on-warning", action="store_true")
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+
+    category_weights = json.loads(args.category_weights)
+    queries = {}
+    for name in args.builder:
+        # Builders with extra positional arguments get representative ones.
+        builder = getattr(dsls, name)
+        parameters = inspect.signature(builder).parameters
+        builder_args = ()
+        if "catalog_ids" in parameters:
+            builder_args = (list(range(args.catalog_ids)),)
+        elif "lookup_index" in parameters:
+            builder_args = ("catalog-id-lookup", "1")
+        elif "category_weights" in parameters:
+            builder_args = (category_weights,)
+        if args.lean_source:
+            builder = dsls.lean(builder)
+        queries[name] = builder(args.keyword, *builder_args)
+
+    rows = []
+    failed = False
+    for name, query in queries.items():
+        features = analyze(query)
+        warnings = lint(features)
+        failed = failed or bool(warnings)
+        rows.append({"builder": name, **features, "warnings": len(warnings)})
+        for warning in warnings:
+            print(f"{name}: {warning['rule']}: {warning['message']}")
+    table = pd.DataFrame(rows)
+    if args.output:
+        table.to_csv(args.output, index=False)
+    print(table.set_index("builder").T.to_string())
+    if args.fail_on_warning and failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+import argparse
+
+import numpy as np
+import pandas as pd
+
+import experiment
+import loadgen
+import workload_cache
+import workloads
+from latency_stats import PERCENTILES
+
+TRACE_SQL = """
+SELECT
+    requestedAt,
+    queryText
+FROM
+    `karrotmarket.kotisaari_data.stream_mediation-request_v1`
+WHERE
+    requestedAt BETWEEN TIMESTAMP("{start}")
+    AND TIMESTAMP_ADD(TIMESTAMP("{start}"), INTERVAL {minutes} MINUTE)
+    AND queryText IS NOT NULL
+ORDER BY
+    requestedAt
+"""
+
+
+def weighted_quantile(values, weights, q):
+    # Each value sits at the midpoint of its share of the total weight.
+    values = np.asarray(values, dtype=np.float64)
+    weights = np.asarray(weights, dtype=np.float64)
+    order = np.argsort(values)
+    values, weights = values[order], weights[order]
+    positions = (np.cumsum(weights) - weights / 2) / weights.sum()
+    return np.interp(np.asarray(q) / 100, positions, values)
+
+
+def weighted_describe(values, weights):
+    values = np.asarray(values, dtype=np.float64)
+    weights = np.asarray(weights, dtype=np.float64)
+    keep = ~np.isnan(values) & (weights > 0)
+    values, weights = values[keep], weights[keep]
+    if not len(values):
+        return {"count": 0}
+    quantiles = weighted_quantile(values, weights, PERCENTILES)
+    row = {"count": len(values), "mean": np.average(values, weights=weights)}
+    row.update({f"p{p}": float(v) for p, v in zip(PERCENTILES, quantiles)})
+    return row
+
+
+def sample_schedule(keywords, qc, requests, qps, seed=None):
+    # Keywords drawn in proportion to qc with Poisson arrivals at `qps`.
+    rng = np.random.default_rng(seed)
+    qc = np.asarray(qc, dtype=np.float64)
+    chosen = rng.choice(np.asarray(keywords, dtype=object), requests, p=qc / qc.sum())
+    gaps = rng.exponential(1 / qps, requests)
+    offsets = np.concatenate([[0.0], np.cumsum(gaps)[:-1]])
+    return list(zip(offsets, chosen))
+
+
+def trace_schedule(trace, speedup=1.0, limit=None):
+    # Real inter-arrival times from stream_mediation-request_v1, optionally
+    # compressed by `speedup`.
+    trace = trace.sort_values("requestedAt").head(limit)
+    requested_at = pd.to_datetime(trace["requestedAt"])
+    offsets = (requested_at - requested_at.min()).dt.total_seconds() / speedup
+    return list(zip(offsets, trace["queryText"]))
+
+
+def replay(es_host, index_name, schedule, body, max_workers=256):
+    # `body(keyword)` builds the DSL; every variant replays the same
+    # schedule so their results are paired request by request.
+    bodies = {}
+    jobs = []
+    for offset, keyword in schedule:
+        if keyword not in bodies:
+            bodies[keyword] = body(keyword)
+        jobs.append((offset, keyword, bodies[keyword]))
+    return loadgen.run_schedule(es_host, index_name, jobs, max_workers)
+
+
+def replay_summary(samples):
+    # Replayed traffic already has the production keyword mix, so plain
+    # per-request statistics are the traffic-weighted ones.
+    df = pd.DataFrame(samples)
+    ok = df[df["error"].isna()]
+    scheduled = df["started_at"] - df["schedule_lag_ms"] / 1000
+    elapsed = (scheduled + df["latency_ms"] / 1000).max() - scheduled.min()
+    row = {
+        "requests": len(df),
+        "keywords": df["label"].nunique(),
+        "error_rate": float(df["error"].notna().mean()),
+        "throughput_qps": len(ok) / elapsed if elapsed > 0 else float("nan"),
+    }
+    for metric in ["took", "latency_ms"]:
+        stats = weighted_describe(ok[metric], np.ones(len(ok)))
+        row.update({f"{metric}_{name}": value for name, value in stats.items()})
+    return row
+
+
+def reweight(samples, qc):
+    # Traffic-weighted view of a uniform run: every sample of a keyword gets
+    # qc / (that cell's sample count), so each keyword counts by its traffic
+    # no matter how many iterations it had. Keywords without qc are dropped.
+    df = samples.dropna(subset=["took"])
+    df = df[df["keyword"].isin(qc.index)]
+    cell = ["keyword", "cluster", "variant"]
+    weights = df["keyword"].map(qc) / df.groupby(cell)["took"].transform("size")
+    rows = []
+    for (cluster, variant), group in df.groupby(["cluster", "variant"]):
+        row = {"cluster": cluster, "variant": variant}
+        weighted = weighted_describe(group["took"], weights[group.index])
+        uniform = weighted_describe(group["took"], np.ones(len(group)))
+        row.update({f"weighted_took_{k}": v for k, v in weighted.items()})
+        row.update({f"uniform_took_{k}": v for k, v in uniform.items()})
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+
+def main():
+    from result_store import ResultStore
+
+    parser = argparse.ArgumentParser(description="Traffic-weighted workload replay")
+    parser.add_argument(
+        "--mode", choices=["sample", "trace", "store"], default="sample"
+    )
+    parser.add_argument("--host", default="http://search-searching.alpha.kr.krmt.io")
+    parser.add_argument("--index", default="ads-catalog-product-serving-v2")
+    experiment.add_variant_arguments(parser, ["asis", "idsort"])
+    parser.add_argument("--requests", type=int, default=2000, help="sample mode")
+    parser.add_argument("--qps", type=float, default=20, help="sample mode")
+    parser.add_argument("--trace-start", default="2024-09-02 12:00:00")
+    parser.add_argument("--trace-minutes", type=int, default=10)
+    parser.add_argument("--trace-limit", type=int, default=None)
+    parser.add_argument("--speedup", type=float, default=1.0)
+    parser.add_argument("--max-workers", type=int, default=256)
+    parser.add_argument(
+        "--store", default="results_category_match", help="store mode"
+    )
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--output", default="replay_summary.csv")
+    parser.add_argument("--samples-output", default="replay_samples.csv")
+    workload_cache.add_arguments(parser)
+    args = parser.parse_args()
+
+    cache = workload_cache.from_args(args)
+    df = workload_cache.load_category_workload(
+        cache, workloads.CATEGORY_SQL, args.run_date
+    )
+    qc = df.set_index("queryText")["qc"]
+
+    if args.mode == "store":
+        summary = reweight(ResultStore(args.store).samples(), qc)
+        summary.to_csv(args.output, index=False)
+        print(summary.to_string(index=False))
+        return
+
+    if args.mode == "sample":
+        schedule = sample_schedule(
+            df["queryText"], df["qc"], args.requests, args.qps, args.seed
+        )
+    else:
+        sql = TRACE_SQL.format(start=args.trace_start, minutes=args.trace_minutes)
+        trace = cache.read_gbq(sql, args.run_date)
+        schedule = trace_schedule(trace, args.speedup, args.trace_limit)
+
+    # Trace keywords outside the workload have no category weights.
+    weights = dict(zip(df["queryText"], df["hoian_category_name"]))
+    variants = experiment.named_variants(args.variants, args.spec, args.seed)
+    renderers = experiment.variant_renderers(variants, cache, args.run_date)
+    rows = []
+    samples = []
+    for variant, render in renderers.items():
+        variant_samples = replay(
+            args.host,
+            args.index,
+            schedule,
+            lambda keyword: render(keyword, weights.get(keyword, {})),
+            args.max_workers,
+        )
+        rows.append({"variant": variant, **replay_summary(variant_samples)})
+        samples.extend({"variant": variant, **s} for s in variant_samples)
+
+    summary = pd.DataFrame(rows)
+    summary.to_csv(args.output, index=False)
+    pd.DataFrame(samples).to_csv(args.samples_output, index=False)
+    print(summary.to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+import os
+import time
+import uuid
+
+import numpy as np
+import pandas as pd
+
+from latency_stats import STATS
+
+CELL_KEY = ["keyword", "cluster", "variant"]
+
+
+def _parts(directory):
+    return [name for name in os.listdir(directory) if name.endswith(".parquet")]
+
+
+class ResultStore:
+    # Append-only Parquet dataset. Every measured cell is written as its own
+    # part file under samples/ (raw per-iteration rows) and then cells/ (one
+    # summary row), each via rename so a crash never leaves a torn file.
+    # A cell counts as measured once its cells/ part exists.
+
+    def __init__(self, path):
+        self.path = path
+        self.cells_dir = os.path.join(path, "cells")
+        self.samples_dir = os.path.join(path, "samples")
+        os.makedirs(self.cells_dir, exist_ok=True)
+        os.makedirs(self.samples_dir, exist_ok=True)
+
+    def is_empty(self):
+        return not _parts(self.cells_dir)
+
+    def _write(self, directory, df, cell_id):
+        name = f"part-{int(time.time() * 1000)}-{cell_id}.parquet"
+        tmp = os.path.join(directory, f".{name}.tmp")
+        df.to_parquet(tmp, index=False)
+        os.replace(tmp, os.path.join(directory, name))
+
+    def write(self, keyword, cluster, variant, stats, **extra):
+        # `stats` is a LatencySamples, or None when the cell failed. Cells with
+        # failed requests are recorded but not treated as done, so --resume
+        # retries them.
+        cell_id = uuid.uuid4().hex
+        key = {"keyword": keyword, "cluster": cluster, "variant": variant}
+        if stats is not None and len(stats):
+            samples = pd.DataFrame(
+                {
+                    "iteration": range(len(stats)),
+                    "took": stats.took,
+                    "wall_ms": stats.wall_ms,
+                    "started_at": stats.started_at,
+                }
+            )
+            samples = samples.assign(**key, **extra, cell_id=cell_id)
+            self._write(self.samples_dir, samples, cell_id)
+        row = {**key, **extra, "cell_id": cell_id}
+        row["status"] = "ok" if stats is not None and not stats.errors else "error"
+        if stats is not None:
+            row.update(errors=stats.errors, **stats.row())
+        row["written_at"] = time.time()
+        self._write(self.cells_dir, pd.DataFrame([row]), cell_id)
+
+    def _read(self, directory, columns=None):
+        # Parts are read one by one and concatenated because error rows and
+        # rows from different modes do not share a schema, and a dataset read
+        # would take the columns of whichever part it opens first.
+        parts = sorted(_parts(directory))
+        if not parts:
+            return pd.DataFrame()
+        return pd.concat(
+            [
+                pd.read_parquet(os.path.join(directory, part), columns=columns)
+                for part in parts
+            ],
+            ignore_index=True,
+        )
+
+    def append(self, table, rows):
+        # Free-form side tables (e.g. comparisons) stored next to the cells.
+        if not rows:
+            return
+        directory = os.path.join(self.path, table)
+        os.makedirs(directory, exist_ok=True)
+        self._write(directory, pd.DataFrame(rows), uuid.uuid4().hex)
+
+    def tables(self):
+        return sorted(
+            name
+            for name in os.listdir(self.path)
+            if name not in ("cells", "samples")
+            and os.path.isdir(os.path.join(self.path, name))
+        )
+
+    def read(self, table):
+        directory = os.path.join(self.path, table)
+        if not os.path.isdir(directory):
+            return pd.DataFrame()
+        return self._read(directory)
+
+    def cells(self):
+        # Latest write wins when a cell was retried.
+        df = self._read(self.cells_dir)
+        if df.empty:
+            return df
+        df = df.sort_values("written_at").drop_duplicates(CELL_KEY, keep="last")
+        return df.reset_index(drop=True)
+
+    def samples(self, columns=None):
+        # Only samples belonging to the latest write of each cell. Passing
+        # `columns` skips the per-cell extra columns repeated on every row.
+        if columns is not None:
+            columns = list(dict.fromkeys([*columns, "cell_id"]))
+        df = self._read(self.samples_dir, columns)
+        if df.empty:
+            return df
+        return df[df["cell_id"].isin(self.cells()["cell_id"])].reset_index(drop=True)
+
+    def done(self):
+        df = self.cells()
+        if df.empty:
+            return set()
+        ok = df[df["status"] == "ok"]
+        return set(zip(ok["keyword"], ok["cluster"], ok["variant"]))
+
+
+def wide_table(cells, names, keywords):
+    # One row per keyword with `<cluster>_<variant>_<stat>` columns, in the
+    # layout results.csv has always used. Cells that are missing or failed
+    # come out as NaN.
+    if cells.empty or "status" not in cells:
+        cells = pd.DataFrame(columns=[*CELL_KEY, "status"])
+    cells = cells[cells["status"] == "ok"]
+    stat_columns = [c for c in cells.columns if c.startswith(("took_", "wall_ms_"))]
+    if cells.empty:
+        # Every planned column, all NaN, so callers can still index them.
+        stat_columns = [f"{m}_{stat}" for m in ("took", "wall_ms") for stat in STATS]
+        columns = [f"{name}_{stat}" for name in names for stat in stat_columns]
+        return pd.DataFrame(
+            np.nan, index=pd.Index(keywords, name="keyword"), columns=columns
+        )
+    cells = cells.assign(name=cells["cluster"] + "_" + cells["variant"])
+    wide = cells.pivot(index="keyword", columns="name", values=stat_columns)
+    wide.columns = [f"{name}_{stat}" for stat, name in wide.columns]
+    columns = [f"{name}_{stat}" for name in names for stat in stat_columns]
+    return wide.reindex(index=keywords, columns=columns)
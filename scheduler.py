@@ -0,0 +1,111 @@
+import random
+import uuid
+
+import numpy as np
+import pandas as pd
+
+import loadgen
+
+CACHE_BUST = {
+    "none": None,
+    "request_cache": lambda: {"request_cache": "false"},
+    "preference": lambda: {"preference": uuid.uuid4().hex},
+    "both": lambda: {"request_cache": "false", "preference": uuid.uuid4().hex},
+}
+
+
+def plan(cells, warmup=3, seed=None):
+    # A cell is a dict with key, es_host, body and iterations. Every request
+    # of every cell is shuffled into one sequence so no variant systematically
+    # runs on a warmer cluster than another. Warm-up requests (`warmup` per
+    # cell) are shuffled separately and always run first.
+    rng = random.Random(seed)
+    warmup_jobs = []
+    jobs = []
+    for index, cell in enumerate(cells):
+        job = {"es_host": cell["es_host"], "body": cell["body"], "cell": index}
+        warmup_jobs.extend({**job, "phase": "warmup"} for _ in range(warmup))
+        jobs.extend(
+            {**job, "phase": "measure", "iteration": i}
+            for i in range(cell["iterations"])
+        )
+    rng.shuffle(warmup_jobs)
+    rng.shuffle(jobs)
+    return warmup_jobs + jobs
+
+
+def run(
+    cells,
+    index_name,
+    warmup=3,
+    concurrency=1,
+    cache_bust="none",
+    seed=None,
+    think_time=0,
+):
+    # Returns {cell key: [samples]} for the measure phase only; warm-up
+    # samples are discarded.
+    params = CACHE_BUST[cache_bust]
+    jobs = plan(cells, warmup, seed)
+    if params is not None:
+        jobs = [{**job, "params": params} for job in jobs]
+    samples = loadgen.run_jobs(jobs, index_name, concurrency, think_time)
+    by_cell = {cell["key"]: [] for cell in cells}
+    for sample in samples:
+        if sample["phase"] == "measure":
+            by_cell[cells[sample["cell"]]["key"]].append(sample)
+    for cell_samples in by_cell.values():
+        cell_samples.sort(key=lambda sample: sample["started_at"])
+    return by_cell
+
+
+def drift_report(samples, window_minutes=10):
+    # Normalizes every sample by its cell's median `took` and tracks that
+    # ratio over wall-clock time per cluster. With interleaving, a cluster
+    # that did not drift stays near 1.0 in every window and has a flat slope.
+    columns = ["cluster", "window", "median", "size", "drift_per_hour"]
+    if samples.empty:
+        return pd.DataFrame(columns=columns)
+    df = samples.dropna(subset=["took", "started_at"]).copy()
+    if df.empty:
+        return pd.DataFrame(columns=columns)
+    cell = ["keyword", "cluster", "variant"]
+    df["relative_took"] = df["took"] / df.groupby(cell)["took"].transform("median")
+    df["minutes"] = (df["started_at"] - df["started_at"].min()) / 60
+    df["window"] = (df["minutes"] // window_minutes).astype(int)
+    windows = (
+        df.groupby(["cluster", "window"])["relative_took"]
+        .agg(["median", "size"])
+        .reset_index()
+    )
+    slopes = {}
+    for cluster, group in df.groupby("cluster"):
+        if group["minutes"].nunique() > 1:
+            slope = np.polyfit(group["minutes"], group["relative_took"], 1)[0]
+        else:
+            slope = 0.0
+        slopes[cluster] = slope * 60
+    windows["drift_per_hour"] = windows["cluster"].map(slopes)
+    return windows
+
+
+def blocks(items, size):
+    items = list(items)
+    return [items[i : i + size] for i in range(0, len(items), size)]
+
+
+def add_arguments(parser):
+    parser.add_argument(
+        "--block-size",
+        type=int,
+        default=10,
+        help="keywords whose cells are interleaved and checkpointed together",
+    )
+    parser.add_argument(
+        "--warmup", type=int, default=3, help="warm-up requests per cell"
+    )
+    parser.add_argument(
+        "--concurrency", type=int, default=1, help="workers per cluster"
+    )
+    parser.add_argument("--cache-bust", choices=list(CACHE_BUST), default="none")
+    parser.add_argument("--seed", type=int, default=None)
@@ -0,0 +1,250 @@
+import argparse
+import sys
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import experiment
+import loadgen
+import workload_cache
+import workloads
+
+# Rough per-entry overhead of the key, the entry tuple and the dict slot, so
+# a cache of many tiny responses is not reported as nearly empty.
+ENTRY_OVERHEAD_BYTES = 200
+
+
+def normalize_query(query):
+    # serving_title is matched through an analyzer, so width, case and
+    # whitespace variants of a keyword return the same hits.
+    return " ".join(unicodedata.normalize("NFKC", query).lower().split())
+
+
+def cache_key(variant, query, category_weights=None):
+    # The DSL builders skip empty categories, so they are not part of the key
+    # either (and a None would not sort against the strings).
+    weights = tuple(
+        sorted((k, v) for k, v in (category_weights or {}).items() if k)
+    )
+    return variant, normalize_query(query), weights
+
+
+class ResultCache:
+    # LRU over raw response bytes with a TTL and a memory budget. Concurrent
+    # misses on one key are coalesced: the first caller computes and the
+    # others wait for its result instead of all hitting the cluster.
+
+    def __init__(self, max_bytes=64 * 1024**2, ttl=300.0, clock=time.monotonic):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.clock = clock
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.lock = threading.Lock()
+        self.in_flight = {}
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "coalesced": 0,
+            "evictions": 0,
+            "expirations": 0,
+            "saved_ms": 0.0,
+        }
+
+    def _size(self, key, value):
+        return len(value) + sys.getsizeof(key[1]) + ENTRY_OVERHEAD_BYTES
+
+    def _lookup(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        value, size, expires_at, cost_ms = entry
+        if expires_at <= self.clock():
+            del self.entries[key]
+            self.bytes -= size
+            self.stats["expirations"] += 1
+            return None
+        self.entries.move_to_end(key)
+        self.stats["hits"] += 1
+        self.stats["saved_ms"] += cost_ms
+        return value
+
+    def _store(self, key, value, cost_ms):
+        size = self._size(key, value)
+        if size > self.max_bytes:
+            return
+        old = self.entries.pop(key, None)
+        if old is not None:
+            self.bytes -= old[1]
+        self.entries[key] = (value, size, self.clock() + self.ttl, cost_ms)
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            _, (_, evicted, _, _) = self.entries.popitem(last=False)
+            self.bytes -= evicted
+            self.stats["evictions"] += 1
+
+    def get_or_compute(self, key, compute):
+        with self.lock:
+            value = self._lookup(key)
+            if value is not None:
+                return value
+            waiter = self.in_flight.get(key)
+            if waiter is None:
+                waiter = {"done": threading.Event(), "value": None, "error": None}
+                self.in_flight[key] = waiter
+                self.stats["misses"] += 1
+                owner = True
+            else:
+                self.stats["coalesced"] += 1
+                owner = False
+
+        if not owner:
+            waiter["done"].wait()
+            if waiter["error"] is not None:
+                raise waiter["error"]
+            return waiter["value"]
+
+        start = time.perf_counter()
+        try:
+            value = compute()
+        except Exception as e:
+            # Failures are handed to the waiters but never cached.
+            waiter["error"] = e
+            raise
+        else:
+            waiter["value"] = value
+            with self.lock:
+                self._store(key, value, (time.perf_counter() - start) * 1000)
+            return value
+        finally:
+            with self.lock:
+                del self.in_flight[key]
+            waiter["done"].set()
+
+    def summary(self):
+        with self.lock:
+            # Every lookup is exactly one of hit, miss or coalesced; only
+            # misses reach the cluster.
+            lookups = sum(self.stats[k] for k in ["hits", "misses", "coalesced"])
+            return {
+                **self.stats,
+                "lookups": lookups,
+                "hit_rate": self.stats["hits"] / max(lookups, 1),
+                "coalesced_rate": self.stats["coalesced"] / max(lookups, 1),
+                "entries": len(self.entries),
+                "bytes": self.bytes,
+            }
+
+
+class CachedSearch:
+    # Serving-side wrapper: builds the variant's DSL for a normalized query
+    # and returns the raw response body, from the cache when possible.
+    # `renderers` maps variant names to experiment.variant_renderer results.
+
+    def __init__(self, es_host, index_name, cache, renderers):
+        self.es_host = es_host
+        self.index_name = index_name
+        self.cache = cache
+        self.renderers = renderers
+
+    def _execute(self, body):
+        response = loadgen.get_session().get(
+            f"{self.es_host}/{self.index_name}/_search",
+            headers=loadgen.HEADERS,
+            data=body,
+        )
+        response.raise_for_status()
+        return response.content
+
+    def search(self, variant, query, category_weights=None):
+        key = cache_key(variant, query, category_weights)
+
+        def compute():
+            body = self.renderers[variant](key[1], category_weights or {})
+            return self._execute(body)
+
+        return self.cache.get_or_compute(key, compute)
+
+
+def benchmark(searcher, keywords, category_weights, variant, concurrency=8):
+    # Replays `keywords` (already drawn in traffic proportion) and returns
+    # per-request wall times.
+    def run(keyword):
+        start = time.perf_counter()
+        searcher.search(variant, keyword, category_weights.get(keyword))
+        return (time.perf_counter() - start) * 1000
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        return list(executor.map(run, keywords))
+
+
+def main():
+    from replay import sample_schedule
+
+    parser = argparse.ArgumentParser(
+        description="Replay the keyword distribution through a serving cache"
+    )
+    parser.add_argument("--host", default="http://search-searching.alpha.kr.krmt.io")
+    parser.add_argument("--index", default="ads-catalog-product-serving-v2")
+    experiment.add_variant_arguments(parser, ["asis", "idsort"])
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument(
+        "--max-mb", type=float, nargs="+", default=[4, 16, 64], help="cache budgets"
+    )
+    parser.add_argument("--ttl", type=float, default=300)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--output", default="serving_cache.csv")
+    workload_cache.add_arguments(parser)
+    args = parser.parse_args()
+
+    cache = workload_cache.from_args(args)
+    df = workload_cache.load_category_workload(
+        cache, workloads.CATEGORY_SQL, args.run_date
+    )
+    category_weights = dict(zip(df["queryText"], df["hoian_category_name"]))
+    keywords = [
+        keyword
+        for _, keyword in sample_schedule(
+            df["queryText"], df["qc"], args.requests, 1, args.seed
+        )
+    ]
+
+    variants = experiment.named_variants(args.variants, args.spec, args.seed)
+    renderers = experiment.variant_renderers(variants, cache, args.run_date)
+
+    rows = []
+    for variant in variants:
+        for max_mb in args.max_mb:
+            result_cache = ResultCache(int(max_mb * 1024**2), args.ttl)
+            searcher = CachedSearch(args.host, args.index, result_cache, renderers)
+            start = time.perf_counter()
+            wall_ms = benchmark(
+                searcher, keywords, category_weights, variant, args.concurrency
+            )
+            elapsed = time.perf_counter() - start
+            summary = result_cache.summary()
+            rows.append(
+                {
+                    "variant": variant,
+                    "max_mb": max_mb,
+                    "requests": len(wall_ms),
+                    "throughput_qps": len(wall_ms) / elapsed,
+                    "wall_ms_p50": float(np.percentile(wall_ms, 50)),
+                    "wall_ms_p99": float(np.percentile(wall_ms, 99)),
+                    **summary,
+                    "mb_used": summary["bytes"] / 1024**2,
+                }
+            )
+    table = pd.DataFrame(rows)
+    table.to_csv(args.output, index=False)
+    print(table.to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+import argparse
+import json
+import statistics
+import time
+
+import pandas as pd
+from tqdm import tqdm
+
+import dsl_templates
+import dsls
+import loadgen
+import scheduler
+import workload_cache
+import workloads
+from latency_stats import LatencySamples
+
+LOOKUP_PATH = "catalog_ids"
+
+
+def get_unfiltered_terms_dsl(query):
+    # get_terms_dsl without the catalog_id clause, so the filtered modes are
+    # compared with the same query shape (size, _source, no aggregation)
+    # and the ratio is the cost of the filter alone. An empty id list would
+    # match nothing instead.
+    dsl = dsls.get_terms_dsl(query, [])
+    bool_query = dsl["query"]["bool"]
+    bool_query["filter"] = [f for f in bool_query["filter"] if "terms" not in f]
+    return dsl
+
+
+MODES = {
+    "none": (
+        get_unfiltered_terms_dsl,
+        dsl_templates.DslTemplate(get_unfiltered_terms_dsl),
+    ),
+    "inline": (dsls.get_terms_dsl, dsl_templates.get_terms_body),
+    "lookup": (dsls.get_terms_lookup_dsl, dsl_templates.get_terms_lookup_body),
+}
+
+
+def sample_catalog_ids(catalog_ids, size, seed):
+    # Filters larger than the catalog table use every id once.
+    size = min(size, len(catalog_ids))
+    return catalog_ids.sample(n=size, random_state=seed).tolist()
+
+
+def index_lookup_document(es_host, lookup_index, doc_id, catalog_ids):
+    session = loadgen.get_session()
+    response = session.put(
+        f"{es_host}/{lookup_index}/_doc/{doc_id}",
+        headers=loadgen.HEADERS,
+        data=json.dumps({LOOKUP_PATH: catalog_ids}),
+    )
+    response.raise_for_status()
+    session.post(f"{es_host}/{lookup_index}/_refresh").raise_for_status()
+
+
+def _median_ms(fn, repeats):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def serialization_cost(builder, template, args, repeats=50):
+    # `serialize_ms` is building and dumping the DSL from scratch, which is
+    # what a service without templates pays; `template_ms` is a warm
+    # dsl_templates call as used by the benchmark scripts.
+    template(*args)
+    return {
+        "serialize_ms": _median_ms(
+            lambda: json.dumps(builder(*args)).encode(), repeats
+        ),
+        "template_ms": _median_ms(lambda: template(*args), repeats),
+    }
+
+
+def build_cells(es_host, keywords, filters, iterations, repeats, costs):
+    # `filters` maps (mode, size, seed) to the builder arguments after the
+    # keyword. Size 0 is the unfiltered terms DSL every size is relative to.
+    # Request sizes per keyword are appended to `costs`.
+    cells = []
+    for keyword in keywords:
+        for (mode, size, seed), args in filters.items():
+            builder, template = MODES[mode]
+            body = template(keyword, *args)
+            cost = costs.setdefault((mode, size, seed), [])
+            if not cost:
+                # Serialization does not depend on the keyword; once is enough.
+                cost.append(
+                    serialization_cost(builder, template, (keyword, *args), repeats)
+                )
+            cost.append({"request_bytes": len(body)})
+            cells.append(
+                {
+                    "key": (keyword, mode, size, seed),
+                    "es_host": es_host,
+                    "body": body,
+                    "iterations": iterations,
+                }
+            )
+    return cells
+
+
+def sweep_table(measured, costs):
+    rows = []
+    for (mode, size, seed), cost in costs.items():
+        samples = [
+            sample
+            for key, cell_samples in measured.items()
+            if key[1:] == (mode, size, seed)
+            for sample in cell_samples
+        ]
+        row = {"mode": mode, "size": size, "seed": seed}
+        row.update(cost[0])
+        row["request_bytes"] = statistics.mean(c["request_bytes"] for c in cost[1:])
+        row.update(LatencySamples.from_samples(samples).row())
+        rows.append(row)
+    table = pd.DataFrame(rows).sort_values(["mode", "size", "seed"])
+    table["seed"] = table["seed"].astype("Int64")
+    baseline = table.loc[table["mode"] == "none", "took_p50"].median()
+    table["took_p50_vs_unfiltered"] = table["took_p50"] / baseline
+    return table.reset_index(drop=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Sweep catalog_id filter sizes, inline and as a terms lookup"
+    )
+    parser.add_argument("--host", default="http://search-searching.alpha.kr.krmt.io")
+    parser.add_argument("--index", default="ads-catalog-product-serving-v2")
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[10, 100, 1000, 2000, 5000, 10000]
+    )
+    parser.add_argument(
+        "--sample-seeds",
+        type=int,
+        nargs="+",
+        default=[0],
+        help="catalog_id samples drawn per size",
+    )
+    parser.add_argument(
+        "--modes", nargs="+", choices=["inline", "lookup"], default=["inline", "lookup"]
+    )
+    parser.add_argument("--lookup-index", default="ads-catalog-id-lookup")
+    parser.add_argument("--keywords", type=int, default=20, help="top keywords by qc")
+    parser.add_argument("--iterations", type=int, default=30)
+    parser.add_argument("--serialize-repeats", type=int, default=50)
+    parser.add_argument("--output", default="terms_sweep.csv")
+    workload_cache.add_arguments(parser)
+    scheduler.add_arguments(parser)
+    args = parser.parse_args()
+
+    cache = workload_cache.from_args(args)
+    catalog_ids = cache.read_gbq(workloads.CATALOG_SQL, args.run_date)["catalog_id"]
+    df = cache.read_gbq(
+        workloads.TOP_QUERIES_SQL,
+        args.run_date,
+        dialect="standard",
+        use_bqstorage_api=True,
+    )
+    keywords = df["queryText"].head(args.keywords).tolist()
+
+    filters = {("none", 0, None): ()}
+    for size in args.sizes:
+        for seed in args.sample_seeds:
+            ids = sample_catalog_ids(catalog_ids, size, seed)
+            if "inline" in args.modes:
+                filters["inline", size, seed] = (ids,)
+            if "lookup" in args.modes:
+                doc_id = f"sweep-{size}-{seed}"
+                index_lookup_document(args.host, args.lookup_index, doc_id, ids)
+                filters["lookup", size, seed] = (
+                    args.lookup_index,
+                    doc_id,
+                    LOOKUP_PATH,
+                )
+
+    measured = {}
+    costs = {}
+    for block in tqdm(scheduler.blocks(keywords, args.block_size)):
+        cells = build_cells(
+            args.host, block, filters, args.iterations, args.serialize_repeats, costs
+        )
+        measured.update(
+            scheduler.run(
+                cells,
+                args.index,
+                warmup=args.warmup,
+                concurrency=args.concurrency,
+                cache_bust=args.cache_bust,
+                seed=args.seed,
+            )
+        )
+
+    table = sweep_table(measured, costs)
+    table.to_csv(args.output, index=False)
+    print(
+        table[
+            [
+                "mode",
+                "size",
+                "seed",
+                "request_bytes",
+                "serialize_ms",
+                "template_ms",
+                "took_p50",
+                "took_p99",
+                "wall_ms_p50",
+                "took_p50_vs_unfiltered",
+            ]
+        ].to_string(index=False)
+    )
+
+
+if __name__ == "__main__":
+    main()
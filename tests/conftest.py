@@ -0,0 +1,63 @@
+import os
+import socket
+import sys
+import threading
+
+import pytest
+
+# The modules live flat at the repository root.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import mock_es  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def es_host():
+    host, stop = mock_es.start_in_thread(seed=0, sleep=False)
+    yield host
+    stop()
+
+
+@pytest.fixture
+def raw_server():
+    # Starts servers that answer every request with the given raw bytes and
+    # then close the connection. Returns their base URLs.
+    servers = []
+    stopped = threading.Event()
+
+    def serve(server, response):
+        while not stopped.is_set():
+            try:
+                connection, _ = server.accept()
+            except TimeoutError:
+                continue
+            with connection:
+                connection.recv(65536)
+                connection.sendall(response)
+
+    def start(response):
+        server = socket.create_server(("127.0.0.1", 0))
+        # Closing a socket does not wake a thread blocked in accept(), so the
+        # loop polls for the stop flag instead.
+        server.settimeout(0.1)
+        thread = threading.Thread(target=serve, args=(server, response), daemon=True)
+        thread.start()
+        servers.append((server, thread))
+        return f"http://127.0.0.1:{server.getsockname()[1]}"
+
+    yield start
+    stopped.set()
+    for server, thread in servers:
+        thread.join()
+        server.close()
+
+
+@pytest.fixture
+def truncated_host(raw_server):
+    # Headers promising more body than is sent.
+    return raw_server(
+        b"HTTP/1.1 200 OK\r\n"
+        b"Content-Type: application/json\r\n"
+        b"Content-Length: 1000\r\n\r\n"
+        b'{"took": 1, "hits"'
+    )
@@ -0,0 +1,84 @@
+import math
+
+import numpy as np
+
+import adaptive
+import dsls
+import loadgen
+
+INDEX = "ads-catalog-product-serving-v2"
+
+
+def test_mann_whitney_separated_samples():
+    # U = 0; normal approximation with continuity correction:
+    # z = (4.5 - 0.5) / sqrt(3 * 3 / 12 * 7), p = erfc(z / sqrt(2)).
+    u, p = adaptive.mann_whitney([1, 2, 3], [4, 5, 6])
+    assert u == 0
+    z = 4 / math.sqrt(9 / 12 * 7)
+    assert math.isclose(p, math.erfc(z / math.sqrt(2)))
+    assert math.isclose(adaptive.mann_whitney([4, 5, 6], [1, 2, 3])[1], p)
+
+
+def test_mann_whitney_ties():
+    u, p = adaptive.mann_whitney([5, 5, 5], [5, 5, 5])
+    assert u == 4.5
+    assert p == 1.0
+    u, p = adaptive.mann_whitney([1, 2, 2], [2, 3, 3])
+    # Ranks: 1 -> 1, the three 2s -> 3, the two 3s -> 5.5; U = 7 - 6.
+    assert u == 1
+    assert 0 < p < 1
+
+
+def test_mann_whitney_empty():
+    u, p = adaptive.mann_whitney([], [1])
+    assert math.isnan(u) and math.isnan(p)
+
+
+def test_bootstrap_ci_constant_samples():
+    rng = np.random.default_rng(0)
+    low, high, ratio_low, ratio_high = adaptive.bootstrap_ci(
+        [10] * 20, [15] * 20, rng=rng
+    )
+    assert (low, high) == (5, 5)
+    assert (ratio_low, ratio_high) == (1.5, 1.5)
+
+
+def test_bootstrap_ci_covers_the_shift():
+    rng = np.random.default_rng(0)
+    baseline = rng.normal(20, 1, 200)
+    variant = baseline + 5
+    low, high, ratio_low, ratio_high = adaptive.bootstrap_ci(
+        baseline, variant, rng=np.random.default_rng(1)
+    )
+    assert low < 5 < high
+    assert ratio_low < 25 / 20 < ratio_high
+
+
+def test_pending_reruns_whole_groups():
+    cells = [{"key": ("a", "alpha", v)} for v in ["asis", "x"]]
+    cells.append({"key": ("b", "alpha", "asis")})
+    done = {("a", "alpha", "asis"), ("b", "alpha", "asis")}
+    assert [c["key"] for c in adaptive.pending(cells, done)] == [("a", "alpha", "x")]
+    assert adaptive.pending(cells, done, adaptive=True) == cells[:2]
+
+
+def test_run_against_mock(es_host):
+    cells = [
+        {
+            "key": ("나이키", "alpha", variant),
+            "es_host": es_host,
+            "body": loadgen.to_body(builder("나이키")),
+        }
+        for variant, builder in [
+            ("asis", dsls.get_current_dsl),
+            ("collapse", dsls.get_current_collapse_dsl),
+        ]
+    ]
+    samples, comparisons = adaptive.run(
+        cells, INDEX, batch=5, min_iterations=10, max_iterations=20, warmup=0, seed=0
+    )
+    assert 10 <= len(samples["나이키", "alpha", "collapse"]) <= 20
+    assert len(samples["나이키", "alpha", "asis"]) >= 10
+    result = comparisons["나이키", "alpha", "collapse"]
+    assert result["n_variant"] == len(samples["나이키", "alpha", "collapse"])
+    assert result["diff_ci_low"] <= result["diff_median"] <= result["diff_ci_high"]
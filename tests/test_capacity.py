@@ -0,0 +1,66 @@
+import capacity
+import dsls
+import loadgen
+import mock_es
+
+INDEX = "ads-catalog-product-serving-v2"
+
+
+def _sample(i, status=200, error=None, shards_failed=0, timed_out=False, took=5):
+    return {
+        "started_at": 1000.0 + i * 0.1,
+        "schedule_lag_ms": 0.0,
+        "latency_ms": 10.0,
+        "in_flight": 1,
+        "status": status,
+        "error": error,
+        "took": took,
+        "shards_failed": shards_failed,
+        "timed_out": timed_out,
+    }
+
+
+def test_partial_responses_count_as_rejections():
+    samples = [_sample(i) for i in range(6)]
+    samples += [
+        _sample(6, shards_failed=1, took=1),
+        _sample(7, timed_out=True, took=1),
+        _sample(8, status=429, error="es_rejected_execution_exception", took=None),
+        _sample(9, status=503, error="unavailable", took=None),
+    ]
+    stage = capacity.stage_stats(samples, offered_qps=10)
+    assert stage["requests"] == 10
+    assert stage["error_rate"] == 0.4
+    assert stage["partial_rate"] == 0.2
+    assert stage["rejection_rate"] == 0.4
+    # The fast partial responses do not pull the latency of successes down.
+    assert stage["took_p50"] == 5
+    assert capacity.is_saturated(stage, stage)
+
+
+def test_stage_stats_without_partial_columns():
+    # Samples written before shard failures were recorded.
+    samples = [_sample(i) for i in range(4)]
+    for sample in samples:
+        sample["shards_failed"] = None
+        sample["timed_out"] = None
+    stage = capacity.stage_stats(samples, offered_qps=10)
+    assert stage["error_rate"] == 0.0
+    assert stage["rejection_rate"] == 0.0
+
+
+def test_mock_partial_rejections_are_recorded():
+    # A queue of zero rejects every search, here as a 200 with a failed shard.
+    es_host, stop = mock_es.start_in_thread(
+        seed=0, sleep=False, search_threads=1, queue_size=0, partial_rejections=True
+    )
+    try:
+        body = loadgen.to_body(dsls.get_current_dsl("나이키"))
+        params = loadgen.filter_path_params(loadgen.FILTER_PATHS["ids"])
+        sample = loadgen.send_query(es_host, INDEX, body, params=params)
+    finally:
+        stop()
+    assert sample["status"] == 200
+    assert sample["error"] is None
+    assert sample["shards_failed"] == 1
+    assert sample["timed_out"] is False
@@ -0,0 +1,58 @@
+import json
+
+import pytest
+
+import dsl_templates
+import dsls
+
+WEIGHTS = {"여성의류": 1, "남성패션/잡화": 0.5}
+
+
+@pytest.mark.parametrize(
+    "builder, args",
+    [
+        (dsls.get_current_dsl, ("나이키 운동화",)),
+        (dsls.get_current_dsl, ('quote " and \\ backslash',)),
+        (dsls.get_terms_dsl, ("나이키", [3, 1, 2])),
+        (dsls.get_terms_dsl, ("나이키", [])),
+        (dsls.get_category_match_idsort_dsl, ("나이키", WEIGHTS)),
+        (dsls.get_category_boost_randomsort_dsl, ("나이키", WEIGHTS)),
+        (dsls.get_terms_lookup_dsl, ("나이키", "lookup", "doc-1")),
+        (dsls.lean(dsls.get_category_match_idsort_dsl), ("나이키", WEIGHTS)),
+        (dsls.get_current_collapse_dsl, ("나이키",)),
+        (dsls.get_current_collapse_dsl, ("나이키", 100, [12345])),
+        (dsls.get_category_match_idsort_collapse_dsl, ("나이키", WEIGHTS)),
+        (dsls.get_category_match_idsort_collapse_dsl, ("나이키", WEIGHTS, 100, [7])),
+    ],
+)
+def test_renders_same_bytes_as_builder(builder, args):
+    template = dsl_templates.DslTemplate(builder)
+    expected = json.dumps(builder(*args)).encode()
+    assert template(*args) == expected
+    # The memoized render is the same.
+    assert template(*args) == expected
+
+
+def test_defaults_and_keyword_arguments():
+    body = dsl_templates.get_terms_lookup_body("나이키", "lookup", "doc-1")
+    expected = dsls.get_terms_lookup_dsl("나이키", "lookup", "doc-1")
+    assert json.loads(body) == expected
+    by_name = dsl_templates.get_terms_lookup_body(
+        "나이키", lookup_id="doc-1", lookup_index="lookup"
+    )
+    assert by_name == body
+
+
+def test_equal_but_differently_typed_arguments_are_not_confused():
+    template = dsl_templates.DslTemplate(dsls.get_category_match_idsort_dsl)
+    as_int = template("a", {"x": 1})
+    as_bool = template("a", {"x": True})
+    assert as_int != as_bool
+    assert json.loads(as_bool) == dsls.get_category_match_idsort_dsl("a", {"x": True})
+
+
+def test_value_dependent_structure_is_only_memoized():
+    assert dsl_templates.DslTemplate(dsls.get_current_dsl).segments is not None
+    template = dsl_templates.DslTemplate(dsls.get_current_collapse_dsl)
+    assert template.segments is None
+    assert b"search_after" not in template("나이키")
@@ -0,0 +1,64 @@
+import pytest
+
+import dsls
+
+WEIGHTS = {"여성의류": 1, "남성패션/잡화": 0.5, "디지털기기": 0.25}
+
+
+def _function_score(dsl, category):
+    # The combined function score (score_mode sum) for a document with a
+    # single fast_text_category_name (None for none).
+    # CATEGORY_MATCH_SCRIPT is evaluated as written: the document's weight in
+    # params.category_weights, 0 when it has no category or no weight.
+    function_score = dsl["query"]["function_score"]
+    assert function_score["score_mode"] == "sum"
+    score = 0
+    for function in function_score["functions"]:
+        term = function.get("filter", {}).get("term")
+        if term is not None and term["fast_text_category_name"] != category:
+            continue
+        factor = 1
+        if "script_score" in function:
+            script = function["script_score"]["script"]
+            assert script["source"] == dsls.CATEGORY_MATCH_SCRIPT
+            weights = script["params"]["category_weights"] or {}
+            factor = weights.get(category, 0) if category is not None else 0
+        score += function.get("weight", 1) * factor
+    return score
+
+
+@pytest.mark.parametrize(
+    "script_builder, native_builder",
+    [
+        (dsls.get_category_match_idsort_dsl, dsls.get_category_boost_idsort_dsl),
+        (dsls.get_category_match_bm25sort_dsl, dsls.get_category_boost_bm25sort_dsl),
+    ],
+)
+@pytest.mark.parametrize("category", [*WEIGHTS, "스포츠/레저", None])
+def test_native_boost_scores_like_the_script(script_builder, native_builder, category):
+    script = script_builder("나이키", WEIGHTS)
+    native = native_builder("나이키", WEIGHTS)
+    # Same query and boost_mode, so equal function scores mean equal scores.
+    for key in ["boost_mode", "query"]:
+        assert native["query"]["function_score"][key] == (
+            script["query"]["function_score"][key]
+        )
+    assert _function_score(native, category) == _function_score(script, category)
+
+
+def test_boost_functions_skip_unresolved_categories():
+    functions = dsls.get_category_boost_functions({None: 1, "": 1, "여성의류": 0.5})
+    assert functions == [
+        {"weight": 0},
+        {"filter": {"term": {"fast_text_category_name": "여성의류"}}, "weight": 50.0},
+    ]
+
+
+def test_lean_never_widens_source():
+    dsl = dsls.lean(dsls.get_current_dsl)("나이키")
+    assert dsl["_source"] == ["original_id"]
+    top_hits = dsl["aggs"]["by_catalog_id"]["aggs"]["top_catalog_hits"]["top_hits"]
+    assert top_hits["_source"] == dsls.LEAN_SOURCE
+    collapse = dsls.lean(dsls.get_current_collapse_dsl)("나이키")
+    assert collapse["_source"] is False
+    assert collapse["collapse"]["inner_hits"]["_source"] == dsls.LEAN_SOURCE
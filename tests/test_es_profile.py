@@ -0,0 +1,63 @@
+import dsls
+import es_profile
+import loadgen
+
+INDEX = "ads-catalog-product-serving-v2"
+
+
+def _row(shard, path, time_ms, iteration=0, label="a"):
+    return {
+        "variant": "asis",
+        "label": label,
+        "iteration": iteration,
+        "took": 10,
+        "shard": shard,
+        "section": "query",
+        "path": path,
+        "time_ms": time_ms,
+        "self_time_ms": time_ms,
+    }
+
+
+def test_profile_table_sums_siblings_then_averages_shards():
+    # Two TermQuery siblings on shard 0 share a path and add up; the two
+    # shards run in parallel and are averaged.
+    rows = [
+        _row(0, "BooleanQuery/TermQuery", 1.0),
+        _row(0, "BooleanQuery/TermQuery", 2.0),
+        _row(1, "BooleanQuery/TermQuery", 1.0),
+    ]
+    table = es_profile.profile_table(rows)
+    assert len(table) == 1
+    assert table["requests"].iloc[0] == 1
+    assert table["time_ms_mean"].iloc[0] == 2.0
+    assert table["share_of_took"].iloc[0] == 0.2
+
+
+def test_profile_table_skips_failed_iterations():
+    rows = [
+        _row(0, "TermQuery", 4.0),
+        {"label": "a", "iteration": 1, "status": 503, "error": "unavailable"},
+    ]
+    rows[1]["variant"] = "asis"
+    table = es_profile.profile_table(rows)
+    assert table["requests"].tolist() == [1]
+    assert table["time_ms_mean"].tolist() == [4.0]
+
+
+def test_profile_table_without_successful_iterations():
+    rows = [{"variant": "asis", "label": "a", "iteration": 0, "error": "timeout"}]
+    table = es_profile.profile_table(rows)
+    assert table.empty
+    assert {"section", "path", "time_ms_mean"} <= set(table.columns)
+
+
+def test_profile_query_against_mock(es_host):
+    body = loadgen.to_body(dsls.get_current_dsl("나이키"))
+    rows = es_profile.profile_query(es_host, INDEX, body, iterations=2, label="k")
+    assert {row["iteration"] for row in rows} == {0, 1}
+    assert all(row["label"] == "k" for row in rows)
+    rows = [{**row, "variant": "asis"} for row in rows]
+    table = es_profile.profile_table(rows)
+    assert not table.empty
+    assert (table["requests"] == 2).all()
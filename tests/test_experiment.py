@@ -0,0 +1,126 @@
+import argparse
+
+import pandas as pd
+import pytest
+
+import experiment
+from result_store import ResultStore
+
+
+class FakeCache:
+    def __init__(self, catalog_ids):
+        self.catalog_ids = catalog_ids
+
+    def read_gbq(self, sql, run_date=None):
+        return pd.DataFrame({"catalog_id": self.catalog_ids})
+
+
+def test_catalog_sample_is_pinned_per_seed(tmp_path):
+    store = ResultStore(str(tmp_path / "store"))
+    spec = {"source": "catalog", "size": 5, "seed": 1}
+    ids = experiment.load_catalog_ids(spec, FakeCache(list(range(100))), store=store)
+    assert len(ids) == 5
+    # The source changed in between; a resumed run reuses the pinned sample.
+    resumed = experiment.load_catalog_ids(
+        spec, FakeCache(list(range(100, 200))), store=store
+    )
+    assert resumed == ids
+    assert store.tables() == ["catalog_ids5_seed1"]
+
+
+def test_resume_with_another_seed_is_rejected(tmp_path):
+    store = ResultStore(str(tmp_path / "store"))
+    cache = FakeCache(list(range(100)))
+    experiment.load_catalog_ids({"size": 5, "seed": 1}, cache, store=store)
+    with pytest.raises(ValueError, match="seed 2"):
+        experiment.load_catalog_ids({"size": 5, "seed": 2}, cache, store=store)
+    # Other sizes and sources are separate samples.
+    experiment.load_catalog_ids({"size": 50, "seed": 2}, cache, store=store)
+    serving = {"source": "serving", "size": 5, "seed": 2}
+    experiment.load_catalog_ids(serving, cache, store=store)
+
+
+def _cell(keyword, cluster, variant, body, iterations=3):
+    return {
+        "key": (keyword, cluster, variant),
+        "es_host": cluster,
+        "body": body,
+        "iterations": iterations,
+    }
+
+
+def test_dedupe_measures_identical_bodies_once_per_cluster():
+    cells = [
+        _cell("a", "prod", "asis", b"x", iterations=3),
+        _cell("a", "prod", "same_as_asis", b"x", iterations=5),
+        _cell("a", "alpha", "asis", b"x"),
+        _cell("a", "prod", "idsort", b"y"),
+    ]
+    unique, aliases = experiment.dedupe(cells)
+    assert [cell["key"] for cell in unique] == [
+        ("a", "prod", "asis"),
+        ("a", "alpha", "asis"),
+        ("a", "prod", "idsort"),
+    ]
+    assert unique[0]["iterations"] == 5
+    assert aliases[("a", "prod", "same_as_asis")] == ("a", "prod", "asis")
+    assert aliases[("a", "alpha", "asis")] == ("a", "alpha", "asis")
+    # The input cells are left alone.
+    assert cells[0]["iterations"] == 3
+
+
+def _run(es_host, tmp_path, variants):
+    spec = experiment.DEFAULTS | {
+        "name": "test",
+        "workload": {"source": "keywords", "keywords": ["나이키", "아디다스"]},
+        "clusters": {"mock": {"host": es_host}},
+        "iterations": 3,
+        "warmup": 0,
+        "variants": {name: {"builder": builder} for name, builder in variants},
+    }
+    parser = argparse.ArgumentParser()
+    experiment.add_arguments(parser)
+    args = parser.parse_args(
+        [
+            "--store",
+            str(tmp_path / "store"),
+            "--resume",
+            "--output-dir",
+            str(tmp_path / "out"),
+            "--cache-dir",
+            str(tmp_path / "cache"),
+        ]
+    )
+    return experiment.run(spec, args, ResultStore(args.store))
+
+
+def test_resume_measures_new_aliases(es_host, tmp_path):
+    store = _run(es_host, tmp_path, [("asis", "get_current_dsl")])
+    assert store.done() == {("나이키", "mock", "asis"), ("아디다스", "mock", "asis")}
+
+    # A variant added on --resume that renders the same body as asis is
+    # measured once more and written under both names.
+    variants = [("asis", "get_current_dsl"), ("again", "get_current_dsl")]
+    store = _run(es_host, tmp_path, variants)
+    cells = store.cells().set_index(["keyword", "variant"])
+    assert len(cells) == 4
+    assert cells.loc[("나이키", "again"), "measured_as"] == "asis"
+    assert cells.loc[("나이키", "asis"), "took_count"] == 3
+    written = sorted(cells["written_at"])
+
+    # Nothing is left to measure.
+    store = _run(es_host, tmp_path, variants)
+    assert sorted(store.cells()["written_at"]) == written
+
+
+def test_named_variants_come_from_the_spec():
+    spec_path = f"{experiment.SPEC_DIR}/category_match.yaml"
+    variants = experiment.named_variants(["idsort", "terms20"], spec_path, seed=3)
+    assert variants["idsort"] == {"builder": "get_category_match_idsort_dsl"}
+    assert variants["terms20"]["catalog_ids"] == {
+        "source": "catalog",
+        "size": 20,
+        "seed": 3,
+    }
+    with pytest.raises(ValueError, match="unknown variant current"):
+        experiment.named_variants(["current"], spec_path)
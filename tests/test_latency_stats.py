@@ -0,0 +1,34 @@
+import math
+
+from latency_stats import STATS, LatencySamples, describe
+
+
+def test_describe_trims_by_value():
+    # The outliers sit at the start of the list; trimming drops the smallest
+    # and largest values, not the first and last samples.
+    values = [1000, 1, 10, 10, 10, 10, 10, 10, 10, 10]
+    summary = describe(values, trim=0.1)
+    assert summary["trimmed_mean"] == 10
+    assert summary["mean"] == (1000 + 1 + 8 * 10) / 10
+    assert summary["min"] == 1
+    assert summary["max"] == 1000
+    assert summary["p50"] == 10
+
+
+def test_describe_empty():
+    summary = describe([])
+    assert list(summary) == STATS
+    assert summary["count"] == 0
+    assert math.isnan(summary["p99"])
+
+
+def test_from_samples_counts_errors():
+    samples = [
+        {"status": 200, "error": None, "took": 3, "wall_ms": 4.0, "started_at": 1.0},
+        {"status": 429, "error": "rejected", "took": None, "wall_ms": 1.0},
+        {"status": 200, "error": "invalid JSON", "took": None, "wall_ms": 1.0},
+    ]
+    stats = LatencySamples.from_samples(samples)
+    assert len(stats) == 1
+    assert stats.errors == 2
+    assert stats.row()["took_count"] == 1
@@ -0,0 +1,64 @@
+import pytest
+
+import dsls
+import loadgen
+
+INDEX = "ads-catalog-product-serving-v2"
+
+
+def test_send_query(es_host):
+    body = loadgen.to_body(dsls.get_current_dsl("나이키"))
+    sample = loadgen.send_query(es_host, INDEX, body, label="나이키")
+    assert sample["status"] == 200
+    assert sample["error"] is None
+    assert sample["attempts"] == 1
+    assert sample["took"] >= 0
+    assert sample["wall_ms"] > 0
+
+
+def test_truncated_response_is_retried_then_recorded(truncated_host):
+    sample = loadgen.send_query(truncated_host, INDEX, b"{}", retries=2)
+    assert sample["attempts"] == 2
+    assert sample["status"] is None
+    assert sample["took"] is None
+    assert sample["error"]
+
+
+def test_run_jobs_keeps_truncated_responses_as_errors(truncated_host):
+    jobs = [{"es_host": truncated_host, "body": b"{}", "label": i} for i in range(3)]
+    samples = loadgen.run_jobs(jobs, INDEX, concurrency=2)
+    assert sorted(sample["label"] for sample in samples) == [0, 1, 2]
+    assert all(sample["error"] for sample in samples)
+
+
+def test_run_jobs_fails_when_a_worker_dies(es_host):
+    def send(es_host, index_name, body, label=None, params=None):
+        if label == 1:
+            raise RuntimeError("worker died")
+        return loadgen.send_query(es_host, index_name, body, label, params=params)
+
+    body = loadgen.to_body(dsls.get_current_dsl("a"))
+    jobs = [{"es_host": es_host, "body": body, "label": i} for i in range(4)]
+    with pytest.raises(RuntimeError, match="worker died"):
+        loadgen.run_jobs(jobs, INDEX, concurrency=2, send=send)
+
+
+def test_invalid_json_is_an_error_sample(raw_server):
+    body = b"<html>proxy error</html>"
+    es_host = raw_server(
+        b"HTTP/1.1 200 OK\r\nContent-Length: %d\r\n\r\n" % len(body) + body
+    )
+    samples = loadgen.run_jobs([{"es_host": es_host, "body": b"{}"}], INDEX)
+    assert samples[0]["status"] == 200
+    assert samples[0]["error"] == "invalid JSON"
+    assert samples[0]["took"] is None
+
+
+def test_msearch_filter_path_keeps_responses(es_host):
+    items = [(keyword, dsls.get_current_dsl(keyword)) for keyword in ["a", "b"]]
+    params = loadgen.filter_path_params(loadgen.FILTER_PATHS["ids"])
+    sample = loadgen.send_msearch(es_host, INDEX, items, params=params)
+    assert sample["status"] == 200
+    assert [query["label"] for query in sample["queries"]] == ["a", "b"]
+    assert all(query["took"] is not None for query in sample["queries"])
+    assert all(query["status"] == 200 for query in sample["queries"])
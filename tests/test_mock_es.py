@@ -0,0 +1,49 @@
+import json
+
+import dsls
+import loadgen
+import mock_es
+
+INDEX = "ads-catalog-product-serving-v2"
+
+
+def _get(es_host, path, body, params=None):
+    response = loadgen.get_session().get(
+        f"{es_host}/{path}", data=body, params=params, headers=loadgen.HEADERS
+    )
+    return response.status_code, response.json()
+
+
+def test_search_is_deterministic_per_keyword(es_host):
+    body = json.dumps(dsls.get_current_dsl("나이키"))
+    _, first = _get(es_host, f"{INDEX}/_search", body)
+    _, second = _get(es_host, f"{INDEX}/_search", body)
+    assert first["hits"] == second["hits"]
+    assert first["_shards"]["failed"] == 0
+
+
+def test_search_applies_filter_path(es_host):
+    body = json.dumps(dsls.get_current_dsl("a"))
+    status, result = _get(
+        es_host, f"{INDEX}/_search", body, {"filter_path": "hits.total"}
+    )
+    assert status == 200
+    assert set(result) == {"took", "hits"}
+    assert set(result["hits"]) == {"total"}
+
+
+def test_filter_path_traverses_lists():
+    response = {"took": 1, "a": [{"b": 1, "c": 2}, {"b": 3}]}
+    expected = {"took": 1, "a": [{"b": 1}, {"b": 3}]}
+    assert mock_es.filter_path(response, "a.b") == expected
+
+
+def test_msearch_applies_filter_path_to_the_whole_response(es_host):
+    body = loadgen.to_msearch_body(INDEX, [dsls.get_current_dsl("a")])
+    response = loadgen.get_session().get(
+        f"{es_host}/{INDEX}/_msearch",
+        data=body,
+        params={"filter_path": "took,hits.hits._id"},
+        headers=loadgen.NDJSON_HEADERS,
+    )
+    assert response.json().keys() == {"took"}
@@ -0,0 +1,67 @@
+import math
+
+import pandas as pd
+
+from latency_stats import LatencySamples
+from result_store import ResultStore, wide_table
+
+
+def _stats(tooks):
+    stats = LatencySamples()
+    for i, took in enumerate(tooks):
+        stats.add(took, took + 1.0, started_at=1000.0 + i)
+    return stats
+
+
+def test_round_trip(tmp_path):
+    store = ResultStore(str(tmp_path / "store"))
+    assert store.is_empty()
+    store.write("a", "alpha", "asis", _stats([1, 2, 3]), cost_body_bytes=10)
+    failed = _stats([4])
+    failed.errors = 1
+    store.write("b", "alpha", "asis", failed)
+
+    cells = store.cells()
+    assert sorted(cells["keyword"]) == ["a", "b"]
+    assert store.done() == {("a", "alpha", "asis")}
+    row = cells.set_index("keyword").loc["a"]
+    assert row["took_count"] == 3
+    assert row["took_p50"] == 2
+    assert row["cost_body_bytes"] == 10
+
+    samples = store.samples(columns=["keyword", "took"])
+    assert sorted(samples.loc[samples["keyword"] == "a", "took"]) == [1, 2, 3]
+
+    # A retried cell replaces the failed one, samples included.
+    store.write("b", "alpha", "asis", _stats([5, 6]))
+    assert store.done() == {("a", "alpha", "asis"), ("b", "alpha", "asis")}
+    samples = store.samples()
+    assert sorted(samples.loc[samples["keyword"] == "b", "took"]) == [5, 6]
+
+
+def test_side_tables(tmp_path):
+    store = ResultStore(str(tmp_path / "store"))
+    assert store.read("comparisons").empty
+    store.append("comparisons", [])
+    store.append("comparisons", [{"keyword": "a", "diff_median": 1.5}])
+    store.append("comparisons", [{"keyword": "b", "diff_median": -0.5}])
+    table = store.read("comparisons")
+    assert sorted(table["keyword"]) == ["a", "b"]
+
+
+def test_wide_table(tmp_path):
+    store = ResultStore(str(tmp_path / "store"))
+    store.write("a", "prod", "asis", _stats([1, 2, 3]))
+    store.write("a", "alpha", "asis", None)
+    wide = wide_table(store.cells(), ["prod_asis", "alpha_asis"], ["a", "c"])
+    assert list(wide.index) == ["a", "c"]
+    assert wide.loc["a", "prod_asis_took_count"] == 3
+    assert math.isnan(wide.loc["a", "alpha_asis_took_p50"])
+    assert wide.loc["c"].isna().all()
+
+
+def test_wide_table_without_cells():
+    wide = wide_table(pd.DataFrame(), ["prod_asis"], ["a"])
+    assert list(wide.index) == ["a"]
+    assert "prod_asis_took_trimmed_mean" in wide.columns
+    assert wide.isna().all().all()
@@ -0,0 +1,98 @@
+import threading
+import time
+
+import pytest
+
+from serving_cache import ResultCache, cache_key
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_cache_key_normalizes_query_and_weights():
+    a = cache_key("v", "  Nike  Shoes", {"b": 1, "a": 0.5})
+    b = cache_key("v", "nike shoes", {"a": 0.5, "b": 1})
+    assert a == b
+
+
+def test_cache_key_with_empty_categories():
+    # Categories come from the catalog and can be missing.
+    key = cache_key("v", "nike", {None: 1, "": 2, "a": 0.5})
+    assert key == cache_key("v", "nike", {"a": 0.5})
+
+
+def test_lru_eviction_under_memory_budget():
+    value = b"x" * 300
+    entry = ResultCache()._size(cache_key("v", "a"), value)
+    cache = ResultCache(max_bytes=3 * entry, ttl=60)
+    for query in ["a", "b", "c"]:
+        cache.get_or_compute(cache_key("v", query), lambda: value)
+    # Touching "a" makes "b" the least recently used entry.
+    cache.get_or_compute(cache_key("v", "a"), lambda: pytest.fail("recomputed"))
+    cache.get_or_compute(cache_key("v", "d"), lambda: value)
+    summary = cache.summary()
+    assert summary["evictions"] == 1
+    assert summary["bytes"] == 3 * entry
+    assert cache_key("v", "b") not in cache.entries
+    assert cache_key("v", "a") in cache.entries
+
+
+def test_entries_expire_after_ttl():
+    clock = Clock()
+    cache = ResultCache(ttl=10, clock=clock)
+    key = cache_key("v", "a")
+    assert cache.get_or_compute(key, lambda: b"1") == b"1"
+    clock.now = 9.9
+    assert cache.get_or_compute(key, lambda: b"2") == b"1"
+    clock.now = 10.0
+    assert cache.get_or_compute(key, lambda: b"3") == b"3"
+    summary = cache.summary()
+    assert summary["expirations"] == 1
+    assert summary["hits"] == 1
+    assert summary["misses"] == 2
+
+
+def test_concurrent_misses_are_coalesced():
+    cache = ResultCache()
+    key = cache_key("v", "a")
+    release = threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        release.wait(5)
+        return b"value"
+
+    results = []
+    def lookup():
+        results.append(cache.get_or_compute(key, compute))
+
+    threads = [threading.Thread(target=lookup) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    # Wait until the other three are blocked on the first caller.
+    while cache.summary()["coalesced"] < 3:
+        time.sleep(0.01)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert calls == [1]
+    assert results == [b"value"] * 4
+    assert cache.summary()["misses"] == 1
+
+
+def test_failures_are_shared_but_not_cached():
+    cache = ResultCache()
+    key = cache_key("v", "a")
+
+    def fail():
+        raise RuntimeError("cluster down")
+
+    with pytest.raises(RuntimeError, match="cluster down"):
+        cache.get_or_compute(key, fail)
+    assert cache.get_or_compute(key, lambda: b"ok") == b"ok"
@@ -0,0 +1,67 @@
+import json
+import os
+import stat
+
+import pandas as pd
+import pytest
+
+import workload_cache
+
+SQL = "SELECT keyword FROM category_weights"
+RUN_DATE = "2024-09-09"
+
+
+def _weights(*categories):
+    return json.dumps(
+        [
+            {"hoian_category_name": name, "is_boost": boost}
+            for name, boost in categories
+        ]
+    )
+
+
+def _snapshot(path):
+    # A pull cached before boosted_categories existed.
+    cache = workload_cache.WorkloadCache(str(path))
+    df = pd.DataFrame(
+        {
+            "queryText": ["a", "b"],
+            "qc": [10, 5],
+            "category_weights": [_weights(("x", True), ("y", False)), None],
+        }
+    )
+    cache.store(workload_cache.cache_key(SQL, RUN_DATE), df, SQL, RUN_DATE)
+    return path
+
+
+def _mtimes(path):
+    return {name: os.stat(path / name).st_mtime_ns for name in os.listdir(path)}
+
+
+def test_offline_load_leaves_the_snapshot_alone(tmp_path):
+    snapshot = _snapshot(tmp_path / "snap")
+    before = _mtimes(snapshot)
+    # Read-only, as a snapshot checked out with the results often is.
+    os.chmod(snapshot, stat.S_IRUSR | stat.S_IXUSR)
+    try:
+        cache = workload_cache.WorkloadCache(str(snapshot), offline=True)
+        df = workload_cache.load_category_workload(cache, SQL)
+    finally:
+        os.chmod(snapshot, stat.S_IRWXU)
+    assert df["hoian_category_name"].tolist() == [{"x": 1}, {}]
+    assert _mtimes(snapshot) == before
+
+
+def test_online_load_caches_the_parsed_categories(tmp_path):
+    snapshot = _snapshot(tmp_path / "snap")
+    cache = workload_cache.WorkloadCache(str(snapshot))
+    workload_cache.load_category_workload(cache, SQL, RUN_DATE)
+    stored = cache.read_gbq(SQL, RUN_DATE)
+    assert stored["boosted_categories"].map(list).tolist() == [["x"], []]
+
+
+def test_offline_miss_is_an_error(tmp_path):
+    snapshot = _snapshot(tmp_path / "snap")
+    cache = workload_cache.WorkloadCache(str(snapshot), offline=True)
+    with pytest.raises(FileNotFoundError):
+        cache.read_gbq("SELECT 1", RUN_DATE)
@@ -0,0 +1,256 @@
+import json
+import threading
+import time
+
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+# Installed hooks; loadgen emits every request event to each of them.
+HOOKS = []
+
+_local = threading.local()
+
+
+class Hooks:
+    # Override any subset. `request` is a dict with label, url, attempt and
+    # tid, shared by all events of one attempt; times are perf_counter().
+    # `error` fires once when a request ends without a 200, after
+    # `complete` if there was a response at all.
+
+    def before_send(self, request, at):
+        pass
+
+    def connect(self, request, start, end):
+        pass
+
+    def first_byte(self, request, at):
+        pass
+
+    def complete(self, request, at, sample):
+        pass
+
+    def retry(self, request, at, error):
+        pass
+
+    def error(self, request, at, error):
+        pass
+
+    def think(self, request, start, end):
+        pass
+
+
+def emit(event, request, *args):
+    if event == "before_send":
+        _local.request = request
+    for hook in HOOKS:
+        getattr(hook, event)(request, *args)
+
+
+class _TracedConnectionMixin:
+    # A new TCP (and TLS) connection is reported to the attempt that opened
+    # it; reused keep-alive connections emit nothing.
+
+    def connect(self):
+        start = time.perf_counter()
+        super().connect()
+        request = getattr(_local, "request", None)
+        if HOOKS and request is not None:
+            emit("connect", request, start, time.perf_counter())
+
+
+class _TracedHTTPConnection(_TracedConnectionMixin, HTTPConnection):
+    pass
+
+
+class _TracedHTTPSConnection(_TracedConnectionMixin, HTTPSConnection):
+    pass
+
+
+class _TracedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TracedHTTPConnection
+
+
+class _TracedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TracedHTTPSConnection
+
+
+class TracedAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _TracedHTTPConnectionPool,
+            "https": _TracedHTTPSConnectionPool,
+        }
+
+
+class Tracer(Hooks):
+    # Collects every event as Chrome trace events (chrome://tracing or
+    # ui.perfetto.dev): one row per worker thread, a span per attempt with
+    # connect, wait, transfer and decode nested in it, and the cluster's own
+    # `took` drawn as the tail of the wait. Think time and failed attempts
+    # are spans of their own so harness time is visible next to ES time.
+
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.wall_origin = time.time()
+        self.events = []
+        self.totals = {
+            "requests": 0,
+            "attempts": 0,
+            "retries": 0,
+            "errors": 0,
+            "took_ms": 0.0,
+            "wait_ms": 0.0,
+            "connect_ms": 0.0,
+            "connections": 0,
+            "transfer_ms": 0.0,
+            "decode_ms": 0.0,
+            "failed_attempt_ms": 0.0,
+            "think_ms": 0.0,
+        }
+        self.lock = threading.Lock()
+
+    def _us(self, at):
+        return (at - self.origin) * 1e6
+
+    def _span(self, name, request, start, end, **args):
+        event = {
+            "name": name,
+            "cat": "loadgen",
+            "ph": "X",
+            "ts": self._us(start),
+            "dur": max((end - start) * 1e6, 0),
+            "pid": 1,
+            "tid": request["tid"],
+        }
+        if args:
+            event["args"] = args
+        with self.lock:
+            self.events.append(event)
+
+    def _instant(self, name, request, at, **args):
+        with self.lock:
+            self.events.append(
+                {
+                    "name": name,
+                    "cat": "loadgen",
+                    "ph": "i",
+                    "s": "t",
+                    "ts": self._us(at),
+                    "pid": 1,
+                    "tid": request["tid"],
+                    "args": args,
+                }
+            )
+
+    def _add(self, **amounts):
+        with self.lock:
+            for name, amount in amounts.items():
+                self.totals[name] += amount
+
+    def before_send(self, request, at):
+        request["sent_at"] = at
+        self._add(attempts=1, requests=int(request["attempt"] == 1))
+
+    def connect(self, request, start, end):
+        self._span("connect", request, start, end)
+        self._add(connections=1, connect_ms=(end - start) * 1000)
+
+    def first_byte(self, request, at):
+        request["first_byte_at"] = at
+
+    def complete(self, request, at, sample):
+        sent_at, first_byte_at = request["sent_at"], request["first_byte_at"]
+        label = request["label"]
+        self._span(
+            label or "request",
+            request,
+            sent_at,
+            at + (sample["decode_ms"] or 0) / 1000,
+            status=sample["status"],
+            took=sample["took"],
+            attempt=request["attempt"],
+            response_bytes=sample["response_bytes"],
+        )
+        self._span("wait", request, sent_at, first_byte_at)
+        took = sample["took"] or 0
+        if took:
+            took_start = max(first_byte_at - took / 1000, sent_at)
+            self._span("took", request, took_start, first_byte_at)
+        self._span("transfer", request, first_byte_at, at)
+        if sample["decode_ms"] is not None:
+            self._span("decode", request, at, at + sample["decode_ms"] / 1000)
+        self._add(
+            took_ms=took,
+            wait_ms=(first_byte_at - sent_at) * 1000 - took,
+            transfer_ms=(at - first_byte_at) * 1000,
+            decode_ms=sample["decode_ms"] or 0,
+        )
+
+    def retry(self, request, at, error):
+        self._span("failed attempt", request, request["sent_at"], at, error=error)
+        self._add(retries=1, failed_attempt_ms=(at - request["sent_at"]) * 1000)
+
+    def error(self, request, at, error):
+        if "first_byte_at" not in request:
+            self._span("failed attempt", request, request["sent_at"], at)
+            self._add(failed_attempt_ms=(at - request["sent_at"]) * 1000)
+        self._instant("error", request, at, error=error)
+        self._add(errors=1)
+
+    def think(self, request, start, end):
+        self._span("think", request, start, end)
+        self._add(think_ms=(end - start) * 1000)
+
+    def breakdown(self):
+        # Where the workers' time went. `wait_ms` is time to first byte
+        # minus `took`: network, the cluster's queueing and coordination
+        # outside `took`, and client overhead.
+        with self.lock:
+            row = dict(self.totals)
+        row["elapsed_s"] = time.perf_counter() - self.origin
+        return row
+
+    def export(self, path):
+        with self.lock:
+            events = sorted(self.events, key=lambda e: e["ts"])
+        trace = {
+            "traceEvents": events,
+            "displayTimeUnit": "ms",
+            "otherData": {"started_at": self.wall_origin, **self.breakdown()},
+        }
+        with open(path, "w") as f:
+            json.dump(trace, f)
+
+
+def add(hook):
+    HOOKS.append(hook)
+    return hook
+
+
+def remove(hook):
+    HOOKS.remove(hook)
+
+
+def add_arguments(parser):
+    parser.add_argument(
+        "--trace",
+        default=None,
+        metavar="PATH",
+        help="write a Chrome trace (JSON) of every request to PATH",
+    )
+
+
+def from_args(args):
+    if not args.trace:
+        return None
+    return add(Tracer())
+
+
+def finish(tracer, path):
+    if tracer is None:
+        return
+    remove(tracer)
+    tracer.export(path)
+    print(json.dumps(tracer.breakdown(), indent=2))
@@ -0,0 +1,137 @@
+import datetime
+import hashlib
+import json
+import os
+import time
+
+import pandas as pd
+
+CACHE_DIR = ".workload_cache"
+DEFAULT_TTL = datetime.timedelta(hours=24)
+
+
+def cache_key(sql, run_date):
+    return hashlib.sha256(f"{run_date}\n{sql}".encode()).hexdigest()[:16]
+
+
+class WorkloadCache:
+    # Local Parquet copies of BigQuery pulls, keyed by the SQL text and the
+    # run date the SQL is relative to (it uses CURRENT_DATE()). With
+    # `offline=True` the directory is treated as a pinned snapshot: entries
+    # never expire and a miss is an error instead of a BigQuery query.
+
+    def __init__(self, cache_dir=CACHE_DIR, ttl=DEFAULT_TTL, offline=False):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.offline = offline
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _paths(self, key):
+        base = os.path.join(self.cache_dir, key)
+        return f"{base}.parquet", f"{base}.json"
+
+    def _fresh(self, meta_path):
+        if not os.path.exists(meta_path):
+            return False
+        if self.offline:
+            return True
+        with open(meta_path) as f:
+            fetched_at = json.load(f)["fetched_at"]
+        return time.time() - fetched_at < self.ttl.total_seconds()
+
+    def resolve_run_date(self, run_date=None):
+        # The run date only names cache entries; the SQL itself is always
+        # relative to CURRENT_DATE(). Offline, today's date would miss every
+        # entry, so the snapshot's own date is the default.
+        if run_date:
+            return run_date
+        if not self.offline:
+            return datetime.date.today().isoformat()
+        run_dates = set()
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(".json"):
+                with open(os.path.join(self.cache_dir, name)) as f:
+                    run_dates.add(json.load(f)["run_date"])
+        if len(run_dates) != 1:
+            raise ValueError(
+                f"snapshot {self.cache_dir} has run dates {sorted(run_dates)};"
+                " pass --run-date"
+            )
+        return run_dates.pop()
+
+    def store(self, key, df, sql, run_date):
+        data_path, meta_path = self._paths(key)
+        df.to_parquet(data_path + ".tmp", index=False)
+        os.replace(data_path + ".tmp", data_path)
+        meta = {"sql": sql, "run_date": run_date, "fetched_at": time.time()}
+        with open(meta_path, "w") as f:
+            json.dump(meta, f, indent=2)
+
+    def read_gbq(self, sql, run_date=None, **kwargs):
+        run_date = self.resolve_run_date(run_date)
+        key = cache_key(sql, run_date)
+        data_path, meta_path = self._paths(key)
+        if self._fresh(meta_path):
+            return pd.read_parquet(data_path)
+        if self.offline:
+            raise FileNotFoundError(
+                f"{key} ({run_date}) is not in snapshot {self.cache_dir}"
+            )
+        import pandas_gbq
+
+        kwargs.setdefault("project_id", "karrotmarket")
+        df = pandas_gbq.read_gbq(sql, **kwargs)
+        self.store(key, df, sql, run_date)
+        return df
+
+
+def boosted_categories(category_weights):
+    # Keywords without weights come back as None from BigQuery and NaN once
+    # they have been through Parquet.
+    if not isinstance(category_weights, str) or not category_weights:
+        return []
+    weights = json.loads(category_weights)
+    return [w["hoian_category_name"] for w in weights if w["is_boost"]]
+
+
+def load_category_workload(cache, sql, run_date=None):
+    # The boosted category names are parsed once, right after the frame is
+    # fetched, and cached with it so later runs only rebuild the dicts. An
+    # offline snapshot is never written to, so there they are parsed on
+    # every load.
+    run_date = cache.resolve_run_date(run_date)
+    df = cache.read_gbq(sql, run_date, dialect="standard", use_bqstorage_api=True)
+    if "boosted_categories" not in df:
+        df["boosted_categories"] = [
+            boosted_categories(cw) for cw in df["category_weights"]
+        ]
+        if not cache.offline:
+            cache.store(cache_key(sql, run_date), df, sql, run_date)
+    df["hoian_category_name"] = [
+        dict.fromkeys(names, 1) for names in df["boosted_categories"]
+    ]
+    return df
+
+
+def add_arguments(parser):
+    parser.add_argument("--cache-dir", default=CACHE_DIR)
+    parser.add_argument("--cache-ttl-hours", type=float, default=24)
+    parser.add_argument(
+        "--offline",
+        action="store_true",
+        help="replay --cache-dir as a pinned snapshot without touching BigQuery",
+    )
+    parser.add_argument(
+        "--run-date",
+        default=None,
+        help="YYYY-MM-DD; only names cache entries, the SQL always runs against"
+        " CURRENT_DATE() (default: today, or the snapshot's date with --offline)",
+    )
+
+
+def from_args(args):
+    return WorkloadCache(
+        args.cache_dir,
+        datetime.timedelta(hours=args.cache_ttl_hours),
+        offline=args.offline,
+    )
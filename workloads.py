@@ -0,0 +1,104 @@
+# The BigQuery pulls behind the workloads, shared by the compare scripts and
+# the tools that replay the same keywords. The SQL text is part of the
+# workload cache key, so edits here invalidate cached pulls.
+
+CATEGORY_SQL = """
+WITH
+  TARGET_TABLE AS (
+  SELECT
+    kw_cat.keyword,
+    kw_cat.run_date,
+    cw.category_id,
+    cw.category_name,
+    cat.uid AS hoian_category_name,
+    cw.predict,
+    cw.is_boost,
+    cw.probability,
+    cw.score
+  FROM
+    `karrotmarket.team_search_data.fleamarket_category_weights` AS kw_cat,
+    UNNEST(kw_cat.category_weights) AS cw
+  LEFT JOIN
+    `karrotmarket.db_hoian_kr.categories` AS cat
+  ON
+    cw.category_id = cat.id
+  WHERE
+    kw_cat.run_date = DATE_SUB(CURRENT_DATE(), INTERVAL 2 DAY) ),
+  CATEGORY_WEIGHT AS (
+  SELECT
+    keyword,
+    TIMESTAMP(run_date) AS run_date,
+    TO_JSON_STRING( ARRAY_AGG(STRUCT( category_id,
+          category_name,
+          hoian_category_name,
+          predict,
+          is_boost,
+          probability,
+          score )) ) AS category_weights
+  FROM
+    TARGET_TABLE
+  GROUP BY
+    keyword,
+    run_date ),
+  QC AS (
+  SELECT
+    queryText,
+    qc,
+    qc / total_qc AS qc_percentage,
+    SUM(qc / total_qc) OVER (ORDER BY qc DESC) AS cumulative_qc_percentage
+  FROM (
+    SELECT
+      queryText,
+      COUNT(*) AS qc,
+      SUM(COUNT(*)) OVER () AS total_qc
+    FROM
+      `karrotmarket.kotisaari_data.stream_mediation-request_v1`
+    WHERE
+      TIMESTAMP_TRUNC(requestedAt, DAY) BETWEEN TIMESTAMP("2024-09-01")
+      AND TIMESTAMP("2024-09-07")
+      AND queryText IS NOT NULL
+    GROUP BY
+      queryText )
+  ORDER BY
+    qc DESC
+  LIMIT
+    100 )
+SELECT
+  QC.queryText,
+  QC.qc,
+  QC.qc_percentage,
+  cw.category_weights
+FROM
+  QC
+LEFT JOIN
+  CATEGORY_WEIGHT cw
+ON
+  TRIM(QC.queryText) = cw.keyword
+"""
+
+TOP_QUERIES_SQL = """
+SELECT
+    queryText,
+    qc,
+    qc / total_qc AS qc_percentage,
+    SUM(qc / total_qc) OVER (ORDER BY qc DESC) AS cumulative_qc_percentage
+FROM (
+    SELECT
+        queryText,
+        COUNT(*) AS qc,
+        SUM(COUNT(*)) OVER () AS total_qc
+    FROM
+        `karrotmarket.kotisaari_data.stream_mediation-request_v1`
+    WHERE
+        TIMESTAMP_TRUNC(requestedAt, DAY) BETWEEN TIMESTAMP("2024-09-01")
+        AND TIMESTAMP("2024-09-07")
+        AND queryText IS NOT NULL
+    GROUP BY
+        queryText )
+ORDER BY
+    qc DESC
+LIMIT
+    100
+"""
+SERVING_CATALOG_SQL = """SELECT DISTINCT catalog_id FROM `karrotmarket.team_search_indexer_kr.ads_catalog_product_serving_v2` WHERE deleted_at is null"""
+CATALOG_SQL = """SELECT DISTINCT catalog_id FROM `karrotmarket.team_search_indexer_kr.ads_catalog_product_v2` WHERE deleted_at is null"""